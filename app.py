@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import json
 from functools import partial
 
+import pandas as pd
 import streamlit as st
 
 from src.db import get_connection
 from src.metrics import (
     QueryExecutionError,
     get_actividad_emision_comandas,
+    get_basket_analysis,
     get_detalle,
     get_estado_operativo,
     get_ids_comandas_anuladas,
@@ -15,28 +18,82 @@ from src.metrics import (
     get_ids_comandas_pendientes,
     get_ids_comandas_sin_estado_impresion,
     get_kpis,
+    get_kpis_por_operacion,
+    get_kpis_recientes,
     get_impresion_snapshot,
     get_top_productos,
     get_ventas_por_categoria,
     get_ventas_por_hora,
     get_ventas_por_usuario,
+    get_ventas_timeline,
     get_wac_cogs_summary,
     get_wac_cogs_detalle,
     get_consumo_valorizado,
     get_consumo_sin_valorar,
     get_cogs_por_comanda,
 )
-from src.query_store import Q_HEALTHCHECK, Q_LIST_OPERATIONS, Filters, fetch_dataframe
+from src.cancellation import current_session_id, get_cancelled, rerun_detection_issue
+from src.cost_guard import check_cost, get_snapshot_job, start_snapshot_job
+from src.deadlines import SectionTimeout, default_deadline_ms
+from src.downsample import downsample_lttb
+from src.dtypes import get_memory_reports
+from src.index_advisor import run_advisor
+from src.lifecycle import ensure_lifecycle_watcher
+from src.op_index import get_op_prefilter
+from src.perf import (
+    RECORDS_MAX,
+    begin_rerun,
+    clear_records,
+    cprofile_bytes,
+    cprofile_top,
+    end_rerun,
+    enter_section,
+    get_query_budget,
+    get_records,
+    profile_frame,
+    profile_json,
+    profile_summary,
+    query_summary,
+    rerun_summary,
+    set_python_timing,
+    start_cprofile,
+)
+from src.query_store import Q_HEALTHCHECK, TIMELINE_BUCKET_MINUTES, Filters, fetch_dataframe
+from src.slow_queries import (
+    clear_slow_log,
+    get_threshold_ms,
+    plan_warnings,
+    read_slow_log,
+    set_threshold_ms,
+    worst_offenders,
+)
+from src.snapshots import ensure_snapshots
 from src.startup import determine_startup_context
-from src.ui.components import bar_chart, line_chart, pie_chart, render_chart_section
+from src.ui.components import (
+    bar_chart,
+    line_chart,
+    pie_chart,
+    load_section,
+    render_chart_section,
+    render_section_timeout,
+    metric_trend,
+    render_trend_table,
+    waterfall_chart,
+)
+from src.ui.exports import render_export_buttons
 from src.ui.formatting import (
+    CONSUMO_SIN_VALORAR_COLUMN_ORDER,
+    CONSUMO_VALORIZADO_COLUMN_ORDER,
+    column_order_for,
     format_bs,
-    format_detalle_df,
     format_int,
-    format_margen_comanda_df,
-    format_consumo_valorizado_df,
-    format_consumo_sin_valorar_df,
-    format_cogs_comanda_df,
+    style_basket_df,
+    style_cogs_comanda_df,
+    style_consumo_sin_valorar_df,
+    style_consumo_valorizado_df,
+    style_detalle_df,
+    style_margen_comanda_df,
+    style_numeric_columns,
 )
 from src.ui.layout import render_page_header, render_sidebar_connection_section, render_filter_context_badge
 
@@ -75,6 +132,8 @@ def _inject_metric_border_styles() -> None:
         unsafe_allow_html=True,
     )
 
+rerun_id = begin_rerun()
+
 render_page_header()
 probar, connection_name = render_sidebar_connection_section()
 
@@ -84,6 +143,67 @@ _inject_metric_border_styles()
 with st.sidebar:
     st.header("Debug")
     debug_sql = st.checkbox("Mostrar SQL/params en errores", value=False)
+    mostrar_memoria = st.checkbox(
+        "Mostrar memoria por consulta",
+        value=False,
+        help="Tabla al final de la página con la memoria de cada resultado antes/después de normalizar tipos.",
+    )
+    mostrar_rendimiento = st.checkbox(
+        "Mostrar rendimiento",
+        value=False,
+        help=(
+            "Panel al final de la página con tiempos por consulta (p50/p95, base vs armado del DataFrame), "
+            "filas, bytes, aciertos del cache local y consultas por rerun."
+        ),
+    )
+    mostrar_lentas = st.checkbox(
+        "Mostrar consultas lentas",
+        value=False,
+        help=(
+            "Panel al final de la página con las consultas que superaron el umbral (log local con SQL, params "
+            "y EXPLAIN), agrupadas por builder."
+        ),
+    )
+    perfil_rerun = st.checkbox(
+        "Perfil por rerun",
+        value=False,
+        help=(
+            "Cascada en el sidebar con el tiempo de cada sección del rerun (consultas, tiempo en base, "
+            "Plotly y formatters), presupuesto de consultas y descarga del perfil (JSON / cProfile)."
+        ),
+    )
+    set_python_timing(perfil_rerun)
+    presupuesto_consultas = get_query_budget()
+    if perfil_rerun:
+        presupuesto_consultas = int(
+            st.number_input(
+                "Máx. consultas por rerun",
+                min_value=0,
+                value=get_query_budget(),
+                step=1,
+                help="Avisa si un rerun hace más idas a la base que este valor (0 = sin límite). Por defecto DASHBACK_QUERY_BUDGET.",
+            )
+        )
+    plazo_seccion_s = st.number_input(
+        "Plazo por sección (s)",
+        min_value=0,
+        value=int(round(default_deadline_ms() / 1000)),
+        step=5,
+        help=(
+            "Si una sección no carga en este tiempo se muestra 'tardó demasiado — reintentar' y la página "
+            "sigue con el resto; la consulta se corta en la base al triple del plazo (0 = sin plazo). "
+            "Por defecto DASHBACK_SECTION_DEADLINE_MS."
+        ),
+    )
+    incluir_asesor_indices = st.checkbox(
+        "Asesor de índices al probar conexión",
+        value=False,
+        help=(
+            "Con 'Probar conexión' corre EXPLAIN sobre todas las consultas del dashboard (última operativa "
+            "cerrada), marca full scans / temporary / filesort y sugiere índices. En MySQL 5.6 EXPLAIN "
+            "materializa subconsultas: conviene usarlo fuera de horario."
+        ),
+    )
     ventas_use_impresion_log = st.checkbox(
         "Ventas: usar log de impresión",
         value=False,
@@ -125,6 +245,14 @@ with st.sidebar:
         help="Agrega línea horizontal con el promedio de ventas por hora",
     )
 
+    granularidad_timeline = st.selectbox(
+        "Granularidad línea de tiempo",
+        list(TIMELINE_BUCKET_MINUTES),
+        index=1,
+        format_func=lambda m: f"{m} min",
+        help="Tamaño de cada tramo en la línea de tiempo de ventas (todo el rango, sin mezclar noches)",
+    )
+
 
 def _maybe_render_sql_debug(exc: Exception) -> None:
     if not debug_sql:
@@ -145,8 +273,26 @@ startup = None
 filters = Filters()
 mode_for_metrics = "none"
 
+# cProfile del resto del script (desde acá hasta el final del rerun).
+profiler = start_cprofile() if perfil_rerun else None
+
+
+def _close_rerun_profile() -> None:
+    """Cierra el perfil del rerun y cProfile antes de cortar el script (`st.stop` / `st.rerun`)."""
+
+    end_rerun()
+    if profiler is not None:
+        profiler.disable()
+
+
+enter_section("Arranque")
 try:
     conn = get_connection(connection_name)
+    try:
+        # Procesa cierres de operativas en segundo plano (snapshot + rollups + caches).
+        ensure_lifecycle_watcher(conn)
+    except Exception:
+        pass
     startup = determine_startup_context(conn)
 
     if startup.mode == "realtime":
@@ -163,10 +309,8 @@ try:
     st.caption(f"Modo: {startup.mode} · {op_txt} · Vista: {startup.view_name}")
 
     if startup.mode == "historical":
-        ops_df = fetch_dataframe(conn, Q_LIST_OPERATIONS)
-        ops: list[dict] = []
-        if ops_df is not None and not ops_df.empty:
-            ops = ops_df.to_dict(orient="records")
+        # El listado llega con el contexto de arranque (misma consulta, sin round trip extra).
+        ops: list[dict] = [dict(o) for o in startup.operations]
 
         with st.sidebar:
             st.header("Histórico")
@@ -203,7 +347,11 @@ try:
                 dt_ini = f"{dt_ini_date} 00:00:00"
                 dt_fin = f"{dt_fin_date} 23:59:59"
 
-                filters = Filters(dt_ini=dt_ini, dt_fin=dt_fin)
+                filters = Filters(
+                    dt_ini=dt_ini,
+                    dt_fin=dt_fin,
+                    op_prefilter=get_op_prefilter(conn, dt_ini, dt_fin),
+                )
                 mode_for_metrics = "dates"
             else:
                 if not ops:
@@ -244,6 +392,24 @@ try:
 
                     filters = Filters(op_ini=op_ini, op_fin=op_fin)
                     mode_for_metrics = "ops"
+
+                    if st.button(
+                        "Generar snapshots locales",
+                        help=(
+                            "Guarda en disco (Arrow) las filas de las operativas CERRADAS del rango. "
+                            "Luego KPIs, estado operativo, actividad y gráficos del rango se calculan "
+                            "desde esos archivos (memory-mapped) sin consultar comandas_v6_todas."
+                        ),
+                    ):
+                        with st.spinner("Generando snapshots..."):
+                            coverage = ensure_snapshots(conn, op_ini, op_fin)
+                        if coverage.covered:
+                            st.success(f"Snapshots OK: {len(coverage.con_snapshot)} operativas.")
+                        else:
+                            st.info(
+                                f"Snapshots: {len(coverage.con_snapshot)}/{len(coverage.operaciones)} operativas. "
+                                "Las operativas no cerradas (23) se siguen consultando en la base."
+                            )
     else:
         if startup.operacion_id is not None:
             filters = Filters(op_ini=startup.operacion_id, op_fin=startup.operacion_id)
@@ -259,6 +425,7 @@ except Exception as exc:
 
 
 if probar:
+    enter_section("Probar conexión")
     try:
         if conn is None:
             conn = get_connection(connection_name)
@@ -295,14 +462,109 @@ if probar:
     except Exception as exc:
         st.error(f"Error conectando a MySQL: {exc}")
 
+    if incluir_asesor_indices and conn is not None:
+        with st.expander("Asesor de índices (EXPLAIN)", expanded=True):
+            try:
+                with st.spinner("Corriendo EXPLAIN sobre las consultas del dashboard..."):
+                    advisor = run_advisor(conn)
+            except Exception as exc:
+                st.error(f"No se pudo correr el asesor de índices: {exc}")
+            else:
+                if advisor.recomendaciones.empty:
+                    st.success("Los índices que usan las consultas del dashboard existen.")
+                else:
+                    st.warning(f"{len(advisor.recomendaciones)} índice(s) sugerido(s).")
+                    st.dataframe(advisor.recomendaciones, width="stretch", hide_index=True)
+                    st.code("\n".join(advisor.recomendaciones["ddl"]), language="sql")
+                    st.caption(
+                        "Reducción estimada: filas examinadas hoy (EXPLAIN) vs. filas de la tabla / valores "
+                        "distintos de la primera columna (TABLE_ROWS, aproximado en InnoDB)."
+                    )
+                alertas = advisor.planes[advisor.planes["alertas"] != ""]
+                st.markdown(f"**Planes con alertas:** {len(alertas)} de {len(advisor.planes)} filas de plan")
+                st.dataframe(alertas, width="stretch", hide_index=True)
+                st.markdown("**Índices esperados vs. information_schema.STATISTICS**")
+                st.dataframe(advisor.indices, width="stretch", hide_index=True)
+                if advisor.errores:
+                    st.caption(
+                        "EXPLAIN con error: " + "; ".join(f"{b} [{m}]: {e}" for b, m, e in advisor.errores)
+                    )
+
+# Control de costo: un rango amplio del histórico no consulta la base sin confirmación.
+if conn is not None and startup is not None and startup.mode == "historical":
+    enter_section("Control de costo")
+    costo = check_cost(conn, filters, mode_for_metrics, connection_name=connection_name)
+    confirmados: set[str] = st.session_state.setdefault("costo_confirmados", set())
+    if costo.accion == "confirmar" and costo.clave not in confirmados:
+        estimacion = costo.estimacion
+        st.divider()
+        st.warning(
+            f"⚠️ Rango amplio: ~{format_int(estimacion.comandas)} comandas en "
+            f"{len(estimacion.operaciones)} operativas (límite {format_int(costo.limite)}"
+            + (" en horario de servicio" if costo.en_servicio else "")
+            + "). Cada sección del dashboard recorrería ese rango en la base: no se consultó todavía."
+        )
+        if estimacion.estimadas:
+            st.caption(
+                f"{estimacion.estimadas} operativa(s) sin conteo en el índice local se estimaron con "
+                "la mediana de las demás."
+            )
+
+        col_confirmar, col_snapshots = st.columns(2)
+        with col_confirmar:
+            if st.button("Ejecutar igual", help="Consulta el rango completo en la base (solo esta selección)."):
+                confirmados.add(costo.clave)
+                _close_rerun_profile()
+                st.rerun()
+        with col_snapshots:
+            if mode_for_metrics == "ops" and estimacion.cerradas:
+                job = get_snapshot_job(conn, filters.op_ini, filters.op_fin)
+                if job is not None and not job.terminado:
+                    st.info(f"Generando snapshots en segundo plano: {job.hechas}/{job.total or '…'} operativas.")
+                    st.button("Ver progreso")
+                else:
+                    if job is not None and job.error:
+                        st.error(f"La generación de snapshots falló: {job.error}")
+                    if st.button(
+                        "Generar snapshots en segundo plano",
+                        help=(
+                            "Guarda las operativas cerradas del rango en disco, una por consulta. Al terminar, "
+                            "el rango se calcula desde los snapshots sin recorrer la base."
+                        ),
+                    ):
+                        start_snapshot_job(conn, filters.op_ini, filters.op_fin)
+                        _close_rerun_profile()
+                        st.rerun()
+            elif mode_for_metrics == "dates":
+                st.caption(
+                    "Para rangos largos conviene filtrar por Operativas: las cerradas con snapshot se "
+                    "calculan localmente sin consultar la base."
+                )
+        _close_rerun_profile()
+        st.stop()
+
 st.divider()
 
 st.subheader("KPIs")
+enter_section("KPIs")
 if conn is None or startup is None:
     st.info("Conecta a la base de datos para ver KPIs.")
 else:
     try:
-        kpis = get_kpis(conn, startup.view_name, filters, mode_for_metrics)
+        kpis = load_section(
+            "KPIs",
+            partial(get_kpis, conn, startup.view_name, filters, mode_for_metrics),
+            deadline_ms=plazo_seccion_s * 1000,
+            realtime=startup.mode == "realtime",
+        )
+
+        # Serie por operativa (rollups + KPIs ya calculados): sparklines y deltas sin re-consultar.
+        try:
+            kpis_recientes = get_kpis_recientes(conn, filters, mode_for_metrics, kpis)
+        except Exception as exc:
+            kpis_recientes = None
+            st.caption(f"Sin tendencia por operativa: {exc}")
+        log_suffix = "_impreso_log" if ventas_use_impresion_log else ""
 
         st.markdown('<div class="metric-scope metric-kpis">', unsafe_allow_html=True)
         c1, c2, c3, c4 = st.columns(4)
@@ -343,6 +605,7 @@ else:
             format_bs(total_vendido),
             help=ventas_help,
             border=True,
+            **metric_trend(kpis_recientes, f"total_vendido{log_suffix}", money=True),
         )
         c2.metric(
             "Comandas",
@@ -352,6 +615,7 @@ else:
                 "cantidad de comandas distintas (COUNT DISTINCT id_comanda)."
             ),
             border=True,
+            **metric_trend(kpis_recientes, f"total_comandas{log_suffix}"),
         )
         c3.metric(
             "Ítems",
@@ -361,16 +625,26 @@ else:
                 "suma de cantidades (SUM cantidad)."
             ),
             border=True,
+            **metric_trend(kpis_recientes, f"items_vendidos{log_suffix}"),
         )
         c4.metric(
             "Ticket promedio",
             format_bs(ticket_promedio),
             help="Ventas finalizadas (según el modo actual): total vendido / comandas (redondeado).",
             border=True,
+            **metric_trend(kpis_recientes, f"ticket_promedio{log_suffix}", money=True),
         )
 
         st.markdown("</div>", unsafe_allow_html=True)
 
+        if kpis_recientes is not None and len(kpis_recientes) > 1:
+            ids_recientes = kpis_recientes["id_operacion"].astype(int)
+            st.caption(
+                f"Mini-gráficos: operativas #{ids_recientes.iloc[0]} → #{ids_recientes.iloc[-1]} "
+                f"({len(ids_recientes)}). Delta: última operativa vs la anterior"
+                + (" (la actual sigue en curso)." if startup.mode == "realtime" else ".")
+            )
+
         with st.expander("Diagnóstico de impresión (impacto en ventas)", expanded=False):
             st.caption(
                 "Compara la venta finalizada estricta (estado_impresion='IMPRESO' en la vista) vs una señal "
@@ -412,12 +686,12 @@ else:
             st.markdown("</div>", unsafe_allow_html=True)
 
         try:
-            act = get_actividad_emision_comandas(
-                conn,
-                startup.view_name,
-                filters,
-                mode_for_metrics,
-                recent_n=10,
+            enter_section("Actividad")
+            act = load_section(
+                "Actividad",
+                partial(get_actividad_emision_comandas, conn, startup.view_name, filters, mode_for_metrics, recent_n=10),
+                deadline_ms=plazo_seccion_s * 1000,
+                realtime=startup.mode == "realtime",
             )
 
             last_ts = act.get("last_ts")
@@ -474,17 +748,31 @@ else:
                 "Ritmo (operativa/rango)",
                 (f"{float(all_median):.1f} min" if all_median is not None else None),
                 help=(
-                    "Mediana de minutos entre comandas consecutivas en todo el contexto actual, sin filtrar por tipo/estado. "
+                    "Mediana (p50) de minutos entre comandas consecutivas de cada operativa en el contexto actual, "
+                    "sin filtrar por tipo/estado. Se calcula con un sketch incremental (error relativo ≤ 1%). "
                     + (f"Intervalos usados: {int(all_intervals or 0)}.")
                 ),
                 border=True,
             )
 
+            p90 = act.get("all_p90_min")
+            p99 = act.get("all_p99_min")
+            rate = act.get("rate_per_hour")
+            if all_median is not None:
+                st.caption(
+                    "Minutos entre comandas (operativa/rango): "
+                    f"p50 {float(all_median):.1f} · p90 {float(p90 or 0):.1f} · p99 {float(p99 or 0):.1f}"
+                    + (f" · ritmo reciente (EWMA) ≈ {float(rate):.1f} comandas/h" if rate else "")
+                )
+
             st.markdown("</div>", unsafe_allow_html=True)
+        except SectionTimeout as exc:
+            render_section_timeout("Actividad", exc)
         except Exception as exc:
             st.warning(f"No se pudo calcular actividad: {exc}")
             _maybe_render_sql_debug(exc)
 
+        enter_section("Cortesías")
         st.markdown('<div class="metric-scope metric-kpis">', unsafe_allow_html=True)
         k1, k2, k3 = st.columns(3)
         k1.metric(
@@ -495,31 +783,45 @@ else:
                 "suma de cor_subtotal_anterior (si existe) o sub_total."
             ),
             border=True,
+            delta_color="inverse",
+            **metric_trend(kpis_recientes, "total_cortesia", money=True),
         )
         k2.metric(
             "Comandas cortesía",
             format_int(kpis["comandas_cortesia"]),
             help="Cortesías finalizadas (CORTESIA/PROCESADO/IMPRESO): cantidad de comandas distintas.",
             border=True,
+            delta_color="inverse",
+            **metric_trend(kpis_recientes, "comandas_cortesia"),
         )
         k3.metric(
             "Ítems cortesía",
             format_int(kpis["items_cortesia"]),
             help="Cortesías finalizadas (CORTESIA/PROCESADO/IMPRESO): suma de cantidad.",
             border=True,
+            delta_color="inverse",
+            **metric_trend(kpis_recientes, "items_cortesia"),
         )
 
         st.markdown("</div>", unsafe_allow_html=True)
+    except SectionTimeout as exc:
+        render_section_timeout("KPIs", exc)
     except Exception as exc:
         st.error(f"Error calculando KPIs: {exc}")
         _maybe_render_sql_debug(exc)
 
 st.subheader("Márgenes & Rentabilidad")
+enter_section("Márgenes & Rentabilidad")
 if conn is None or startup is None:
     st.info("Conecta a la base de datos para ver márgenes.")
 else:
     try:
-        wac_cogs = get_wac_cogs_summary(conn, "vw_margen_comanda", filters, mode_for_metrics)
+        wac_cogs = load_section(
+            "Márgenes & Rentabilidad",
+            partial(get_wac_cogs_summary, conn, "vw_margen_comanda", filters, mode_for_metrics),
+            deadline_ms=plazo_seccion_s * 1000,
+            realtime=startup.mode == "realtime",
+        )
 
         st.markdown('<div class="metric-scope metric-kpis">', unsafe_allow_html=True)
         m1, m2, m3, m4 = st.columns(4)
@@ -579,7 +881,7 @@ else:
                 key="pnl_detalle_load",
                 help=(
                     "Ejecuta la consulta sobre vw_margen_comanda para el contexto actual. "
-                    "Los montos se formatean como texto (orden lexicográfico)."
+                    "Los montos se muestran en Bs pero siguen siendo numéricos (el orden es numérico)."
                 ),
             )
             limit_pnl = st.number_input(
@@ -602,7 +904,7 @@ else:
                 if detalle_pnl is None or detalle_pnl.empty:
                     st.info("Sin datos para el contexto seleccionado.")
                 else:
-                    st.dataframe(format_margen_comanda_df(detalle_pnl), width="stretch")
+                    st.dataframe(style_margen_comanda_df(detalle_pnl), width="stretch")
 
         with st.expander("Consumo valorizado de insumos", expanded=False):
             st.caption(
@@ -639,7 +941,11 @@ else:
                 if consumo_val is None or consumo_val.empty:
                     st.info("Sin datos para el contexto seleccionado.")
                 else:
-                    st.dataframe(format_consumo_valorizado_df(consumo_val), width="stretch")
+                    st.dataframe(
+                        style_consumo_valorizado_df(consumo_val),
+                        width="stretch",
+                        column_order=column_order_for(consumo_val, CONSUMO_VALORIZADO_COLUMN_ORDER),
+                    )
 
         with st.expander("Consumo sin valorar (sanidad de cantidades)", expanded=False):
             st.caption(
@@ -677,7 +983,11 @@ else:
                 if consumo_sin_val is None or consumo_sin_val.empty:
                     st.info("Sin datos para el contexto seleccionado.")
                 else:
-                    st.dataframe(format_consumo_sin_valorar_df(consumo_sin_val), width="stretch")
+                    st.dataframe(
+                        style_consumo_sin_valorar_df(consumo_sin_val),
+                        width="stretch",
+                        column_order=column_order_for(consumo_sin_val, CONSUMO_SIN_VALORAR_COLUMN_ORDER),
+                    )
 
         with st.expander("COGS por comanda (sin ventas)", expanded=False):
             st.caption(
@@ -715,17 +1025,25 @@ else:
                 if cogs_df is None or cogs_df.empty:
                     st.info("Sin datos para el contexto seleccionado.")
                 else:
-                    st.dataframe(format_cogs_comanda_df(cogs_df), width="stretch")
+                    st.dataframe(style_cogs_comanda_df(cogs_df), width="stretch")
+    except SectionTimeout as exc:
+        render_section_timeout("Márgenes & Rentabilidad", exc)
     except Exception as exc:
         st.error(f"Error calculando P&L: {exc}")
         _maybe_render_sql_debug(exc)
 
 st.subheader("Estado operativo")
+enter_section("Estado operativo")
 if conn is None or startup is None:
     st.info("Conecta a la base de datos para ver estado operativo.")
 else:
     try:
-        estado = get_estado_operativo(conn, startup.view_name, filters, mode_for_metrics)
+        estado = load_section(
+            "Estado operativo",
+            partial(get_estado_operativo, conn, startup.view_name, filters, mode_for_metrics),
+            deadline_ms=plazo_seccion_s * 1000,
+            realtime=startup.mode == "realtime",
+        )
         st.markdown('<div class="metric-scope metric-estado-operativo">', unsafe_allow_html=True)
         e1, e2, e3, e4 = st.columns(4)
         e1.metric(
@@ -846,6 +1164,8 @@ else:
                     ids_all = sorted(set(ids_pend + ids_imp_pend + ids_sin_ei + ids_anul))
                     snap = get_impresion_snapshot(conn, startup.view_name, ids_all)
                     st.dataframe(snap, width="stretch")
+    except SectionTimeout as exc:
+        render_section_timeout("Estado operativo", exc)
     except Exception as exc:
         st.error(f"Error cargando estado operativo: {exc}")
         _maybe_render_sql_debug(exc)
@@ -883,6 +1203,7 @@ with g1:
         startup=startup,
         debug_fn=_maybe_render_sql_debug,
         check_realtime_empty=True,
+        deadline_ms=plazo_seccion_s * 1000,
     )
 
 with g2:
@@ -922,6 +1243,7 @@ with g2:
         conn=conn,
         startup=startup,
         debug_fn=_maybe_render_sql_debug,
+        deadline_ms=plazo_seccion_s * 1000,
     )
 
 g3, g4 = st.columns(2)
@@ -954,6 +1276,7 @@ with g3:
         conn=conn,
         startup=startup,
         debug_fn=_maybe_render_sql_debug,
+        deadline_ms=plazo_seccion_s * 1000,
     )
 
 with g4:
@@ -984,9 +1307,157 @@ with g4:
         conn=conn,
         startup=startup,
         debug_fn=_maybe_render_sql_debug,
+        deadline_ms=plazo_seccion_s * 1000,
     )
 
+render_chart_section(
+    title="Línea de tiempo de ventas",
+    caption=(
+        f"Ventas finalizadas por tramos de {granularidad_timeline} min en todo el rango "
+        + ("(con log de impresión). " if ventas_use_impresion_log else "(estricto por vista). ")
+        + "Series largas se reducen con LTTB antes de graficar; el CSV/Parquet trae todos los tramos."
+    ),
+    data_fn=partial(
+        get_ventas_timeline,
+        conn,
+        startup.view_name if startup else "",
+        filters,
+        mode_for_metrics,
+        bucket_minutes=int(granularidad_timeline),
+        use_impresion_log=ventas_use_impresion_log,
+    ),
+    chart_fn=lambda df: line_chart(
+        downsample_lttb(df, "momento", "total_vendido"),
+        x="momento",
+        y="total_vendido",
+        title=None,
+        money=True,
+        hover_data={"comandas": True, "items": True},
+        markers=False,
+    ),
+    conn=conn,
+    startup=startup,
+    debug_fn=_maybe_render_sql_debug,
+    check_realtime_empty=True,
+    deadline_ms=plazo_seccion_s * 1000,
+)
+
+st.subheader("Tendencia por operativa")
+enter_section("Tendencia por operativa")
+st.caption(
+    "KPIs, cortesías y P&L por operativa del contexto actual, en una consulta agrupada por id_operacion "
+    "(las operativas cerradas salen de rollups locales). Compara noches sin re-seleccionar cada operativa."
+)
+if conn is None or startup is None:
+    st.info("Conecta a la base de datos para ver la tendencia por operativa.")
+elif mode_for_metrics == "none" or startup.mode == "realtime":
+    st.info("Disponible en histórico (por operativas o por fechas).")
+elif mode_for_metrics == "ops" and filters.op_ini == filters.op_fin:
+    # Una sola operativa: no hay tendencia que mostrar, se evitan las consultas agrupadas.
+    st.info("Selecciona un rango con al menos 2 operativas para ver la tendencia.")
+else:
+    try:
+        serie_ops = load_section(
+            "Tendencia por operativa",
+            partial(get_kpis_por_operacion, conn, startup.view_name, filters, mode_for_metrics),
+            deadline_ms=plazo_seccion_s * 1000,
+        )
+        if serie_ops is None or len(serie_ops) < 2:
+            st.info("Selecciona un rango con al menos 2 operativas para ver la tendencia.")
+        else:
+            render_trend_table(serie_ops, use_impresion_log=ventas_use_impresion_log)
+            with st.expander(f"Ver valores por operativa ({len(serie_ops)})", expanded=False):
+                st.dataframe(
+                    style_numeric_columns(
+                        serie_ops,
+                        money_columns={
+                            "total_vendido": 2,
+                            "ticket_promedio": 2,
+                            "total_cortesia": 2,
+                            "total_ventas": 2,
+                            "total_cogs": 2,
+                            "total_margen": 2,
+                        },
+                    ),
+                    width="stretch",
+                    hide_index=True,
+                )
+                render_export_buttons(serie_ops, "tendencia_por_operativa")
+    except SectionTimeout as exc:
+        render_section_timeout("Tendencia por operativa", exc)
+    except Exception as exc:
+        st.error(f"Error cargando tendencia por operativa: {exc}")
+        _maybe_render_sql_debug(exc)
+
+st.subheader("Canasta de productos")
+enter_section("Canasta de productos")
+if conn is None or startup is None:
+    st.info("Conecta a la base de datos para ver la canasta de productos.")
+else:
+    with st.expander("Ver pares de productos pedidos juntos", expanded=False):
+        st.caption(
+            "Pares de productos presentes en la misma comanda (ventas finalizadas del contexto actual "
+            + ("con log de impresión). " if ventas_use_impresion_log else "estricto por vista). ")
+            + "Soporte: % de comandas con ambos. Confianza A→B: de las comandas con A, % que también tiene B. "
+            + "Lift > 1: se piden juntos más de lo esperado (candidatos a combo)."
+        )
+        b1, b2, b3 = st.columns([1, 1, 2])
+        min_comandas_par = b1.number_input(
+            "Mín. comandas por par",
+            min_value=1,
+            max_value=1000,
+            value=3,
+            step=1,
+            key="canasta_min_comandas",
+        )
+        limit_pares = b2.number_input(
+            "Pares a mostrar",
+            min_value=10,
+            max_value=500,
+            value=50,
+            step=10,
+            key="canasta_limit",
+        )
+        cargar_canasta = b3.checkbox(
+            "Calcular canasta",
+            value=False,
+            key="canasta_load",
+            help=(
+                "Lee (comanda, producto) del contexto y cuenta pares. En histórico por operativas, "
+                "las operativas cerradas se calculan una vez y quedan en cache local."
+            ),
+        )
+        try:
+            if cargar_canasta:
+                pares, comandas_analizadas = load_section(
+                    "Canasta de productos",
+                    partial(
+                        get_basket_analysis,
+                        conn,
+                        startup.view_name,
+                        filters,
+                        mode_for_metrics,
+                        min_comandas=int(min_comandas_par),
+                        limit=int(limit_pares),
+                        use_impresion_log=ventas_use_impresion_log,
+                    ),
+                    deadline_ms=plazo_seccion_s * 1000,
+                    realtime=startup.mode == "realtime",
+                )
+                if pares is None or pares.empty:
+                    st.info("Sin pares con ese mínimo de comandas en el rango seleccionado.")
+                else:
+                    st.caption(f"Comandas analizadas: {format_int(comandas_analizadas)}")
+                    st.dataframe(style_basket_df(pares), width="stretch", hide_index=True)
+                    render_export_buttons(pares, "canasta_productos")
+        except SectionTimeout as exc:
+            render_section_timeout("Canasta de productos", exc)
+        except Exception as exc:
+            st.error(f"Error cargando canasta de productos: {exc}")
+            _maybe_render_sql_debug(exc)
+
 st.subheader("Detalle")
+enter_section("Detalle")
 if conn is None or startup is None:
     st.info("Conecta a la base de datos para ver el detalle.")
 else:
@@ -1000,21 +1471,166 @@ else:
             key="detalle_load",
             help=(
                 "Ejecuta la consulta de detalle (hasta 500 filas, ordenadas por fecha_emision DESC). "
-                "Nota: en la tabla, montos pueden mostrarse como texto formateado (orden puede ser lexicográfico)."
+                "Los montos se muestran en Bs pero siguen siendo numéricos (el orden es numérico)."
             ),
         )
         try:
             if cargar_detalle:
-                detalle = get_detalle(conn, startup.view_name, filters, mode_for_metrics, limit=500)
+                detalle = load_section(
+                    "Detalle",
+                    partial(get_detalle, conn, startup.view_name, filters, mode_for_metrics, limit=500),
+                    deadline_ms=plazo_seccion_s * 1000,
+                    realtime=startup.mode == "realtime",
+                )
                 if detalle is None or detalle.empty:
                     st.info("Sin datos para el rango seleccionado.")
                 else:
-                    st.dataframe(format_detalle_df(detalle), width="stretch")
+                    st.dataframe(style_detalle_df(detalle), width="stretch")
+        except SectionTimeout as exc:
+            render_section_timeout("Detalle", exc)
         except Exception as exc:
             st.error(f"Error cargando detalle: {exc}")
             _maybe_render_sql_debug(exc)
 
+enter_section("Paneles de debug")
+if mostrar_memoria:
+    with st.expander("Memoria por consulta (tipos normalizados)", expanded=True):
+        st.caption(
+            "Cada resultado se normaliza al leerse: categorías para textos repetidos, ids int32, "
+            "montos float64 y fecha_emision datetime. Últimas 50 consultas (más reciente primero)."
+        )
+        st.dataframe(get_memory_reports(), width="stretch")
+
+if mostrar_rendimiento:
+    with st.expander("Rendimiento (consultas)", expanded=True):
+        st.caption(
+            "Cada consulta se identifica por su builder (`q_*` / `Q_*`). Tiempo base = execute en MySQL; "
+            "armado = fetch + DataFrame + normalización de tipos. Aciertos de cache = lecturas del cache "
+            f"local (sin SQL). Registro en memoria de las últimas {RECORDS_MAX} ejecuciones."
+        )
+        actual = get_records(rerun=rerun_id)
+        consultas_rerun = int((actual["cache"] == "miss").sum()) if not actual.empty else 0
+        r1, r2, r3 = st.columns(3)
+        r1.metric("Consultas (este rerun)", format_int(consultas_rerun), border=True)
+        r2.metric(
+            "Tiempo en base (este rerun)",
+            f"{float(actual['db_ms'].sum()) if not actual.empty else 0.0:.0f} ms",
+            border=True,
+        )
+        r3.metric(
+            "Aciertos cache (este rerun)",
+            format_int(int((actual["cache"] == "hit").sum()) if not actual.empty else 0),
+            border=True,
+        )
+        st.caption("Por consulta (p50/p95 en ms)")
+        st.dataframe(query_summary(), width="stretch", hide_index=True)
+        st.caption("Por rerun (más reciente primero)")
+        st.dataframe(rerun_summary(), width="stretch", hide_index=True)
+        if not actual.empty:
+            with st.expander("Consultas de este rerun", expanded=False):
+                st.dataframe(actual, width="stretch", hide_index=True)
+        canceladas = get_cancelled(current_session_id())
+        if not canceladas.empty:
+            st.caption(
+                f"Consultas canceladas en la base con KILL QUERY (esta sesión): {len(canceladas)}. "
+                "Motivo 'rerun': se cambió un filtro mientras la consulta anterior seguía corriendo; "
+                "'plazo': la sección superó el triple de su plazo."
+            )
+            st.dataframe(canceladas.drop(columns=["session_id"]), width="stretch", hide_index=True)
+        deteccion = rerun_detection_issue()
+        if deteccion:
+            st.caption(
+                f"⚠️ Cancelación por rerun desactivada ({deteccion}). Los plazos por sección siguen "
+                "cortando consultas; revisa la versión de Streamlit fijada en requirements.txt."
+            )
+        if st.button("Reiniciar métricas de rendimiento"):
+            clear_records()
+
+if mostrar_lentas:
+    with st.expander("Consultas lentas (EXPLAIN)", expanded=True):
+        if conn is None:
+            st.info("Conecta a la base de datos para ver el log de consultas lentas.")
+        else:
+            umbral = st.number_input(
+                "Umbral (ms)",
+                min_value=0,
+                value=int(get_threshold_ms()),
+                step=250,
+                help=(
+                    "Consultas más lentas que este valor se guardan con su EXPLAIN en "
+                    "`.cache/<conexión>/slow_queries/`. Aplica a todo el proceso (por defecto DASHBACK_SLOW_QUERY_MS). "
+                    "En Producción se guardan sin EXPLAIN (repetiría el recorrido de la vista); "
+                    "DASHBACK_SLOW_QUERY_EXPLAIN=1 lo activa."
+                ),
+            )
+            if float(umbral) != get_threshold_ms():
+                set_threshold_ms(float(umbral))
+            log_lentas = read_slow_log(conn)
+            if log_lentas.empty:
+                st.info("Sin consultas lentas registradas.")
+            else:
+                st.caption("Peores consultas por builder (ordenadas por tiempo acumulado)")
+                st.dataframe(worst_offenders(log_lentas), width="stretch", hide_index=True)
+                etiquetas = [
+                    f"{row.registrado_en:%Y-%m-%d %H:%M:%S} · {row.consulta} · {row.total_ms:,.0f} ms"
+                    for row in log_lentas.itertuples()
+                ]
+                elegida = st.selectbox("Entrada", range(len(etiquetas)), format_func=lambda i: etiquetas[i])
+                entrada = log_lentas.iloc[int(elegida)]
+                alertas = plan_warnings(entrada["explain"] or [])
+                if alertas:
+                    st.warning("Plan: " + "; ".join(alertas))
+                if entrada.get("explain_error"):
+                    st.caption(f"EXPLAIN no disponible: {entrada['explain_error']}")
+                else:
+                    st.dataframe(pd.DataFrame(entrada["explain"]), width="stretch", hide_index=True)
+                st.code(entrada["sql"], language="sql")
+                st.json(entrada["params"])
+            if st.button("Vaciar log de consultas lentas"):
+                clear_slow_log(conn)
+
 st.subheader("Cómo extender")
 st.write(
     "Para agregar una métrica: define el SQL en src/query_store.py, expón un servicio en src/metrics.py y cablea la UI en app.py (y/o src/ui/)."
 )
+
+perfil = end_rerun()
+if perfil_rerun:
+    if profiler is not None:
+        profiler.disable()
+    resumen_perfil = profile_summary(perfil)
+    tramos = profile_frame(perfil)
+    with st.sidebar:
+        st.subheader("Perfil del rerun")
+        p1, p2 = st.columns(2)
+        p1.metric("Consultas", format_int(resumen_perfil["consultas"]))
+        p2.metric("Total", f"{resumen_perfil['total_ms'] or 0:,.0f} ms")
+        if presupuesto_consultas and resumen_perfil["consultas"] > presupuesto_consultas:
+            st.warning(
+                f"Este rerun hizo {resumen_perfil['consultas']} consultas "
+                f"(presupuesto: {presupuesto_consultas})."
+            )
+        st.caption(
+            f"Base {resumen_perfil['db_ms']:,.0f} ms · Plotly {resumen_perfil['plotly_ms']:,.0f} ms · "
+            f"formatters {resumen_perfil['formatters_ms']:,.0f} ms · cache {resumen_perfil['aciertos_cache']} aciertos"
+        )
+        if not tramos.empty:
+            st.plotly_chart(waterfall_chart(tramos), width="stretch")
+        st.download_button(
+            "Perfil (JSON)",
+            data=json.dumps(profile_json(perfil, budget=presupuesto_consultas), ensure_ascii=False, default=str),
+            file_name=f"perfil_rerun_{rerun_id}.json",
+            mime="application/json",
+        )
+        if profiler is None:
+            st.caption("cProfile no disponible (otro profiler activo en este proceso).")
+        else:
+            st.download_button(
+                "cProfile (.prof)",
+                data=cprofile_bytes(profiler),
+                file_name=f"perfil_rerun_{rerun_id}.prof",
+                mime="application/octet-stream",
+                help="Abrir con `python -m pstats` o snakeviz. Solo el hilo del script (no particiones en paralelo).",
+            )
+            with st.expander("Funciones más costosas", expanded=False):
+                st.dataframe(cprofile_top(profiler), width="stretch", hide_index=True)
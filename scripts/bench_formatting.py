@@ -0,0 +1,75 @@
+"""Micro-benchmark: formato Bs fila por fila vs vectorizado.
+
+Verifica que `format_bs_array` / `format_number_array` producen exactamente el mismo
+texto que `format_bs` / `format_number` y mide el tiempo de ambos caminos.
+
+Uso:
+    python scripts/bench_formatting.py [filas]
+"""
+
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Agregar el directorio raíz al path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.ui.formatting import format_bs, format_bs_array, format_number, format_number_array
+
+
+def _sample(n: int, seed: int = 7) -> pd.Series:
+    """Montos realistas + casos borde (NaN, inf, negativos, empates, Decimal, None)."""
+
+    rng = np.random.default_rng(seed)
+    # Mezcla de montos con 0..4 decimales "limpios" (como vienen de DECIMAL en MySQL).
+    digits = rng.integers(0, 5, size=n)
+    values = np.round(rng.lognormal(mean=4, sigma=2, size=n) * 10.0**digits) / 10.0**digits
+    values *= np.where(rng.random(n) < 0.1, -1, 1)
+    edge = [np.nan, np.inf, -np.inf, 0.0, -0.0, -0.004, 0.005, 1.005, 2.675, 10.125, 999.995, 1e15, -1234567.891]
+    values[: len(edge)] = edge
+    series = pd.Series(values, dtype=object)
+    series.iloc[len(edge)] = None
+    series.iloc[len(edge) + 1] = Decimal("1100.335")
+    series.iloc[len(edge) + 2] = "1_000.5"
+    return series
+
+
+def _bench(label: str, fn, repeat: int = 3) -> tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<28} {best * 1000:9.1f} ms")
+    return best, result
+
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    numeric = pd.to_numeric(_sample(n), errors="coerce").astype("float64")
+    mixed = _sample(n)
+
+    ok = True
+    for name, series in (("float64", numeric), ("object/Decimal", mixed)):
+        for decimals, scalar_fn, array_fn in (
+            (2, format_bs, format_bs_array),
+            (4, format_number, format_number_array),
+        ):
+            print(f"\n[{name}] {scalar_fn.__name__} decimals={decimals} · {n:,} filas")
+            t_apply, expected = _bench("apply (fila por fila)", lambda: series.apply(lambda v: scalar_fn(v, decimals=decimals)))
+            t_vec, got = _bench("vectorizado", lambda: array_fn(series.to_numpy(), decimals=decimals))
+            same = list(expected) == list(got)
+            ok &= same
+            print(f"{'speedup':<28} {t_apply / t_vec:9.1f}x · idéntico: {'sí' if same else 'NO'}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,300 @@
+"""Benchmark de `src/metrics.py` sobre la base sintética (sin MySQL).
+
+Genera (o reutiliza) una base SQLite por escala (`src/synthetic.py`), corre cada `get_*`
+en tres contextos (tiempo real, histórico por operativas, histórico por fechas) y mide:
+
+- `frio_ms`: primera llamada con cache local vacío (conexión con nombre propio por función).
+- `tibio_ms` / `tibio_min_ms`: mediana y mejor de las repeticiones siguientes (cache local /
+  rollups ya escritos).
+- `consultas_frio` / `consultas_tibio`: consultas que fueron a la base (registro de `src/perf.py`).
+
+Los resultados se agregan a `.cache/bench/metrics.jsonl` (una fila por escala × contexto ×
+función) y se comparan contra la corrida anterior de la misma escala (o contra `corrida`):
+una función regresiona si su `tibio_min_ms` sube más de 25% (y más de 5 ms) o si hace más
+consultas. Sale con código 1 si hay regresiones.
+
+Uso:
+    python scripts/bench_metrics.py [escalas] [repeticiones] [corrida_base]
+
+Por defecto: escalas `s,m` (ver `SCALES`: s, m, l), 3 repeticiones y la corrida anterior.
+"""
+
+import inspect
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+# Agregar el directorio raíz al path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src import metrics
+from src.op_index import get_op_prefilter
+from src.perf import begin_rerun, get_records
+from src.query_store import Filters
+from src.synthetic import SCALES, SQLiteConnection, build_database, database_stats
+
+
+BENCH_DIR = ROOT_DIR / ".cache" / "bench"
+RESULTS_FILE = BENCH_DIR / "metrics.jsonl"
+
+REGRESSION_THRESHOLD = 0.25
+REGRESSION_MIN_MS = 5.0
+
+Case = Callable[[Any, dict[str, Any]], Any]
+
+# Una entrada por `get_*` de src/metrics.py. `ctx`: view, filters, mode, ids.
+CASES: dict[str, Case] = {
+    "get_kpis": lambda c, x: metrics.get_kpis(c, x["view"], x["filters"], x["mode"]),
+    "get_wac_cogs_summary": lambda c, x: metrics.get_wac_cogs_summary(c, "vw_margen_comanda", x["filters"], x["mode"]),
+    "get_kpis_por_operacion": lambda c, x: metrics.get_kpis_por_operacion(c, x["view"], x["filters"], x["mode"]),
+    "get_kpis_recientes": lambda c, x: metrics.get_kpis_recientes(c, x["filters"], x["mode"]),
+    "get_wac_cogs_detalle": lambda c, x: metrics.get_wac_cogs_detalle(c, "vw_margen_comanda", x["filters"], x["mode"]),
+    "get_consumo_valorizado": lambda c, x: metrics.get_consumo_valorizado(
+        c, "vw_consumo_valorizado_operativa", x["filters"], x["mode"]
+    ),
+    "get_consumo_sin_valorar": lambda c, x: metrics.get_consumo_sin_valorar(
+        c, "vw_consumo_insumos_operativa", x["filters"], x["mode"]
+    ),
+    "get_cogs_por_comanda": lambda c, x: metrics.get_cogs_por_comanda(c, "vw_cogs_comanda", x["filters"], x["mode"]),
+    "get_estado_operativo": lambda c, x: metrics.get_estado_operativo(c, x["view"], x["filters"], x["mode"]),
+    "get_ids_comandas_pendientes": lambda c, x: metrics.get_ids_comandas_pendientes(c, x["view"], x["filters"], x["mode"]),
+    "get_ids_comandas_no_impresas": lambda c, x: metrics.get_ids_comandas_no_impresas(c, x["view"], x["filters"], x["mode"]),
+    "get_ids_comandas_impresion_pendiente": lambda c, x: metrics.get_ids_comandas_impresion_pendiente(
+        c, x["view"], x["filters"], x["mode"]
+    ),
+    "get_ids_comandas_sin_estado_impresion": lambda c, x: metrics.get_ids_comandas_sin_estado_impresion(
+        c, x["view"], x["filters"], x["mode"]
+    ),
+    "get_ids_comandas_anuladas": lambda c, x: metrics.get_ids_comandas_anuladas(c, x["view"], x["filters"], x["mode"]),
+    "get_ventas_por_hora": lambda c, x: metrics.get_ventas_por_hora(c, x["view"], x["filters"], x["mode"]),
+    "get_ventas_timeline": lambda c, x: metrics.get_ventas_timeline(c, x["view"], x["filters"], x["mode"]),
+    "get_ventas_por_categoria": lambda c, x: metrics.get_ventas_por_categoria(c, x["view"], x["filters"], x["mode"]),
+    "get_ventas_por_usuario": lambda c, x: metrics.get_ventas_por_usuario(c, x["view"], x["filters"], x["mode"]),
+    "get_top_productos": lambda c, x: metrics.get_top_productos(c, x["view"], x["filters"], x["mode"]),
+    "get_basket_analysis": lambda c, x: metrics.get_basket_analysis(c, x["view"], x["filters"], x["mode"]),
+    "get_detalle": lambda c, x: metrics.get_detalle(c, x["view"], x["filters"], x["mode"]),
+    "get_impresion_snapshot": lambda c, x: metrics.get_impresion_snapshot(c, x["view"], x["ids"]),
+    "get_actividad_emision_comandas": lambda c, x: metrics.get_actividad_emision_comandas(
+        c, x["view"], x["filters"], x["mode"]
+    ),
+}
+
+
+# Vistas por operativa (sin `fecha_emision`): no aplican al histórico por fechas.
+OPS_ONLY = {"get_consumo_valorizado", "get_consumo_sin_valorar"}
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _contexts(db_path: Path) -> dict[str, dict[str, Any]]:
+    """Los tres contextos del dashboard sobre la base sintética."""
+
+    conn = SQLiteConnection(db_path, name=f"bench_setup_{db_path.stem}")
+    ops = conn.query("SELECT id, fecha, estado_operacion FROM ope_operacion ORDER BY id")
+    conn.close()
+    open_ops = ops[ops["estado_operacion"] == 22]["id"].tolist()
+    closed = ops[ops["estado_operacion"] == 23]["id"].tolist()
+    current = int(open_ops[-1]) if open_ops else int(ops["id"].iloc[-1])
+
+    # Histórico por fechas: las últimas 7 noches cerradas.
+    last_closed = ops[ops["id"].isin(closed[-7:])]
+    dt_ini = f"{last_closed['fecha'].min():%Y-%m-%d} 00:00:00"
+    dt_fin = f"{last_closed['fecha'].max() + timedelta(days=1):%Y-%m-%d} 06:00:00"
+    prefilter_conn = SQLiteConnection(db_path, name=f"bench_prefilter_{db_path.stem}")
+    prefilter = get_op_prefilter(prefilter_conn, dt_ini, dt_fin)
+    prefilter_conn.close()
+
+    ids_conn = SQLiteConnection(db_path, name=f"bench_ids_{db_path.stem}")
+    ids = ids_conn.query(
+        "SELECT id FROM bar_comanda WHERE id_operacion = :op ORDER BY id DESC LIMIT 50", {"op": current}
+    )["id"].tolist()
+    ids_conn.close()
+    return {
+        "tiempo_real": {
+            "view": "comandas_v6",
+            "filters": Filters(op_ini=current, op_fin=current),
+            "mode": "ops",
+            "ids": ids,
+        },
+        "historico_ops": {
+            "view": "comandas_v6_todas",
+            "filters": Filters(op_ini=int(closed[0]), op_fin=int(closed[-1])),
+            "mode": "ops",
+            "ids": ids,
+        },
+        "historico_fechas": {
+            "view": "comandas_v6_todas",
+            "filters": Filters(dt_ini=dt_ini, dt_fin=dt_fin, op_prefilter=prefilter),
+            "mode": "dates",
+            "ids": ids,
+        },
+    }
+
+
+def _measure(conn: Any, case: Case, ctx: dict[str, Any]) -> tuple[float, int, int]:
+    """(ms, consultas a la base, aciertos de cache) de una llamada."""
+
+    rerun = begin_rerun()
+    t0 = time.perf_counter()
+    case(conn, ctx)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    records = get_records(rerun=rerun)
+    misses = int((records["cache"] == "miss").sum()) if not records.empty else 0
+    hits = int((records["cache"] == "hit").sum()) if not records.empty else 0
+    return elapsed_ms, misses, hits
+
+
+def _run_scale(escala: str, repeticiones: int, corrida: str, commit: str | None) -> list[dict[str, Any]]:
+    scale = SCALES[escala]
+    db_path = BENCH_DIR / f"synthetic_{escala}_{scale.label}.sqlite"
+    if not db_path.exists():
+        t0 = time.perf_counter()
+        build_database(db_path, scale)
+        print(f"Base {db_path.name} generada en {time.perf_counter() - t0:.1f} s")
+    stats = database_stats(db_path)
+    print(f"\n== Escala {escala} ({scale.label}) · " + " · ".join(f"{k}={v:,}" for k, v in stats.items()))
+
+    rows: list[dict[str, Any]] = []
+    for contexto, ctx in _contexts(db_path).items():
+        for funcion, case in CASES.items():
+            if ctx["mode"] == "dates" and funcion in OPS_ONLY:
+                continue
+            # Nombre propio por función: cache local y memorias en proceso vacíos.
+            conn = SQLiteConnection(db_path, name=f"bench_{escala}_{contexto}_{funcion}_{corrida}")
+            try:
+                frio_ms, consultas_frio, _ = _measure(conn, case, ctx)
+                tibios = [_measure(conn, case, ctx) for _ in range(repeticiones)]
+            except Exception as exc:
+                print(f"  {contexto:<17} {funcion:<38} ERROR {type(exc).__name__}: {exc}")
+                rows.append(
+                    {"corrida": corrida, "commit": commit, "escala": escala, "contexto": contexto, "funcion": funcion, "error": str(exc)}
+                )
+                continue
+            finally:
+                conn.close()
+            row = {
+                "corrida": corrida,
+                "commit": commit,
+                "escala": escala,
+                "dimension": scale.label,
+                **stats,
+                "contexto": contexto,
+                "funcion": funcion,
+                "frio_ms": round(frio_ms, 2),
+                "tibio_ms": round(statistics.median(t[0] for t in tibios), 2),
+                "tibio_min_ms": round(min(t[0] for t in tibios), 2),
+                "consultas_frio": consultas_frio,
+                "consultas_tibio": max((t[1] for t in tibios), default=0),
+                "aciertos_cache_tibio": max((t[2] for t in tibios), default=0),
+            }
+            rows.append(row)
+            print(
+                f"  {contexto:<17} {funcion:<38} frío {row['frio_ms']:9.1f} ms ({consultas_frio} q)"
+                f" · tibio {row['tibio_ms']:9.1f} ms ({row['consultas_tibio']} q)"
+            )
+    return rows
+
+
+def _load_results() -> list[dict[str, Any]]:
+    if not RESULTS_FILE.exists():
+        return []
+    out: list[dict[str, Any]] = []
+    with RESULTS_FILE.open(encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue
+    return out
+
+
+def _compare(rows: list[dict[str, Any]], previous: list[dict[str, Any]], baseline: str | None) -> list[str]:
+    """Regresiones de la corrida actual frente a la base (misma escala, contexto y función)."""
+
+    regressions: list[str] = []
+    for escala in sorted({r["escala"] for r in rows}):
+        candidates = [p for p in previous if p.get("escala") == escala and "error" not in p]
+        if baseline:
+            candidates = [p for p in candidates if p.get("corrida") == baseline]
+        elif candidates:
+            last = max(p["corrida"] for p in candidates)
+            candidates = [p for p in candidates if p["corrida"] == last]
+        if not candidates:
+            print(f"\nEscala {escala}: sin corrida base para comparar.")
+            continue
+        base = {(p["contexto"], p["funcion"]): p for p in candidates}
+        print(f"\nEscala {escala}: comparación contra la corrida {candidates[0]['corrida']} ({candidates[0].get('commit')})")
+        for row in rows:
+            if row["escala"] != escala or "error" in row:
+                continue
+            ref = base.get((row["contexto"], row["funcion"]))
+            if ref is None or not ref.get("tibio_min_ms"):
+                continue
+            label = f"{escala} · {row['contexto']} · {row['funcion']}"
+            before, after = float(ref["tibio_min_ms"]), float(row["tibio_min_ms"])
+            if after - before > REGRESSION_MIN_MS and after > before * (1 + REGRESSION_THRESHOLD):
+                regressions.append(f"{label}: tibio {before:.1f} → {after:.1f} ms")
+            for key in ("consultas_frio", "consultas_tibio"):
+                if row[key] > int(ref.get(key) or 0):
+                    regressions.append(f"{label}: {key} {ref.get(key)} → {row[key]}")
+    return regressions
+
+
+def main() -> int:
+    escalas = [e.strip() for e in (sys.argv[1] if len(sys.argv) > 1 else "s,m").split(",") if e.strip()]
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    baseline = sys.argv[3] if len(sys.argv) > 3 else None
+    unknown = [e for e in escalas if e not in SCALES]
+    if unknown:
+        print(f"Escalas desconocidas: {', '.join(unknown)} (disponibles: {', '.join(SCALES)})")
+        return 2
+
+    available = {name for name, _ in inspect.getmembers(metrics, inspect.isfunction) if name.startswith("get_")}
+    missing = sorted(n for n in available if n not in CASES and getattr(metrics, n).__module__ == metrics.__name__)
+    if missing:
+        print(f"Aviso: funciones sin caso de benchmark: {', '.join(missing)}")
+
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    corrida = datetime.now().strftime("%Y%m%d-%H%M%S")
+    commit = _git_commit()
+    # Cache local aislado: cada corrida empieza en frío y no ensucia `.cache/` del dashboard.
+    os.environ["DASHBACK_CACHE_DIR"] = tempfile.mkdtemp(prefix="dashback_bench_")
+
+    rows: list[dict[str, Any]] = []
+    for escala in escalas:
+        rows.extend(_run_scale(escala, max(repeticiones, 1), corrida, commit))
+
+    regressions = _compare(rows, _load_results(), baseline)
+    with RESULTS_FILE.open("a", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+    print(f"\nResultados agregados a {RESULTS_FILE} (corrida {corrida}).")
+
+    errors = [r for r in rows if "error" in r]
+    if regressions:
+        print(f"\n{len(regressions)} regresiones:")
+        for line in regressions:
+            print(f"  - {line}")
+    if errors:
+        print(f"\n{len(errors)} funciones con error.")
+    return 1 if regressions or errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+"""Chequeo de forma de consultas: round trips y filas por escenario del dashboard.
+
+Renderiza `app.py` sin navegador (`streamlit.testing.v1.AppTest`) sobre la base sintética
+(`src/synthetic.py`) y, con el registro de `src/perf.py`, cuenta las consultas que van a
+la base en cada escenario:
+
+- `tiempo_real_inicio`: primera carga en tiempo real (cache local vacío).
+- `tiempo_real_refresco`: rerun siguiente (botón "Actualizar").
+- `historico_operativa`: histórico, una operativa cerrada.
+- `historico_30_operativas`: histórico, rango de 30 operativas.
+- `historico_fechas`: histórico por fechas (7 noches).
+
+Compara contra `scripts/query_shapes.json` y falla (código 1) si un escenario hace más
+consultas, aparece un builder nuevo (o se repite más veces) o un builder devuelve muchas
+más filas que antes (p. ej. un `limit=None` que escanea todas las comandas del rango).
+
+Además, ningún escenario puede superar el presupuesto de consultas por rerun de la app
+(`DEFAULT_QUERY_BUDGET` en `src/perf.py`), ni siquiera con `--actualizar`: el presupuesto
+se cambia a mano en `src/perf.py`, no regenerando la línea base.
+
+Uso:
+    python scripts/check_query_shapes.py [--actualizar]
+
+`--actualizar` reescribe la línea base con los valores actuales (revisar el diff), si
+todos los escenarios caben en el presupuesto.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+# Agregar el directorio raíz al path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from streamlit.testing.v1 import AppTest
+
+from src.db import get_connection
+from src.perf import DEFAULT_QUERY_BUDGET, clear_records, get_records
+from src.synthetic import SyntheticScale, build_database
+
+
+BASELINE_FILE = Path(__file__).parent / "query_shapes.json"
+
+# 40 operativas: alcanza para un rango de 30 y deja operativas fuera del rango.
+SCALE = SyntheticScale(operaciones=40, comandas=150, items=2.5)
+RANGE_OPERATIONS = 30
+DATES_NIGHTS = 7
+
+# Tolerancia de filas por builder (la base es determinista; el margen cubre cambios de día).
+ROWS_TOLERANCE = 0.25
+ROWS_FLOOR = 100
+
+APP_TIMEOUT_SECONDS = 180
+
+
+def _new_app(db_path: Path) -> AppTest:
+    """AppTest con cache local vacío y conexión nueva sobre `db_path`."""
+
+    get_connection.clear()
+    os.environ["DASHBACK_SYNTHETIC_DB"] = str(db_path)
+    os.environ["DASHBACK_CACHE_DIR"] = tempfile.mkdtemp(prefix="dashback_shapes_")
+    return AppTest.from_file(str(ROOT_DIR / "app.py"), default_timeout=APP_TIMEOUT_SECONDS)
+
+
+def _measure(at: AppTest, action: Callable[[AppTest], Any]) -> dict[str, Any]:
+    """Ejecuta `action` (un rerun) y resume las consultas de ese rerun."""
+
+    clear_records()
+    t0 = time.perf_counter()
+    action(at)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(f"El script falló: {at.exception[0].value}")
+
+    records = get_records()
+    misses = records[records["cache"] == "miss"] if not records.empty else records
+    builders = Counter(str(c) for c in misses["consulta"]) if not misses.empty else Counter()
+    max_rows = misses.groupby("consulta")["filas"].max().to_dict() if not misses.empty else {}
+    return {
+        "consultas": int(len(misses)),
+        "aciertos_cache": int((records["cache"] == "hit").sum()) if not records.empty else 0,
+        "builders": dict(sorted(builders.items())),
+        "max_filas": {str(k): int(v) for k, v in sorted(max_rows.items())},
+        "ms": round(elapsed_ms, 1),
+    }
+
+
+def _select(at: AppTest, label: str, value: Any) -> None:
+    widgets = [w for w in (*at.sidebar.selectbox, *at.sidebar.radio, *at.sidebar.date_input) if w.label == label]
+    if not widgets:
+        raise RuntimeError(f"No se encontró el control '{label}' en el sidebar")
+    widgets[0].set_value(value)
+
+
+def _scenarios(realtime_db: Path, historical_db: Path, last_day: date) -> dict[str, dict[str, Any]]:
+    out: dict[str, dict[str, Any]] = {}
+
+    at = _new_app(realtime_db)
+    out["tiempo_real_inicio"] = _measure(at, lambda a: a.run())
+    out["tiempo_real_refresco"] = _measure(at, lambda a: a.run())
+
+    at = _new_app(historical_db)
+    out["historico_operativa"] = _measure(at, lambda a: a.run())
+
+    at = _new_app(historical_db)
+    at.run()
+
+    def _range(a: AppTest) -> None:
+        inicio = [s for s in a.sidebar.selectbox if s.label == "Operativa inicio"][0]
+        _select(a, "Operativa inicio", inicio.options[RANGE_OPERATIONS - 1])
+        a.run()
+
+    out["historico_30_operativas"] = _measure(at, _range)
+
+    at = _new_app(historical_db)
+    at.run()
+    _select(at, "Filtrar histórico por", "Fechas")
+    at.run()
+
+    def _dates(a: AppTest) -> None:
+        _select(a, "Fecha inicio", last_day - timedelta(days=DATES_NIGHTS - 1))
+        _select(a, "Fecha fin", last_day)
+        a.run()
+
+    out["historico_fechas"] = _measure(at, _dates)
+    return out
+
+
+def _violations(name: str, current: dict[str, Any], base: dict[str, Any]) -> list[str]:
+    problems: list[str] = []
+    if current["consultas"] > base["consultas"]:
+        problems.append(f"{name}: {base['consultas']} → {current['consultas']} consultas a la base")
+    for builder, count in current["builders"].items():
+        before = int(base["builders"].get(builder, 0))
+        if count > before:
+            problems.append(f"{name}: {builder} {before} → {count} ejecuciones")
+    for builder, rows in current["max_filas"].items():
+        limit = max(ROWS_FLOOR, int(base["max_filas"].get(builder, 0) * (1 + ROWS_TOLERANCE)))
+        if rows > limit:
+            problems.append(f"{name}: {builder} devuelve {rows} filas (línea base {base['max_filas'].get(builder, 0)})")
+    return problems
+
+
+def main() -> int:
+    update = "--actualizar" in sys.argv[1:]
+    # Sin hilos de fondo: el watcher de cierres y los EXPLAIN de consultas lentas
+    # consultan en paralelo y harían variar los conteos.
+    os.environ["DASHBACK_LIFECYCLE_WATCHER"] = "0"
+    os.environ["DASHBACK_SLOW_QUERY_MS"] = str(10**9)
+
+    workdir = Path(tempfile.mkdtemp(prefix="dashback_shapes_db_"))
+    last_day = date.today() - timedelta(days=1)
+    realtime_db = build_database(workdir / "tiempo_real.sqlite", SCALE, last_day=last_day)
+    historical_db = build_database(workdir / "historico.sqlite", SCALE, last_day=last_day, open_last=False)
+
+    current = _scenarios(realtime_db, historical_db, last_day)
+    for name, shape in current.items():
+        print(
+            f"{name:<26} {shape['consultas']:3d} consultas · {shape['aciertos_cache']:3d} aciertos de cache"
+            f" · {shape['ms']:8.1f} ms"
+        )
+        for builder, count in shape["builders"].items():
+            print(f"    {builder:<34} ×{count:<3d} máx {shape['max_filas'].get(builder, 0)} filas")
+
+    over_budget = [
+        f"{name}: {shape['consultas']} consultas superan el presupuesto de la app "
+        f"(DEFAULT_QUERY_BUDGET = {DEFAULT_QUERY_BUDGET} en src/perf.py)"
+        for name, shape in current.items()
+        if shape["consultas"] > DEFAULT_QUERY_BUDGET
+    ]
+    if over_budget:
+        print(f"\n{len(over_budget)} escenarios fuera de presupuesto:")
+        for line in over_budget:
+            print(f"  - {line}")
+        return 1
+
+    if update or not BASELINE_FILE.exists():
+        payload = {name: {k: v for k, v in shape.items() if k != "ms"} for name, shape in current.items()}
+        BASELINE_FILE.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\nLínea base escrita en {BASELINE_FILE}.")
+        return 0
+
+    baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8"))
+    problems: list[str] = []
+    for name, shape in current.items():
+        if name not in baseline:
+            problems.append(f"{name}: escenario sin línea base (correr con --actualizar)")
+            continue
+        problems.extend(_violations(name, shape, baseline[name]))
+
+    if problems:
+        print(f"\n{len(problems)} cambios de forma de consultas:")
+        for line in problems:
+            print(f"  - {line}")
+        return 1
+    print("\nForma de consultas OK (sin round trips ni filas de más).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+"""Asesor de índices: EXPLAIN de cada consulta del dashboard + recomendaciones.
+
+Corre `EXPLAIN` sobre todos los builders `q_*` (modos ops y fechas) para una operativa de
+referencia, marca full scans / temporary / filesort, compara con
+`information_schema.STATISTICS` e imprime los `ALTER TABLE ... ADD INDEX` sugeridos con la
+reducción de filas estimada.
+
+Uso:
+    python scripts/index_advisor.py [conexion] [id_operacion]
+
+Por defecto: conexión `mysql` y la última operativa cerrada (rango de fechas = el de
+sus comandas).
+"""
+
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.db import get_connection
+from src.index_advisor import default_context, format_report, run_advisor
+
+
+def main() -> int:
+    connection_name = sys.argv[1] if len(sys.argv) > 1 else "mysql"
+    conn = get_connection(connection_name)
+
+    context = default_context(conn, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    if context is None:
+        print("No hay operativas con comandas para armar filtros representativos.")
+        return 2
+    op_id, dt_ini, dt_fin = context
+    print(f"Conexión: {connection_name} · operativa {op_id} · fechas {dt_ini} → {dt_fin}")
+
+    report = run_advisor(conn, op_id=op_id, dt_ini=dt_ini, dt_fin=dt_fin)
+    print(format_report(report))
+    return 0 if report.recomendaciones.empty else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
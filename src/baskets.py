@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+"""Análisis de canasta: qué productos se piden juntos en la misma comanda.
+
+Entrada: pares distintos (comanda, producto) de ventas finalizadas
+(`q_comanda_productos` / `snapshot_comanda_productos`).
+
+- La matriz comanda × producto se representa dispersa (coordenadas COO con numpy, sin
+  scipy) y los pares se cuentan vectorizados: por cada comanda con `k` productos se
+  generan sus `k·(k-1)/2` pares con `np.repeat` y se cuentan con `np.unique`.
+- Los conteos (`BasketCounts`: comandas, comandas por producto, comandas por par) son
+  aditivos: un rango de operativas suma los conteos de cada una.
+- Operativas CERRADAS (23): sus conteos se guardan en disco
+  (`.cache/<conexión>/baskets/`) y no se recalculan.
+- De los conteos salen soporte, confianza y lift por par (`basket_rules`).
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.local_store import read_arrow, store_dir, write_arrow
+from src.query_store import Filters, build_where, contiguous_id_ranges
+from src.snapshots import (
+    SNAPSHOT_VIEW,
+    get_snapshot_coverage,
+    load_snapshot_range,
+    snapshot_comanda_productos,
+)
+
+
+PROBE_CHUNK = 50
+
+COUNTS_SCHEMA = pa.schema(
+    [
+        ("tipo", pa.string()),  # 'total' | 'item' | 'par'
+        ("producto_a", pa.string()),
+        ("producto_b", pa.string()),
+        ("comandas", pa.int64()),
+    ]
+)
+
+
+@dataclass(frozen=True)
+class BasketCounts:
+    """Conteos aditivos de una o más operativas."""
+
+    n_comandas: int
+    items: pd.DataFrame  # nombre, comandas
+    pairs: pd.DataFrame  # producto_a, producto_b (a < b), comandas
+
+    @classmethod
+    def empty(cls) -> BasketCounts:
+        return cls(
+            0,
+            pd.DataFrame({"nombre": pd.Series(dtype=object), "comandas": pd.Series(dtype=np.int64)}),
+            pd.DataFrame(
+                {
+                    "producto_a": pd.Series(dtype=object),
+                    "producto_b": pd.Series(dtype=object),
+                    "comandas": pd.Series(dtype=np.int64),
+                }
+            ),
+        )
+
+    def to_table(self) -> pa.Table:
+        n_items, n_pairs = len(self.items), len(self.pairs)
+        return pa.Table.from_pydict(
+            {
+                "tipo": ["total"] + ["item"] * n_items + ["par"] * n_pairs,
+                "producto_a": [None] + self.items["nombre"].astype(str).tolist() + self.pairs["producto_a"].astype(str).tolist(),
+                "producto_b": [None] * (1 + n_items) + self.pairs["producto_b"].astype(str).tolist(),
+                "comandas": [int(self.n_comandas)]
+                + self.items["comandas"].astype(np.int64).tolist()
+                + self.pairs["comandas"].astype(np.int64).tolist(),
+            },
+            schema=COUNTS_SCHEMA,
+        )
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> BasketCounts:
+        df = table.to_pandas()
+        total = df.loc[df["tipo"] == "total", "comandas"]
+        items = df.loc[df["tipo"] == "item", ["producto_a", "comandas"]].rename(columns={"producto_a": "nombre"})
+        pairs = df.loc[df["tipo"] == "par", ["producto_a", "producto_b", "comandas"]]
+        return cls(int(total.sum()), items.reset_index(drop=True), pairs.reset_index(drop=True))
+
+
+def count_baskets(rows: pd.DataFrame) -> BasketCounts:
+    """Cuenta comandas por producto y por par de productos (vectorizado).
+
+    `rows`: columnas `id_comanda`, `nombre` (se ignoran repetidos y nombres nulos).
+    """
+
+    if rows is None or rows.empty:
+        return BasketCounts.empty()
+
+    rows = rows.dropna(subset=["nombre"])
+    comanda_codes, _ = pd.factorize(rows["id_comanda"])
+    # `sort=True`: el código respeta el orden alfabético, así cada par sale como (a < b).
+    product_codes, products = pd.factorize(rows["nombre"].astype(str), sort=True)
+    n_products = len(products)
+    if n_products == 0:
+        return BasketCounts.empty()
+
+    # Celdas no nulas de la matriz comanda × producto, ordenadas por (comanda, producto).
+    cells = np.unique(comanda_codes.astype(np.int64) * n_products + product_codes)
+    comanda = cells // n_products
+    product = cells % n_products
+
+    sizes = np.bincount(comanda)
+    sizes = sizes[sizes > 0]
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    position = np.arange(len(cells)) - starts
+    partners = np.repeat(sizes, sizes) - position - 1  # productos posteriores en la misma comanda
+
+    total_pairs = int(partners.sum())
+    if total_pairs:
+        left = np.repeat(np.arange(len(cells)), partners)
+        offset = np.arange(total_pairs) - np.repeat(np.cumsum(partners) - partners, partners) + 1
+        right = left + offset
+        pair_keys, pair_counts = np.unique(product[left] * n_products + product[right], return_counts=True)
+    else:
+        pair_keys = np.empty(0, dtype=np.int64)
+        pair_counts = np.empty(0, dtype=np.int64)
+
+    item_counts = np.bincount(product, minlength=n_products)
+    names = np.asarray(products, dtype=object)
+    return BasketCounts(
+        int(len(sizes)),
+        pd.DataFrame({"nombre": names, "comandas": item_counts.astype(np.int64)}),
+        pd.DataFrame(
+            {
+                "producto_a": names[pair_keys // n_products],
+                "producto_b": names[pair_keys % n_products],
+                "comandas": pair_counts.astype(np.int64),
+            }
+        ),
+    )
+
+
+def merge_basket_counts(parts: list[BasketCounts]) -> BasketCounts:
+    """Suma conteos de varias operativas (cada comanda pertenece a una sola operativa)."""
+
+    parts = [p for p in parts if p.n_comandas]
+    if not parts:
+        return BasketCounts.empty()
+    if len(parts) == 1:
+        return parts[0]
+
+    items = pd.concat([p.items for p in parts], ignore_index=True)
+    pairs = pd.concat([p.pairs for p in parts], ignore_index=True)
+    return BasketCounts(
+        sum(p.n_comandas for p in parts),
+        items.groupby("nombre", as_index=False, sort=False)["comandas"].sum(),
+        pairs.groupby(["producto_a", "producto_b"], as_index=False, sort=False)["comandas"].sum(),
+    )
+
+
+def basket_rules(counts: BasketCounts, *, min_comandas: int = 3, limit: int = 50) -> pd.DataFrame:
+    """Pares con soporte, confianza (ambas direcciones) y lift, ordenados por lift.
+
+    - soporte_pct: % de comandas que contienen ambos productos.
+    - confianza_a_b_pct: de las comandas con A, % que también tienen B (y viceversa).
+    - lift: > 1 si se piden juntos más de lo esperado por azar.
+    """
+
+    cols = [
+        "producto_a",
+        "producto_b",
+        "comandas",
+        "soporte_pct",
+        "confianza_a_b_pct",
+        "confianza_b_a_pct",
+        "lift",
+    ]
+    pairs = counts.pairs
+    if not counts.n_comandas or pairs.empty:
+        return pd.DataFrame(columns=cols)
+
+    pairs = pairs[pairs["comandas"] >= int(min_comandas)]
+    if pairs.empty:
+        return pd.DataFrame(columns=cols)
+
+    item_count = counts.items.set_index("nombre")["comandas"]
+    n_ab = pairs["comandas"].to_numpy(dtype=np.float64)
+    n_a = item_count.reindex(pairs["producto_a"]).to_numpy(dtype=np.float64)
+    n_b = item_count.reindex(pairs["producto_b"]).to_numpy(dtype=np.float64)
+    total = float(counts.n_comandas)
+
+    out = pd.DataFrame(
+        {
+            "producto_a": pairs["producto_a"].to_numpy(),
+            "producto_b": pairs["producto_b"].to_numpy(),
+            "comandas": pairs["comandas"].to_numpy(dtype=np.int64),
+            "soporte_pct": np.round(n_ab / total * 100, 2),
+            "confianza_a_b_pct": np.round(n_ab / n_a * 100, 2),
+            "confianza_b_a_pct": np.round(n_ab / n_b * 100, 2),
+            "lift": np.round(n_ab * total / (n_a * n_b), 2),
+        }
+    )
+    out = out.sort_values(["lift", "comandas"], ascending=[False, False], kind="stable")
+    return out.head(int(limit)).reset_index(drop=True)[cols]
+
+
+def _counts_path(conn: Any, operacion_id: int, use_impresion_log: bool) -> Path:
+    return store_dir(conn, "baskets") / f"op_{int(operacion_id)}_log{int(use_impresion_log)}.arrow"
+
+
+def _counts_by_operation(rows: pd.DataFrame, ops: list[int]) -> dict[int, BasketCounts]:
+    if rows is None or rows.empty:
+        return {op: BasketCounts.empty() for op in ops}
+    op_ids = pd.to_numeric(rows["id_operacion"])
+    return {op: count_baskets(rows[op_ids == op]) for op in ops}
+
+
+def get_basket_counts(
+    conn: Any,
+    *,
+    view_name: str,
+    filters: Filters,
+    mode: str,
+    use_impresion_log: bool,
+    build_sql: Callable[[str], str],
+    run_df: Callable[[str, dict[str, Any]], pd.DataFrame],
+) -> BasketCounts:
+    """Conteos del contexto. En histórico por operativas, las cerradas salen del cache."""
+
+    if mode != "ops" or view_name != SNAPSHOT_VIEW or filters.op_ini is None or filters.op_fin is None:
+        where_sql, params = build_where(filters, mode, table_alias="v")
+        return count_baskets(run_df(build_sql(where_sql), params))
+
+    coverage = get_snapshot_coverage(conn, int(filters.op_ini), int(filters.op_fin))
+    cerradas = set(coverage.cerradas)
+    parts: list[BasketCounts] = []
+    pendientes: list[int] = []
+    for op_id in coverage.operaciones:
+        cached = read_arrow(_counts_path(conn, op_id, use_impresion_log)) if op_id in cerradas else None
+        if cached is not None:
+            parts.append(BasketCounts.from_table(cached))
+            continue
+        snap = load_snapshot_range(conn, op_id, op_id) if op_id in cerradas else None
+        if snap is not None:
+            counts = count_baskets(snapshot_comanda_productos(snap, use_impresion_log=use_impresion_log))
+            write_arrow(_counts_path(conn, op_id, use_impresion_log), counts.to_table())
+            parts.append(counts)
+            continue
+        pendientes.append(op_id)
+
+    # Una consulta por tramo contiguo de operativas sin cache (abiertas o sin snapshot).
+    for op_ini, op_fin in contiguous_id_ranges(pendientes, PROBE_CHUNK):
+        where_sql, params = build_where(Filters(op_ini=op_ini, op_fin=op_fin), "ops", table_alias="v")
+        rows = run_df(build_sql(where_sql), params)
+        chunk_ops = [op for op in pendientes if op_ini <= op <= op_fin]
+        for op_id, counts in _counts_by_operation(rows, chunk_ops).items():
+            if op_id in cerradas:
+                write_arrow(_counts_path(conn, op_id, use_impresion_log), counts.to_table())
+            parts.append(counts)
+
+    return merge_basket_counts(parts)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+"""Cadencia de emisión de comandas (minutos entre comandas) calculada en forma incremental.
+
+Antes, cada refresco leía *todas* las comandas del contexto y calculaba la mediana
+exacta. Ahora cada contexto (conexión + vista + modo + filtros) mantiene un
+`CadenceTracker` en memoria:
+
+- Solo se leen las comandas nuevas (`id_comanda > último id visto`, ver
+  `q_comandas_emision_delta`): el costo por refresco es O(filas nuevas).
+- Por operativa se acumula un `QuantileSketch` de los intervalos (p50/p90/p99 con
+  error relativo ≤ 1%) y un EWMA del intervalo (ritmo reciente).
+- Los sketches son combinables: un rango de operativas suma los sketches de cada una.
+  Los intervalos se miden dentro de cada operativa (el hueco entre dos noches no cuenta).
+- Con snapshot (operativas cerradas) el tracker se arma una vez desde Arrow y no se
+  vuelve a consultar.
+"""
+
+import math
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from src.local_store import connection_key
+from src.query_store import Filters, build_where
+
+
+RELATIVE_ACCURACY = 0.01
+EWMA_ALPHA = 0.2
+RECENT_MAX = 50
+TRACKERS_MAX = 32
+
+_MIN_POSITIVE = 1e-9
+
+
+class QuantileSketch:
+    """Sketch de cuantiles con error relativo acotado (buckets logarítmicos, estilo DDSketch).
+
+    Cada valor `x > 0` cae en el bucket `ceil(log(x) / log(gamma))`; dos sketches con la
+    misma precisión se combinan sumando los conteos de sus buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = float(relative_accuracy)
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min: float | None = None
+        self.max: float | None = None
+
+    def add_many(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values) & (values >= 0)]
+        if values.size == 0:
+            return
+
+        positive = values[values > _MIN_POSITIVE]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, cnt in zip(keys.tolist(), counts.tolist()):
+                self.counts[key] = self.counts.get(key, 0) + cnt
+
+        self.count += int(values.size)
+        vmin, vmax = float(values.min()), float(values.max())
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+    def merge(self, other: QuantileSketch) -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión")
+        for key, cnt in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + cnt
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+
+        rank = float(q) * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if rank < seen:
+                value = 2 * self.gamma**key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+@dataclass
+class OperationCadence:
+    """Intervalos entre comandas de una operativa (sketch + EWMA)."""
+
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    ewma_min: float | None = None
+    last_ts: pd.Timestamp | None = None
+
+    def add(self, timestamps: pd.Series) -> None:
+        """Agrega comandas nuevas (ordenadas por emisión) de esta operativa."""
+
+        ts = pd.to_datetime(timestamps, errors="coerce").dropna().sort_values(kind="stable")
+        if ts.empty:
+            return
+        if self.last_ts is not None:
+            ts = pd.concat([pd.Series([self.last_ts]), ts], ignore_index=True)
+        minutes = (ts.diff().dropna().dt.total_seconds() / 60.0).to_numpy()
+        minutes = minutes[minutes >= 0]
+        self.sketch.add_many(minutes)
+        for value in minutes.tolist():
+            self.ewma_min = value if self.ewma_min is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * self.ewma_min
+        self.last_ts = max(ts.iloc[-1], self.last_ts) if self.last_ts is not None else ts.iloc[-1]
+
+
+@dataclass
+class CadenceTracker:
+    """Estado incremental de un contexto: cadencia por operativa + últimas comandas."""
+
+    operations: dict[int, OperationCadence] = field(default_factory=dict)
+    recent: deque = field(default_factory=lambda: deque(maxlen=RECENT_MAX))
+    last_id: int = 0
+    complete: bool = False  # construido desde snapshot: no hay comandas nuevas
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def ingest(self, df: pd.DataFrame) -> int:
+        """Incorpora filas `id_operacion, id_comanda, fecha_emision`. Devuelve filas nuevas."""
+
+        if df is None or df.empty:
+            return 0
+        df = df.dropna(subset=["fecha_emision"]).sort_values(["fecha_emision", "id_comanda"], kind="stable")
+        df = df[pd.to_numeric(df["id_comanda"]) > self.last_id]
+        if df.empty:
+            return 0
+
+        for op_id, group in df.groupby("id_operacion", sort=True, observed=True):
+            self.operations.setdefault(int(op_id), OperationCadence()).add(group["fecha_emision"])
+        self.recent.extend(pd.to_datetime(df["fecha_emision"]).tolist())
+        self.recent = deque(sorted(self.recent)[-RECENT_MAX:], maxlen=RECENT_MAX)
+        self.last_id = max(self.last_id, int(pd.to_numeric(df["id_comanda"]).max()))
+        return int(len(df))
+
+    def summary(self, *, recent_n: int = 10, latest_only: bool = False) -> dict[str, Any]:
+        """Métricas del contexto. `latest_only`: solo la operativa más reciente (tiempo real)."""
+
+        ops = sorted(self.operations)
+        if latest_only and ops:
+            ops = ops[-1:]
+        merged = QuantileSketch()
+        for op_id in ops:
+            merged.merge(self.operations[op_id].sketch)
+
+        latest = self.operations[ops[-1]] if ops else None
+        recent = list(self.recent)[-int(recent_n):]
+        recent_ns = np.array(recent, dtype="datetime64[ns]").astype(np.int64)
+        recent_minutes = np.diff(recent_ns) / 60e9
+        recent_minutes = recent_minutes[recent_minutes >= 0]
+
+        return {
+            "last_ts": recent[-1] if recent else None,
+            "recent_median_min": float(np.median(recent_minutes)) if recent_minutes.size else None,
+            "recent_intervals": int(recent_minutes.size),
+            "all_median_min": merged.quantile(0.5),
+            "all_p90_min": merged.quantile(0.9),
+            "all_p99_min": merged.quantile(0.99),
+            "all_intervals": int(merged.count),
+            "ewma_min": latest.ewma_min if latest is not None else None,
+            "operaciones": len(ops),
+        }
+
+
+# (conexión, vista, modo, filtros, generación) -> tracker; LRU en proceso.
+_TRACKERS: OrderedDict[tuple, CadenceTracker] = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _tracker_for(key: tuple) -> CadenceTracker:
+    with _LOCK:
+        tracker = _TRACKERS.get(key)
+        if tracker is None:
+            tracker = CadenceTracker()
+            _TRACKERS[key] = tracker
+        _TRACKERS.move_to_end(key)
+        while len(_TRACKERS) > TRACKERS_MAX:
+            _TRACKERS.popitem(last=False)
+        return tracker
+
+
+def get_cadence(
+    conn: Any,
+    *,
+    view_name: str,
+    filters: Filters,
+    mode: str,
+    build_sql: Callable[[str], str],
+    run_df: Callable[[str, dict[str, Any]], pd.DataFrame],
+    snapshot_rows: Callable[[], pd.DataFrame] | None = None,
+    generation: int = 0,
+    recent_n: int = 10,
+) -> dict[str, Any]:
+    """Actualiza (solo comandas nuevas) y resume la cadencia del contexto.
+
+    - `build_sql(where_sql)`: consulta incremental (`q_comandas_emision_delta`).
+    - `snapshot_rows()`: filas del snapshot si el rango está cerrado (sin SQL).
+    - `generation`: en tiempo real, cambia con cada transición de operativa y reinicia
+      el tracker (la vista pasa a mostrar otra operativa).
+    """
+
+    # El prefiltro por operativa depende del índice y puede cambiar; no define el contexto.
+    key = (connection_key(conn), view_name, mode, replace(filters, op_prefilter=None), int(generation))
+    tracker = _tracker_for(key)
+
+    with tracker.lock:
+        if not tracker.complete:
+            if snapshot_rows is not None:
+                tracker.ingest(snapshot_rows())
+                tracker.complete = True
+            else:
+                where_sql, params = build_where(filters, mode)
+                params = {**params, "cad_ultimo_id": int(tracker.last_id)}
+                tracker.ingest(run_df(build_sql(where_sql), params))
+        return tracker.summary(recent_n=recent_n, latest_only=mode == "none")
+
+
+def forget_cadence_trackers() -> None:
+    with _LOCK:
+        _TRACKERS.clear()
@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+"""Cancelación en el servidor de las consultas de un rerun reemplazado.
+
+Si el usuario cambia un filtro mientras el script está bloqueado en una consulta pesada
+(p. ej. un rango amplio de operativas que corrige enseguida), Streamlit registra el
+pedido de rerun pero el script recién lo atiende cuando MySQL devuelve el resultado.
+Mientras tanto la consulta sigue consumiendo la base.
+
+- Cada `execute` de SQLAlchemy (`before_cursor_execute`) registra la consulta en vuelo:
+  id de conexión MySQL (`CONNECTION_ID()` del driver), builder (`/* q_* */`), sesión de
+  Streamlit y su `ScriptRunContext`. Se da de baja al terminar o fallar.
+- Un hilo vigía (`dashback-cancel`) revisa cada `POLL_SECONDS` si la sesión dueña tiene
+  un rerun (o stop) pendiente; si la consulta lleva más de `MIN_RUNNING_MS`, ejecuta
+  `KILL QUERY <id>` desde una conexión propia, fuera del pool (`NullPool`, con timeout de
+  conexión `ADMIN_CONNECT_TIMEOUT_S`): con el pool agotado el vigía no queda esperando
+  `pool_timeout`. La conexión sigue viva; el `execute` falla con "Query execution was
+  interrupted" y Streamlit pasa al rerun nuevo.
+- Solo con `SQLConnection` (engine de SQLAlchemy) y dentro de una sesión de Streamlit.
+  `DASHBACK_CANCEL_SUPERSEDED=0` lo desactiva.
+
+Plazos (`query_scope`): las consultas lanzadas dentro de un `QueryScope` con `deadline`
+se cortan igual al vencerlo (timeout del lado del servidor; MySQL 5.6 no tiene
+`max_execution_time`). Un scope `detached` (sección que ya venció su plazo en pantalla y
+sigue en segundo plano, ver `src/deadlines.py`) no se cancela por rerun, solo por plazo.
+
+Carrera con el pool: la verificación "sigue en vuelo" y el `KILL QUERY` se hacen con el
+lock propio de la consulta (`InflightQuery.lock`), y `_release` (que corre en el hilo dueño
+antes de devolver la conexión al pool) espera ese lock. La conexión no puede pasar a otra
+sesión entre la verificación y el KILL. Si la sentencia terminó justo antes, el KILL llega
+a una conexión ociosa: MySQL descarta el `KILL QUERY` pendiente al empezar el próximo
+comando, así que no afecta a la consulta siguiente. La conexión de administración se abre
+antes de tomar el lock: el hilo dueño espera a lo sumo el round trip del KILL.
+
+Detección del rerun pendiente: Streamlit no expone una API pública para saber, con el
+script bloqueado, que la sesión pidió otro rerun (un contador al inicio de `app.py` recién
+cambia cuando empieza el rerun nuevo, es decir, después de la consulta). Se lee el estado
+interno `ScriptRunContext.script_requests._state`, verificado en Streamlit
+`STREAMLIT_VERIFIED` (la versión fijada en `requirements.txt`). Con otra versión se avisa
+una vez en el log; si el atributo ya no existe se avisa y la cancelación por rerun se
+desactiva (`rerun_detection_issue`). Los plazos siguen cortando igual.
+
+`KILL QUERY` sobre hilos del mismo usuario no requiere privilegios extra (sí `PROCESS`/
+`SUPER` para hilos de otros usuarios).
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Iterator
+
+import pandas as pd
+
+from src.perf import query_name
+
+
+CANCEL_ENV = "DASHBACK_CANCEL_SUPERSEDED"  # "0" desactiva la cancelación
+
+POLL_SECONDS = 0.25
+# Timeout para abrir la conexión de administración del KILL (fuera del pool).
+ADMIN_CONNECT_TIMEOUT_S = 5
+# Versiones (major.minor) en las que se verificó `ScriptRequests._state`.
+STREAMLIT_VERIFIED = ("1.53",)
+# Consultas más cortas terminan solas: no vale la pena el round trip del KILL.
+MIN_RUNNING_MS = 500.0
+CANCELLED_MAX = 200
+
+_INFO_KEY = "dashback_cancel_inflight"
+
+
+@dataclass
+class QueryScope:
+    """Plazo compartido por las consultas de un bloque (p. ej. una sección del dashboard)."""
+
+    deadline: float | None = None  # time.perf_counter() absoluto
+    detached: bool = False
+
+
+@dataclass
+class InflightQuery:
+    """Consulta en ejecución asociada a una sesión de Streamlit."""
+
+    connection_id: int
+    consulta: str
+    session_id: str
+    inicio: float
+    ctx: Any = field(repr=False)
+    engine: Any = field(repr=False)
+    scope: QueryScope | None = None
+    cancelada: bool = False
+    # Serializa el KILL con la baja de la consulta (ver docstring del módulo).
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+@dataclass(frozen=True)
+class CancelledQuery:
+    """Un `KILL QUERY` emitido por el vigía."""
+
+    consulta: str
+    session_id: str
+    connection_id: int
+    motivo: str  # 'rerun' (rerun reemplazado) | 'plazo' (venció el plazo del scope)
+    corriendo_ms: float
+    cancelada_en: datetime
+    error: str | None
+
+
+_LOCK = threading.Lock()
+_INFLIGHT: dict[int, InflightQuery] = {}
+_CANCELLED: deque[CancelledQuery] = deque(maxlen=CANCELLED_MAX)
+_INSTALLED: "weakref.WeakSet[Any]" = weakref.WeakSet()
+_WATCHDOG: threading.Thread | None = None
+_SCOPE: ContextVar[QueryScope | None] = ContextVar("dashback_query_scope", default=None)
+# Engine de la app -> engine sin pool para el KILL.
+_ADMIN_ENGINES: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+# Motivo por el que la cancelación por rerun quedó desactivada (None = activa).
+_DETECTION_OFF: str | None = None
+_VERSION_CHECKED = False
+
+_LOG = logging.getLogger(__name__)
+
+
+def is_enabled() -> bool:
+    return os.environ.get(CANCEL_ENV, "1") != "0"
+
+
+@contextmanager
+def query_scope(scope: QueryScope) -> Iterator[QueryScope]:
+    """Asocia `scope` a las consultas del bloque (también en hilos que copien el contexto)."""
+
+    token = _SCOPE.set(scope)
+    try:
+        yield scope
+    finally:
+        _SCOPE.reset(token)
+
+
+def _script_ctx() -> Any | None:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except Exception:
+        return None
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def _dbapi_connection_id(conn: Any) -> int | None:
+    """Id de conexión MySQL (`CONNECTION_ID()`) sin round trip, según el driver."""
+
+    try:
+        fairy = conn.connection
+        dbapi = getattr(fairy, "dbapi_connection", None) or getattr(fairy, "driver_connection", None)
+    except Exception:
+        return None
+    connection_id = getattr(dbapi, "connection_id", None)  # mysql-connector
+    if connection_id is None and hasattr(dbapi, "thread_id"):  # PyMySQL / mysqlclient
+        try:
+            connection_id = dbapi.thread_id()
+        except Exception:
+            connection_id = None
+    return int(connection_id) if connection_id is not None else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    ctx = _script_ctx()
+    if ctx is None:
+        return
+    connection_id = _dbapi_connection_id(conn)
+    if connection_id is None:
+        return
+    query = InflightQuery(
+        connection_id=connection_id,
+        consulta=query_name(statement),
+        session_id=str(getattr(ctx, "session_id", "")),
+        inicio=time.perf_counter(),
+        ctx=ctx,
+        engine=conn.engine,
+        scope=_SCOPE.get(),
+    )
+    conn.info[_INFO_KEY] = query
+    with _LOCK:
+        _INFLIGHT[connection_id] = query
+    _ensure_watchdog()
+
+
+def _release(conn: Any) -> None:
+    query = conn.info.pop(_INFO_KEY, None)
+    if query is None:
+        return
+    # Si el vigía está matando esta consulta, esperar: la conexión todavía no vuelve al pool.
+    with query.lock:
+        with _LOCK:
+            if _INFLIGHT.get(query.connection_id) is query:
+                del _INFLIGHT[query.connection_id]
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    _release(conn)
+
+
+def _handle_error(exception_context) -> None:
+    conn = getattr(exception_context, "connection", None)
+    if conn is not None:
+        _release(conn)
+
+
+def install_cancellation(conn: Any) -> None:
+    """Registra los eventos en el engine de una `SQLConnection` (una sola vez).
+
+    Sin engine (`mysql.connector`, conexiones de grabación/sintéticas) no hace nada.
+    """
+
+    if not is_enabled():
+        return
+    try:
+        engine = getattr(conn, "engine", None)
+        if engine is None or engine in _INSTALLED:
+            return
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+        _INSTALLED.add(engine)
+    except Exception:
+        return
+    _check_streamlit_version()
+
+
+def _streamlit_version() -> str:
+    try:
+        import streamlit
+
+        return str(streamlit.__version__)
+    except Exception:
+        return "?"
+
+
+def _check_streamlit_version() -> None:
+    """Avisa (una vez) si Streamlit no es una versión verificada para detectar reruns."""
+
+    global _VERSION_CHECKED
+    if _VERSION_CHECKED:
+        return
+    _VERSION_CHECKED = True
+    version = _streamlit_version()
+    if ".".join(version.split(".")[:2]) not in STREAMLIT_VERIFIED:
+        _LOG.warning(
+            "Streamlit %s no está verificado para cancelar consultas por rerun (verificado: %s); "
+            "se lee ScriptRequests._state mientras exista.",
+            version,
+            ", ".join(STREAMLIT_VERIFIED),
+        )
+
+
+def _disable_detection(reason: str) -> None:
+    global _DETECTION_OFF
+    if _DETECTION_OFF is None:
+        _DETECTION_OFF = reason
+        _LOG.warning("Cancelación de consultas por rerun desactivada: %s", reason)
+
+
+def rerun_detection_issue() -> str | None:
+    """Motivo por el que no se cancelan consultas por rerun (None si funciona)."""
+
+    return _DETECTION_OFF
+
+
+def _superseded(ctx: Any) -> bool:
+    """¿La sesión ya pidió otro rerun (o se cerró)? Lo atiende en el próximo `st.*`.
+
+    Lee estado interno de Streamlit (ver docstring del módulo): si desaparece, se desactiva.
+    """
+
+    if _DETECTION_OFF is not None:
+        return False
+    if not hasattr(ctx, "script_requests"):
+        _disable_detection(f"Streamlit {_streamlit_version()}: ScriptRunContext sin `script_requests`")
+        return False
+    requests = ctx.script_requests
+    if requests is None:
+        return False
+    name = getattr(getattr(requests, "_state", None), "name", None)
+    if name is None:
+        _disable_detection(f"Streamlit {_streamlit_version()}: ScriptRequests sin `_state`")
+        return False
+    return name in ("RERUN", "STOP")
+
+
+def _admin_engine(engine: Any) -> Any:
+    """Engine sin pool (mismo URL) para el KILL: no compite por el pool de la app."""
+
+    admin = _ADMIN_ENGINES.get(engine)
+    if admin is None:
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import NullPool
+
+        driver = getattr(engine.dialect, "driver", "")
+        if driver == "mysqlconnector":
+            connect_args = {"connection_timeout": ADMIN_CONNECT_TIMEOUT_S}
+        elif driver in ("pymysql", "mysqldb"):
+            connect_args = {"connect_timeout": ADMIN_CONNECT_TIMEOUT_S}
+        else:
+            connect_args = {}
+        admin = create_engine(engine.url, poolclass=NullPool, connect_args=connect_args)
+        _ADMIN_ENGINES[engine] = admin
+    return admin
+
+
+def _kill(query: InflightQuery, running_ms: float, motivo: str) -> bool:
+    """Emite el `KILL QUERY` si la consulta sigue en vuelo. Devuelve si lo intentó."""
+
+    error: str | None = None
+    # Conectar fuera de los locks: puede tardar (hasta ADMIN_CONNECT_TIMEOUT_S).
+    try:
+        admin = _admin_engine(query.engine).connect()
+    except Exception as exc:
+        admin, error = None, f"{type(exc).__name__}: {exc}"
+    try:
+        # Con el lock de la consulta tomado, `_release` no puede darla de baja (ni devolver la
+        # conexión al pool) hasta que termine el KILL.
+        with query.lock:
+            with _LOCK:
+                # La conexión pudo terminar (y volver al pool con otra consulta) entre medio.
+                if _INFLIGHT.get(query.connection_id) is not query or query.cancelada:
+                    return False
+                query.cancelada = True
+            if admin is not None:
+                try:
+                    admin.exec_driver_sql(f"KILL QUERY {int(query.connection_id)}")
+                except Exception as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+    finally:
+        if admin is not None:
+            admin.close()
+    with _LOCK:
+        _CANCELLED.append(
+            CancelledQuery(
+                consulta=query.consulta,
+                session_id=query.session_id,
+                connection_id=query.connection_id,
+                motivo=motivo,
+                corriendo_ms=round(running_ms, 1),
+                cancelada_en=datetime.now(),
+                error=error,
+            )
+        )
+    return True
+
+
+def _cancel_reason(query: InflightQuery, now: float) -> str | None:
+    scope = query.scope
+    if scope is not None and scope.deadline is not None and now >= scope.deadline:
+        return "plazo"
+    if (now - query.inicio) * 1000 < MIN_RUNNING_MS or (scope is not None and scope.detached):
+        return None
+    return "rerun" if _superseded(query.ctx) else None
+
+
+def check_inflight(now: float | None = None) -> int:
+    """Una pasada del vigía: cancela consultas de reruns reemplazados o con el plazo vencido.
+
+    Devuelve cuántas canceló.
+    """
+
+    now = time.perf_counter() if now is None else now
+    with _LOCK:
+        candidates = [q for q in _INFLIGHT.values() if not q.cancelada]
+    killed = 0
+    for query in candidates:
+        motivo = _cancel_reason(query, now)
+        if motivo is None:
+            continue
+        if _kill(query, (now - query.inicio) * 1000, motivo):
+            killed += 1
+    return killed
+
+
+def _watch() -> None:
+    while True:
+        time.sleep(POLL_SECONDS)
+        try:
+            check_inflight()
+        except Exception:
+            continue
+
+
+def _ensure_watchdog() -> None:
+    global _WATCHDOG
+    with _LOCK:
+        if _WATCHDOG is not None and _WATCHDOG.is_alive():
+            return
+        _WATCHDOG = threading.Thread(target=_watch, name="dashback-cancel", daemon=True)
+        _WATCHDOG.start()
+
+
+def get_cancelled(session_id: str | None = None) -> pd.DataFrame:
+    """Cancelaciones recientes (más reciente primero); `session_id` filtra una sesión."""
+
+    with _LOCK:
+        items = list(_CANCELLED)
+    if session_id is not None:
+        items = [c for c in items if c.session_id == session_id]
+    columns = list(CancelledQuery.__dataclass_fields__)
+    return pd.DataFrame([asdict(c) for c in reversed(items)], columns=columns)
+
+
+def current_session_id() -> str | None:
+    ctx = _script_ctx()
+    return str(ctx.session_id) if ctx is not None else None
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+"""Control previo de costo para rangos amplios del histórico.
+
+Nada impedía elegir todas las operativas del selector (o un rango de fechas de años) y
+lanzar en Producción una docena de recorridos de `comandas_v6_todas` (uno por sección),
+incluso en pleno servicio. Antes de consultar, `estimate_cost` anticipa cuánto recorre
+la selección y `check_cost` decide:
+
+- `ok`: rango chico, o todas las operativas cerradas con snapshot local (las secciones
+  salen de los archivos Arrow y de los rollups, sin escanear la base).
+- `confirmar`: el rango supera el límite. El dashboard no consulta hasta que se confirme
+  ("Ejecutar igual"); si todas las operativas están cerradas también se ofrece generar
+  los snapshots en segundo plano (`start_snapshot_job`) y el rango pasa a ser local.
+
+La estimación usa las comandas por operativa del índice local (`src/op_index.py`): se
+cuentan en el mismo sondeo que ya se hace para el prefiltro por fechas y las cerradas
+quedan guardadas en disco. Las que falten se sondean solo dentro del rango elegido y de a
+`COUNT_PROBE_MAX` por rerun (`get_operation_counts`); el resto se estima con la mediana.
+Por operativas, el rango sale de la cobertura de snapshots (la misma consulta memorizada
+que usan los KPIs), sin construir el índice completo. No se usa EXPLAIN: en MySQL 5.6
+materializa las subconsultas de las vistas, es decir, hace el mismo recorrido que se
+quiere evitar.
+
+Límites (comandas del rango):
+- `DASHBACK_COST_MAX_COMANDAS` (60.000; 0 = sin control).
+- `DASHBACK_COST_MAX_COMANDAS_SERVICIO` (10.000): en Producción (`mysql_prod`) durante
+  el horario de servicio `DASHBACK_SERVICE_HOURS` ("20-6" = de 20:00 a 06:00; vacío = nunca).
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from statistics import median
+from typing import Any
+
+from src.local_store import PRODUCTION_CONNECTIONS, connection_key
+from src.op_index import get_operation_counts, get_operation_index
+from src.query_store import Filters
+from src.snapshots import build_operation_snapshot, get_snapshot_coverage
+
+
+MAX_COMANDAS_ENV = "DASHBACK_COST_MAX_COMANDAS"
+MAX_COMANDAS_SERVICE_ENV = "DASHBACK_COST_MAX_COMANDAS_SERVICIO"
+SERVICE_HOURS_ENV = "DASHBACK_SERVICE_HOURS"
+
+DEFAULT_MAX_COMANDAS = 60_000
+DEFAULT_MAX_COMANDAS_SERVICE = 10_000
+DEFAULT_SERVICE_HOURS = "20-6"
+
+@dataclass(frozen=True)
+class CostEstimate:
+    """Comandas que recorrería cada sección para la selección actual."""
+
+    operaciones: tuple[int, ...]
+    comandas: int
+    # Operativas sin conteo en el índice (se estimaron con la mediana de las conocidas).
+    estimadas: int
+    cerradas: bool  # todas cerradas (23): pueden servirse desde snapshots
+    locales: bool  # todas cerradas y con snapshot: no se escanea la base
+
+
+@dataclass(frozen=True)
+class CostDecision:
+    accion: str  # 'ok' | 'confirmar'
+    estimacion: CostEstimate | None
+    limite: int
+    en_servicio: bool
+    clave: str
+
+
+@dataclass
+class SnapshotJob:
+    """Generación de snapshots en segundo plano para un rango de operativas."""
+
+    op_ini: int
+    op_fin: int
+    total: int = 0
+    hechas: int = 0
+    error: str | None = None
+    terminado: bool = False
+
+
+_LOCK = threading.Lock()
+_JOBS: dict[tuple[str, int, int], SnapshotJob] = {}
+
+
+def _int_env(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.environ.get(name) or default))
+    except ValueError:
+        return default
+
+
+def in_service_hours(now: datetime | None = None) -> bool:
+    """¿`now` cae dentro de `DASHBACK_SERVICE_HOURS`? El rango puede cruzar la medianoche."""
+
+    spec = os.environ.get(SERVICE_HOURS_ENV, DEFAULT_SERVICE_HOURS).strip()
+    start, _, end = spec.partition("-")
+    try:
+        start_h, end_h = int(start), int(end)
+    except ValueError:
+        return False
+    hour = (now or datetime.now()).hour
+    if start_h <= end_h:
+        return start_h <= hour < end_h
+    return hour >= start_h or hour < end_h
+
+
+def cost_limit(connection_name: str | None, now: datetime | None = None) -> tuple[int, bool]:
+    """(límite de comandas, ¿es el límite de horario de servicio?)."""
+
+    limit = _int_env(MAX_COMANDAS_ENV, DEFAULT_MAX_COMANDAS)
+    if connection_name in PRODUCTION_CONNECTIONS and in_service_hours(now):
+        service = _int_env(MAX_COMANDAS_SERVICE_ENV, DEFAULT_MAX_COMANDAS_SERVICE)
+        if service and (not limit or service < limit):
+            return service, True
+    return limit, False
+
+
+def selection_key(conn: Any, filters: Filters, mode: str) -> str:
+    """Identifica la selección (para recordar una confirmación en la sesión)."""
+
+    return f"{connection_key(conn)}|{mode}|{filters.op_ini}|{filters.op_fin}|{filters.dt_ini}|{filters.dt_fin}"
+
+
+def estimate_cost(conn: Any, filters: Filters, mode: str) -> CostEstimate | None:
+    """Estimación por conteos del índice local. `None` si no aplica o no se puede estimar."""
+
+    if mode == "ops" and filters.op_ini is not None and filters.op_fin is not None:
+        coverage = get_snapshot_coverage(conn, int(filters.op_ini), int(filters.op_fin))
+        ops = list(coverage.operaciones)
+        closed = set(coverage.cerradas)
+        # Solo el histórico por operativas se sirve desde snapshots (ver `_historical_snapshot`).
+        locales = coverage.covered
+    elif mode == "dates" and filters.dt_ini and filters.dt_fin:
+        index = get_operation_index(conn)
+        ids, _ = index.operations_for_dates(filters.dt_ini, filters.dt_fin)
+        ops = sorted(set(ids))
+        closed = {op for op in ops if op in index.bounds or op in index.pendientes}
+        locales = False
+    else:
+        return None
+
+    counts = get_operation_counts(conn, ops, cerradas=closed) if ops and not locales else {}
+    conocidos = list(counts.values())
+    faltan = len(ops) - len(conocidos)
+    tipico = int(median(conocidos)) if conocidos else 0
+    cerradas = bool(ops) and len(closed) == len(ops)
+    return CostEstimate(
+        operaciones=tuple(ops),
+        comandas=sum(conocidos) + faltan * tipico,
+        estimadas=faltan,
+        cerradas=cerradas,
+        locales=locales,
+    )
+
+
+def check_cost(
+    conn: Any,
+    filters: Filters,
+    mode: str,
+    *,
+    connection_name: str | None,
+    now: datetime | None = None,
+) -> CostDecision:
+    """Decide si la selección puede consultarse sin confirmación.
+
+    Una sola operativa no se controla (es el caso habitual y su costo está acotado).
+    Es una protección: si el índice falla se deja pasar, como el prefiltro por fechas.
+    """
+
+    limit, en_servicio = cost_limit(connection_name, now)
+    key = selection_key(conn, filters, mode)
+    single = mode == "ops" and filters.op_ini is not None and filters.op_ini == filters.op_fin
+    if not limit or single or mode not in ("ops", "dates"):
+        return CostDecision("ok", None, limit, en_servicio, key)
+
+    try:
+        estimate = estimate_cost(conn, filters, mode)
+    except Exception:
+        estimate = None
+    if estimate is None or estimate.locales or estimate.comandas <= limit:
+        return CostDecision("ok", estimate, limit, en_servicio, key)
+    return CostDecision("confirmar", estimate, limit, en_servicio, key)
+
+
+def _run_snapshot_job(conn: Any, job: SnapshotJob) -> None:
+    try:
+        coverage = get_snapshot_coverage(conn, job.op_ini, job.op_fin)
+        job.total = len(coverage.faltantes)
+        for op_id in coverage.faltantes:
+            build_operation_snapshot(conn, op_id)
+            job.hechas += 1
+    except Exception as exc:
+        job.error = f"{type(exc).__name__}: {exc}"
+    finally:
+        job.terminado = True
+
+
+def start_snapshot_job(conn: Any, op_ini: int, op_fin: int) -> SnapshotJob:
+    """Genera en un hilo (`dashback-snapshots`) los snapshots faltantes del rango.
+
+    Una operativa por consulta (por `id_operacion`, indexado): carga pareja y corta en
+    vez de un recorrido del rango completo por sección. Si ya hay un trabajo en curso
+    para el mismo rango se devuelve ese.
+    """
+
+    key = (connection_key(conn), int(op_ini), int(op_fin))
+    with _LOCK:
+        job = _JOBS.get(key)
+        if job is not None and not job.terminado:
+            return job
+        job = SnapshotJob(int(op_ini), int(op_fin))
+        _JOBS[key] = job
+    threading.Thread(target=_run_snapshot_job, args=(conn, job), name="dashback-snapshots", daemon=True).start()
+    return job
+
+
+def get_snapshot_job(conn: Any, op_ini: int, op_fin: int) -> SnapshotJob | None:
+    with _LOCK:
+        return _JOBS.get((connection_key(conn), int(op_ini), int(op_fin)))
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+"""Plazos por sección del dashboard (render parcial en vez de bloquear la página).
+
+`run_with_deadline(seccion, data_fn, deadline_ms=..., key=...)` corre la carga de datos de
+una sección en un hilo (`dashback-section`) y espera como máximo `deadline_ms`:
+
+- Si termina a tiempo, devuelve el resultado.
+- Si no, levanta `SectionTimeout`. La sección muestra "tardó demasiado — reintentar" y la
+  página sigue con las demás.
+- La carga no se descarta. Sigue en segundo plano hasta `deadline × SERVER_FACTOR`; a partir
+  de ahí el vigía de `src/cancellation.py` corta sus consultas con `KILL QUERY` (timeout del
+  lado del servidor). Si termina antes, el resultado queda guardado (`LATE_TTL_SECONDS`) y
+  el próximo rerun de la misma sección y filtros, p. ej. el botón "Reintentar", lo usa sin
+  volver a consultar. Lo ya cacheado en disco (particiones por día, rollups) también se
+  reutiliza.
+
+Plazo por defecto: `DASHBACK_SECTION_DEADLINE_MS` (15 s; 0 = sin plazo). Por sección:
+`DASHBACK_SECTION_DEADLINES="Línea de tiempo de ventas=30000;Top productos=8000"`.
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable
+
+from src.cancellation import QueryScope, current_session_id, query_scope
+from src.local_store import connection_key
+from src.partitions import _run_in_script_context
+
+
+DEADLINE_ENV = "DASHBACK_SECTION_DEADLINE_MS"
+DEADLINES_ENV = "DASHBACK_SECTION_DEADLINES"
+DEFAULT_DEADLINE_MS = 15_000.0
+
+# El servidor corta las consultas de la sección a `deadline × SERVER_FACTOR`.
+SERVER_FACTOR = 3.0
+# "Reintentar" amplía el plazo en pantalla.
+RETRY_FACTOR = 2.0
+
+LATE_TTL_SECONDS = 600.0
+LATE_MAX = 64
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashback-section")
+_LOCK = threading.Lock()
+_LATE: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+
+class SectionTimeout(TimeoutError):
+    """La sección no terminó dentro de su plazo."""
+
+    def __init__(self, section: str, deadline_ms: float, *, background: bool):
+        self.section = section
+        self.deadline_ms = float(deadline_ms)
+        self.background = background
+        super().__init__(f"{section}: sin resultado en {deadline_ms / 1000:.1f} s")
+
+
+def default_deadline_ms() -> float:
+    try:
+        return max(0.0, float(os.environ.get(DEADLINE_ENV) or DEFAULT_DEADLINE_MS))
+    except ValueError:
+        return DEFAULT_DEADLINE_MS
+
+
+def section_deadline_ms(section: str, default_ms: float | None) -> float | None:
+    """Plazo de `section`: override de `DASHBACK_SECTION_DEADLINES` o `default_ms`."""
+
+    for item in (os.environ.get(DEADLINES_ENV) or "").split(";"):
+        name, _, value = item.partition("=")
+        if name.strip() == section and value.strip():
+            try:
+                return float(value)
+            except ValueError:
+                break
+    return default_ms
+
+
+def call_key(section: str, data_fn: Callable[[], Any]) -> str | None:
+    """Identifica la carga (sección + función + argumentos) para reutilizar resultados tardíos.
+
+    Solo para `functools.partial` (como arma `app.py` cada sección); la conexión se
+    reemplaza por su `connection_key`. Incluye la sesión: no se comparten entre usuarios.
+    """
+
+    if not isinstance(data_fn, functools.partial):
+        return None
+    args = [connection_key(a) if hasattr(a, "query") or hasattr(a, "cursor") else a for a in data_fn.args]
+    func = getattr(data_fn.func, "__qualname__", repr(data_fn.func))
+    return f"{current_session_id()}|{section}|{func}|{args!r}|{sorted(data_fn.keywords.items())!r}"
+
+
+def _store_late(key: str, value: Any) -> None:
+    with _LOCK:
+        _LATE[key] = (time.monotonic(), value)
+        _LATE.move_to_end(key)
+        while len(_LATE) > LATE_MAX:
+            _LATE.popitem(last=False)
+
+
+def pop_late_result(key: str | None) -> tuple[bool, Any]:
+    """(True, resultado) si una carga vencida terminó en segundo plano hace menos de `LATE_TTL_SECONDS`."""
+
+    if key is None:
+        return False, None
+    with _LOCK:
+        item = _LATE.pop(key, None)
+    if item is None or time.monotonic() - item[0] > LATE_TTL_SECONDS:
+        return False, None
+    return True, item[1]
+
+
+def run_with_deadline(
+    section: str,
+    data_fn: Callable[[], Any],
+    *,
+    deadline_ms: float | None,
+    key: str | None = None,
+) -> Any:
+    """Ejecuta `data_fn` con plazo. Sin plazo (`None`/0) corre en línea como antes."""
+
+    found, value = pop_late_result(key)
+    if found:
+        return value
+    if not deadline_ms or deadline_ms <= 0:
+        return data_fn()
+
+    scope = QueryScope(deadline=time.perf_counter() + deadline_ms * SERVER_FACTOR / 1000)
+
+    def _job() -> Any:
+        with query_scope(scope):
+            return data_fn()
+
+    future: Future = _EXECUTOR.submit(_run_in_script_context(_job))
+    try:
+        return future.result(timeout=deadline_ms / 1000)
+    except FutureTimeout:
+        # Sigue en segundo plano: no se cancela por rerun, solo al vencer el plazo del servidor.
+        scope.detached = True
+        if key is not None:
+
+            def _keep(done: Future) -> None:
+                if not done.cancelled() and done.exception() is None:
+                    _store_late(key, done.result())
+
+            future.add_done_callback(_keep)
+        raise SectionTimeout(section, deadline_ms, background=key is not None) from None
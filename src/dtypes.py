@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+"""Normalización compacta de tipos para los DataFrames leídos de MySQL.
+
+Se aplica una sola vez en `fetch_dataframe`:
+
+- `DECIMAL` (objetos `Decimal`) -> `float64` (montos, cantidades).
+- ids (`id`, `id_*`, `nro_*`) enteros -> `int32` si entran en el rango y no hay NULL.
+- `fecha_emision` -> `datetime64`.
+- Textos de baja cardinalidad (`categoria`, `nombre`, `usuario_reg`, estados, ...) ->
+  `category` (un código por fila en vez de un objeto `str`).
+
+Cada normalización deja un `MemoryReport` (antes/después) en un registro en memoria
+para mostrar el ahorro por consulta en la UI.
+"""
+
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.perf import query_name
+
+
+DATETIME_COLUMNS = ("fecha_emision",)
+_ID_COLUMN_RE = re.compile(r"^(id|id_.+|nro_.+)$")
+
+# Con pocas filas el ahorro de `category` no compensa (y los agregados quedan como texto).
+CATEGORY_MIN_ROWS = 64
+CATEGORY_MAX_RATIO = 0.5
+
+MEMORY_REPORTS_MAX = 50
+
+_INT32 = np.iinfo(np.int32)
+
+
+@dataclass(frozen=True)
+class MemoryReport:
+    """Memoria de un resultado antes/después de normalizar tipos."""
+
+    consulta: str
+    filas: int
+    columnas: int
+    bytes_antes: int
+    bytes_despues: int
+    convertidas: tuple[str, ...]
+    registrado_en: datetime
+
+    @property
+    def ahorro_pct(self) -> float:
+        if self.bytes_antes <= 0:
+            return 0.0
+        return round((1 - self.bytes_despues / self.bytes_antes) * 100, 1)
+
+
+_MEMORY_REPORTS: deque[MemoryReport] = deque(maxlen=MEMORY_REPORTS_MAX)
+_LOCK = threading.Lock()
+
+
+def _compact_ids(series: pd.Series, kind: str) -> pd.Series | None:
+    if not pd.api.types.is_integer_dtype(series.dtype) and kind != "integer":
+        return None
+    if series.isna().any():
+        return None
+    values = series.astype(np.int64)
+    if values.empty or (values.min() >= _INT32.min and values.max() <= _INT32.max):
+        return values.astype(np.int32)
+    return None
+
+
+def normalize_dtypes(df: pd.DataFrame) -> tuple[pd.DataFrame, tuple[str, ...]]:
+    """Convierte columnas in-place a tipos compactos. Devuelve (df, columnas convertidas)."""
+
+    if df is None or df.empty:
+        return df, ()
+
+    converted: list[str] = []
+    n_rows = len(df)
+    for col in list(df.columns):
+        series = df[col]
+        name = str(col)
+        new: pd.Series | None = None
+        # `infer_dtype` recorre la columna en C (sin loop Python por fila).
+        kind = pd.api.types.infer_dtype(series, skipna=True) if series.dtype == object else ""
+
+        if name in DATETIME_COLUMNS:
+            if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+                new = pd.to_datetime(series, errors="coerce")
+        elif _ID_COLUMN_RE.match(name):
+            new = _compact_ids(series, kind)
+        elif kind == "decimal":
+            new = pd.to_numeric(series, errors="coerce").astype(np.float64)
+        elif kind == "string" and n_rows >= CATEGORY_MIN_ROWS:
+            if series.nunique(dropna=True) <= n_rows * CATEGORY_MAX_RATIO:
+                new = series.astype("category")
+        elif kind == "datetime" and name.startswith("fecha"):
+            new = pd.to_datetime(series, errors="coerce")
+
+        if new is not None:
+            df[col] = new
+            converted.append(name)
+
+    return df, tuple(converted)
+
+
+def normalize_fetched(df: pd.DataFrame, query: str) -> pd.DataFrame:
+    """Normaliza un resultado recién leído y registra el ahorro de memoria."""
+
+    if df is None or df.empty:
+        return df
+
+    before = int(df.memory_usage(deep=True).sum())
+    df, converted = normalize_dtypes(df)
+    after = int(df.memory_usage(deep=True).sum()) if converted else before
+
+    report = MemoryReport(
+        consulta=query_name(query),
+        filas=len(df),
+        columnas=len(df.columns),
+        bytes_antes=before,
+        bytes_despues=after,
+        convertidas=converted,
+        registrado_en=datetime.now(),
+    )
+    with _LOCK:
+        _MEMORY_REPORTS.append(report)
+    return df
+
+
+def get_memory_reports(limit: int = MEMORY_REPORTS_MAX) -> pd.DataFrame:
+    """Últimos reportes (más reciente primero) como tabla para la UI."""
+
+    with _LOCK:
+        reports = list(_MEMORY_REPORTS)[-int(limit):][::-1]
+    return pd.DataFrame(
+        [
+            {
+                "consulta": r.consulta,
+                "filas": r.filas,
+                "columnas": r.columnas,
+                "kb_antes": round(r.bytes_antes / 1024, 1),
+                "kb_despues": round(r.bytes_despues / 1024, 1),
+                "ahorro_pct": r.ahorro_pct,
+                "convertidas": ", ".join(r.convertidas),
+                "registrado_en": r.registrado_en,
+            }
+            for r in reports
+        ]
+    )
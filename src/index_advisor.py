@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+"""Asesor de índices: `EXPLAIN` de cada builder `q_*` con filtros representativos.
+
+Para una operativa de referencia (modo `ops`) y su rango de fechas (modo `dates`):
+
+1. Arma el SQL de cada builder del dashboard (`representative_cases`) y corre `EXPLAIN`
+   (formato tabular de MySQL 5.6).
+2. Marca por fila del plan: full scan (`type=ALL`), full index scan (`type=index`),
+   `Using temporary` y `Using filesort`. Los alias del plan se resuelven a tablas base
+   leyendo `information_schema.VIEWS`.
+3. Compara con `information_schema.STATISTICS` los índices que el dashboard necesita
+   (`EXPECTED_INDEXES`) y propone `ALTER TABLE ... ADD INDEX` con la reducción estimada
+   de filas (filas de la tabla / valores distintos de la primera columna, aproximados con
+   `TABLE_ROWS` de la tabla de referencia).
+
+Nota: en MySQL 5.6 `EXPLAIN` materializa las subconsultas en `FROM`; en producción
+conviene correrlo fuera de horario.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+import pandas as pd
+
+from src.query_store import (
+    Q_INDEX_STATISTICS,
+    Q_OPERATION_DATE_BOUNDS,
+    Q_OPERATIONS_IN_RANGE,
+    Q_RECENT_OPERATIONS_STATE,
+    Q_STARTUP_COMBINED,
+    Q_TABLE_ROWS,
+    Q_VIEW_DEFINITIONS,
+    Filters,
+    build_where,
+    fetch_dataframe,
+    q_cogs_por_comanda,
+    q_comanda_productos,
+    q_comandas_emision_delta,
+    q_consumo_sin_valorar,
+    q_consumo_valorizado,
+    q_detalle,
+    q_estado_operativo,
+    q_ids_comandas_anuladas,
+    q_ids_comandas_impresion_pendiente,
+    q_ids_comandas_no_impresas,
+    q_ids_comandas_pendientes,
+    q_ids_comandas_sin_estado_impresion,
+    q_kpis,
+    q_por_categoria,
+    q_por_usuario,
+    q_snapshot_items,
+    q_top_productos,
+    q_ventas_por_hora,
+    q_ventas_timeline,
+    q_wac_cogs_detalle,
+    q_wac_cogs_summary,
+)
+
+
+HISTORICAL_VIEW = "comandas_v6_todas"
+ESTADO_CERRADO = 23
+
+_VIEW_TABLE_RE = re.compile(r"`\w+`\.`(\w+)`\s+`(\w+)`")
+_SQL_TABLE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)\s+(?:AS\s+)?([A-Za-z_]\w*)", re.IGNORECASE)
+_SQL_KEYWORDS = {"on", "where", "group", "order", "left", "inner", "join", "limit", "union", "using"}
+
+
+@dataclass(frozen=True)
+class ExpectedIndex:
+    """Índice que las consultas del dashboard dan por supuesto."""
+
+    table: str
+    columns: tuple[str, ...]
+    motivo: str
+    # Tabla cuyo TABLE_ROWS aproxima los valores distintos de la primera columna.
+    distintos_de: str | None = None
+    distintos_fijos: int | None = None
+
+    @property
+    def index_name(self) -> str:
+        return f"idx_{self.table}_{'_'.join(self.columns)}"[:64]
+
+    @property
+    def ddl(self) -> str:
+        return f"ALTER TABLE {self.table} ADD INDEX {self.index_name} ({', '.join(self.columns)});"
+
+
+EXPECTED_INDEXES: tuple[ExpectedIndex, ...] = (
+    ExpectedIndex(
+        "bar_comanda",
+        ("id_operacion", "fecha", "estado_impresion"),
+        "Filtro por operativa (modo ops, prefiltro del modo fechas) y rango de fecha_emision.",
+        distintos_de="ope_operacion",
+    ),
+    ExpectedIndex(
+        "bar_detalle_comanda_salida",
+        ("id_comanda",),
+        "Join ítems → comanda en las vistas comandas_v6*.",
+        distintos_de="bar_comanda",
+    ),
+    ExpectedIndex(
+        "bar_comanda_impresion",
+        ("id_comanda",),
+        "Último estado de impresión por comanda (vw_comanda_ultima_impresion).",
+        distintos_de="bar_comanda",
+    ),
+    ExpectedIndex(
+        "ope_operacion",
+        ("estado", "estado_operacion"),
+        "Arranque: operativa activa / última cerrada (estado='HAB', estado_operacion IN ...).",
+        distintos_fijos=4,
+    ),
+)
+
+
+@dataclass(frozen=True)
+class AdvisorCase:
+    """Un SQL representativo de un builder."""
+
+    builder: str
+    modo: str
+    sql: str
+    params: dict[str, Any]
+
+
+@dataclass
+class AdvisorReport:
+    planes: pd.DataFrame
+    indices: pd.DataFrame
+    recomendaciones: pd.DataFrame
+    errores: list[tuple[str, str, str]] = field(default_factory=list)
+
+
+def default_context(conn: Any, op_id: int | None = None) -> tuple[int, str, str] | None:
+    """Operativa de referencia (por defecto la última cerrada) y el rango de fechas de sus
+    comandas; `None` si no hay."""
+
+    if op_id is None:
+        ops = fetch_dataframe(conn, Q_RECENT_OPERATIONS_STATE)
+        if ops is None or ops.empty:
+            return None
+        closed = ops[pd.to_numeric(ops["estado_operacion_id"], errors="coerce") == ESTADO_CERRADO]
+        op_id = int((closed if not closed.empty else ops)["id_operacion"].iloc[0])
+    bounds = fetch_dataframe(conn, Q_OPERATION_DATE_BOUNDS, {"op_ini": op_id, "op_fin": op_id})
+    if bounds is None or bounds.empty or pd.isna(bounds["fecha_min"].iloc[0]):
+        return None
+    dt_ini = pd.Timestamp(bounds["fecha_min"].iloc[0]).strftime("%Y-%m-%d %H:%M:%S")
+    dt_fin = pd.Timestamp(bounds["fecha_max"].iloc[0]).strftime("%Y-%m-%d %H:%M:%S")
+    return op_id, dt_ini, dt_fin
+
+
+def representative_cases(op_id: int, dt_ini: str, dt_fin: str) -> list[AdvisorCase]:
+    """SQL de cada builder para una operativa (`ops`) y su rango de fechas (`dates`)."""
+
+    view = HISTORICAL_VIEW
+    aliased = {
+        "q_kpis": lambda w: q_kpis(view, w),
+        "q_ventas_por_hora": lambda w: q_ventas_por_hora(view, w),
+        "q_ventas_timeline": lambda w: q_ventas_timeline(view, w, bucket_minutes=5),
+        "q_por_categoria": lambda w: q_por_categoria(view, w),
+        "q_top_productos": lambda w: q_top_productos(view, w, limit=20),
+        "q_por_usuario": lambda w: q_por_usuario(view, w, limit=20),
+        "q_comanda_productos": lambda w: q_comanda_productos(view, w),
+        "q_wac_cogs_summary": lambda w: q_wac_cogs_summary("vw_margen_comanda", w),
+        "q_wac_cogs_detalle": lambda w: q_wac_cogs_detalle("vw_margen_comanda", w, limit=300),
+        "q_consumo_valorizado": lambda w: q_consumo_valorizado("vw_consumo_valorizado_operativa", w, limit=300),
+        "q_consumo_sin_valorar": lambda w: q_consumo_sin_valorar("vw_consumo_insumos_operativa", w, limit=300),
+        "q_cogs_por_comanda": lambda w: q_cogs_por_comanda("vw_cogs_comanda", w, limit=300),
+    }
+    plain = {
+        "q_estado_operativo": lambda w: q_estado_operativo(view, w),
+        "q_ids_comandas_pendientes": lambda w: q_ids_comandas_pendientes(view, w),
+        "q_ids_comandas_no_impresas": lambda w: q_ids_comandas_no_impresas(view, w),
+        "q_ids_comandas_impresion_pendiente": lambda w: q_ids_comandas_impresion_pendiente(view, w),
+        "q_ids_comandas_sin_estado_impresion": lambda w: q_ids_comandas_sin_estado_impresion(view, w),
+        "q_ids_comandas_anuladas": lambda w: q_ids_comandas_anuladas(view, w),
+        "q_detalle": lambda w: q_detalle(view, w),
+        "q_comandas_emision_delta": lambda w: q_comandas_emision_delta(view, w),
+    }
+
+    cases: list[AdvisorCase] = []
+    contexts = {
+        "ops": Filters(op_ini=int(op_id), op_fin=int(op_id)),
+        "dates": Filters(dt_ini=dt_ini, dt_fin=dt_fin),
+    }
+    for modo, filters in contexts.items():
+        for builders, alias in ((aliased, "v"), (plain, None)):
+            where_sql, params = build_where(filters, modo, table_alias=alias)
+            params = {**params, "cad_ultimo_id": 0}
+            for name, build in builders.items():
+                cases.append(AdvisorCase(name, modo, build(where_sql), params))
+
+    cases.append(AdvisorCase("q_snapshot_items", "ops", q_snapshot_items(view), {"id_operacion": int(op_id)}))
+    cases.append(AdvisorCase("Q_STARTUP_COMBINED", "arranque", Q_STARTUP_COMBINED, {}))
+    cases.append(
+        AdvisorCase("Q_OPERATIONS_IN_RANGE", "arranque", Q_OPERATIONS_IN_RANGE, {"op_ini": int(op_id), "op_fin": int(op_id)})
+    )
+    cases.append(
+        AdvisorCase(
+            "Q_OPERATION_DATE_BOUNDS", "arranque", Q_OPERATION_DATE_BOUNDS, {"op_ini": int(op_id), "op_fin": int(op_id)}
+        )
+    )
+    return cases
+
+
+def _alias_map(conn: Any, cases: list[AdvisorCase]) -> dict[str, str]:
+    """alias -> tabla base (solo alias sin ambigüedad), desde vistas y desde nuestro SQL."""
+
+    candidates: dict[str, set[str]] = {}
+    views = fetch_dataframe(conn, Q_VIEW_DEFINITIONS)
+    definitions = [] if views is None or views.empty else views["VIEW_DEFINITION"].astype(str).tolist()
+    for definition in definitions:
+        for table, alias in _VIEW_TABLE_RE.findall(definition):
+            candidates.setdefault(alias, set()).add(table)
+    for case in cases:
+        for table, alias in _SQL_TABLE_RE.findall(case.sql):
+            if alias.lower() not in _SQL_KEYWORDS:
+                candidates.setdefault(alias, set()).add(table)
+    return {alias: next(iter(tables)) for alias, tables in candidates.items() if len(tables) == 1}
+
+
+def _existing_indexes(conn: Any) -> dict[str, list[tuple[str, tuple[str, ...]]]]:
+    stats = fetch_dataframe(conn, Q_INDEX_STATISTICS)
+    out: dict[str, list[tuple[str, tuple[str, ...]]]] = {}
+    if stats is None or stats.empty:
+        return out
+    stats = stats.sort_values(["TABLE_NAME", "INDEX_NAME", "SEQ_IN_INDEX"])
+    for (table, index), group in stats.groupby(["TABLE_NAME", "INDEX_NAME"], sort=False):
+        out.setdefault(str(table), []).append((str(index), tuple(str(c) for c in group["COLUMN_NAME"])))
+    return out
+
+
+def _table_rows(conn: Any) -> dict[str, int]:
+    df = fetch_dataframe(conn, Q_TABLE_ROWS)
+    if df is None or df.empty:
+        return {}
+    rows = pd.to_numeric(df["TABLE_ROWS"], errors="coerce").fillna(0).astype("int64")
+    return dict(zip(df["TABLE_NAME"].astype(str), rows.tolist()))
+
+
+def _plan_alerts(row: dict[str, Any]) -> list[str]:
+    alerts: list[str] = []
+    access = str(row.get("type") or "").upper()
+    extra = str(row.get("Extra") or "")
+    if access == "ALL":
+        alerts.append("full scan")
+    elif access == "INDEX":
+        alerts.append("full index scan")
+    if "Using temporary" in extra:
+        alerts.append("temporary")
+    if "Using filesort" in extra:
+        alerts.append("filesort")
+    return alerts
+
+
+def _prefix_match(expected: tuple[str, ...], indexes: list[tuple[str, tuple[str, ...]]]) -> tuple[int, str | None]:
+    best, best_name = 0, None
+    for name, columns in indexes:
+        n = 0
+        for a, b in zip(expected, columns):
+            if a.lower() != b.lower():
+                break
+            n += 1
+        if n > best:
+            best, best_name = n, name
+    return best, best_name
+
+
+def analyze(conn: Any, cases: list[AdvisorCase]) -> AdvisorReport:
+    """Corre `EXPLAIN` sobre cada caso y arma planes, índices y recomendaciones."""
+
+    aliases = _alias_map(conn, cases)
+    existing = _existing_indexes(conn)
+    table_rows = _table_rows(conn)
+
+    plan_rows: list[dict[str, Any]] = []
+    errors: list[tuple[str, str, str]] = []
+    for case in cases:
+        try:
+            plan = fetch_dataframe(conn, f"EXPLAIN {case.sql.strip()}", case.params)
+        except Exception as exc:
+            errors.append((case.builder, case.modo, str(exc)))
+            continue
+        if plan is None or plan.empty:
+            continue
+        for row in plan.to_dict(orient="records"):
+            alias = str(row.get("table") or "")
+            plan_rows.append(
+                {
+                    "consulta": case.builder,
+                    "modo": case.modo,
+                    "id": row.get("id"),
+                    "select_type": row.get("select_type"),
+                    "tabla": alias,
+                    "tabla_base": aliases.get(alias, alias if alias in table_rows else None),
+                    "type": row.get("type"),
+                    "key": row.get("key"),
+                    "rows": pd.to_numeric(row.get("rows"), errors="coerce"),
+                    "Extra": row.get("Extra"),
+                    "alertas": ", ".join(_plan_alerts(row)),
+                }
+            )
+    planes = pd.DataFrame(
+        plan_rows,
+        columns=["consulta", "modo", "id", "select_type", "tabla", "tabla_base", "type", "key", "rows", "Extra", "alertas"],
+    )
+
+    index_rows: list[dict[str, Any]] = []
+    recs: list[dict[str, Any]] = []
+    for spec in EXPECTED_INDEXES:
+        matched, index_name = _prefix_match(spec.columns, existing.get(spec.table, []))
+        estado = "OK" if matched == len(spec.columns) else ("parcial" if matched else "falta")
+        index_rows.append(
+            {
+                "tabla": spec.table,
+                "columnas_esperadas": ", ".join(spec.columns),
+                "estado": estado,
+                "indice_existente": index_name,
+                "columnas_cubiertas": matched,
+                "indices_tabla": "; ".join(f"{n} ({', '.join(c)})" for n, c in existing.get(spec.table, [])),
+                "motivo": spec.motivo,
+            }
+        )
+        if estado == "OK":
+            continue
+
+        on_table = planes[planes["tabla_base"] == spec.table] if not planes.empty else planes
+        affected = on_table[on_table["alertas"] != ""]
+        total = table_rows.get(spec.table)
+        distinct = table_rows.get(spec.distintos_de) if spec.distintos_de else spec.distintos_fijos
+        # Filas examinadas hoy: peor fila del plan sobre la tabla; si no aparece, toda la tabla.
+        hoy = float(on_table["rows"].max()) if on_table["rows"].notna().any() else total
+        con_indice = round(total / distinct, 1) if total and distinct else None
+        reduccion = round(max(0.0, 1 - con_indice / hoy) * 100, 1) if hoy and con_indice is not None else None
+        recs.append(
+            {
+                "tabla": spec.table,
+                "indice": spec.index_name,
+                "estado": estado,
+                "consultas_afectadas": ", ".join(sorted(set(affected["consulta"]))) if not affected.empty else "",
+                "filas_examinadas_hoy": hoy,
+                "filas_estimadas_con_indice": con_indice,
+                "reduccion_pct": reduccion,
+                "ddl": spec.ddl,
+                "motivo": spec.motivo,
+            }
+        )
+
+    recomendaciones = pd.DataFrame(
+        recs,
+        columns=[
+            "tabla",
+            "indice",
+            "estado",
+            "consultas_afectadas",
+            "filas_examinadas_hoy",
+            "filas_estimadas_con_indice",
+            "reduccion_pct",
+            "ddl",
+            "motivo",
+        ],
+    )
+    if not recomendaciones.empty:
+        recomendaciones = recomendaciones.sort_values(
+            "reduccion_pct", ascending=False, na_position="last"
+        ).reset_index(drop=True)
+    return AdvisorReport(planes=planes, indices=pd.DataFrame(index_rows), recomendaciones=recomendaciones, errores=errors)
+
+
+def run_advisor(conn: Any, *, op_id: int | None = None, dt_ini: str | None = None, dt_fin: str | None = None) -> AdvisorReport:
+    """Arma los casos (por defecto: última operativa cerrada) y analiza."""
+
+    if op_id is None or dt_ini is None or dt_fin is None:
+        context = default_context(conn, op_id)
+        if context is None:
+            raise RuntimeError("No hay operativas con comandas para armar filtros representativos.")
+        op_id = context[0]
+        dt_ini = dt_ini or context[1]
+        dt_fin = dt_fin or context[2]
+    return analyze(conn, representative_cases(int(op_id), str(dt_ini), str(dt_fin)))
+
+
+def format_report(report: AdvisorReport) -> str:
+    """Texto para consola: recomendaciones, alertas por consulta e índices esperados."""
+
+    lines: list[str] = ["== Recomendaciones"]
+    if report.recomendaciones.empty:
+        lines.append("Sin recomendaciones: los índices esperados existen.")
+    for rec in report.recomendaciones.to_dict(orient="records"):
+        estimate = ""
+        if rec["filas_estimadas_con_indice"] is not None and rec["filas_examinadas_hoy"]:
+            estimate = f" · ~{rec['filas_examinadas_hoy']:,.0f} → ~{rec['filas_estimadas_con_indice']:,.0f} filas"
+            if rec["reduccion_pct"] is not None:
+                estimate += f" (-{rec['reduccion_pct']}%)"
+        lines.append(f"[{rec['estado']}] {rec['ddl']}{estimate}")
+        lines.append(f"    {rec['motivo']}")
+        if rec["consultas_afectadas"]:
+            lines.append(f"    afecta: {rec['consultas_afectadas']}")
+
+    lines.append("")
+    lines.append("== Alertas de planes")
+    alerts = report.planes[report.planes["alertas"] != ""] if not report.planes.empty else report.planes
+    if alerts.empty:
+        lines.append("Sin full scans ni temporary/filesort.")
+    for row in alerts.to_dict(orient="records"):
+        table = row["tabla_base"] or row["tabla"]
+        lines.append(f"{row['consulta']} [{row['modo']}] {table}: {row['alertas']} (~{row['rows']} filas)")
+
+    lines.append("")
+    lines.append("== Índices esperados")
+    for row in report.indices.to_dict(orient="records"):
+        lines.append(f"{row['estado']:>7}  {row['tabla']}({row['columnas_esperadas']})  existentes: {row['indices_tabla'] or '-'}")
+
+    if report.errores:
+        lines.append("")
+        lines.append("== Errores de EXPLAIN")
+        for builder, modo, error in report.errores:
+            lines.append(f"{builder} [{modo}]: {error}")
+    return "\n".join(lines)
+
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+"""Watcher del ciclo de vida de operativas (22 → 24 → 23).
+
+Un hilo en segundo plano consulta cada `POLL_INTERVAL_SECONDS` el estado de las
+últimas operativas (`Q_RECENT_OPERATIONS_STATE`, por PK). Cuando una operativa pasa
+a CERRADO (23):
+
+1. genera su snapshot Arrow (`src/snapshots.py`),
+2. genera su rollup de KPIs + P&L (`src/rollups.py`),
+3. precalienta caches (índice operativa → fechas, contexto de arranque, cobertura),
+4. registra tiempos en `.cache/<conexión>/lifecycle/cierres.jsonl`.
+
+Así, quien abre el dashboard al día siguiente ve el histórico de la última cerrada
+sin consultar las vistas. Si el proceso no estaba corriendo al momento del cierre,
+el primer sondeo procesa la última cerrada si todavía no tiene rollup.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+import streamlit as st
+
+from src.local_store import connection_key, store_dir
+from src.op_index import forget_operation_index, get_operation_index
+from src.query_store import Q_RECENT_OPERATIONS_STATE, fetch_dataframe
+from src.rollups import build_operation_rollup, forget_covered_ranges as forget_rollup_ranges
+from src.rollups import has_rollup, load_rollup_range
+from src.snapshots import build_operation_snapshot, forget_covered_ranges, load_snapshot_range
+from src.startup import add_transition_listener, invalidate_startup_cache
+
+
+POLL_INTERVAL_SECONDS = 30.0
+WATCHER_ENV = "DASHBACK_LIFECYCLE_WATCHER"  # "0" desactiva el watcher
+
+ESTADO_EN_PROCESO = 22
+ESTADO_INICIO_CIERRE = 24
+ESTADO_CERRADO = 23
+
+
+def _close_log_path(conn: Any):
+    return store_dir(conn, "lifecycle") / "cierres.jsonl"
+
+
+def _append_close_log(conn: Any, event: dict[str, Any]) -> None:
+    with open(_close_log_path(conn), "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+
+def read_close_log(conn: Any, limit: int = 50) -> pd.DataFrame:
+    """Últimos eventos de cierre procesados (más reciente primero)."""
+
+    path = _close_log_path(conn)
+    if not path.exists():
+        return pd.DataFrame()
+    with open(path, encoding="utf-8") as fh:
+        rows = [json.loads(line) for line in fh if line.strip()]
+    return pd.DataFrame(rows[-int(limit):][::-1])
+
+
+def process_closed_operation(
+    conn: Any,
+    operacion_id: int,
+    *,
+    reason: str = "transicion",
+    cierre_s: float | None = None,
+) -> dict[str, Any]:
+    """Ejecuta los trabajos de cierre de una operativa y registra sus tiempos."""
+
+    event: dict[str, Any] = {
+        "id_operacion": int(operacion_id),
+        "motivo": reason,
+        "detectado_en": datetime.now().isoformat(timespec="seconds"),
+        "cierre_s": round(cierre_s, 1) if cierre_s is not None else None,
+    }
+    t0 = time.perf_counter()
+    try:
+        event["snapshot_filas"] = build_operation_snapshot(conn, operacion_id)
+        t1 = time.perf_counter()
+        event["snapshot_s"] = round(t1 - t0, 3)
+
+        rollup = build_operation_rollup(conn, operacion_id)
+        t2 = time.perf_counter()
+        event["rollup_s"] = round(t2 - t1, 3)
+        event["pnl_disponible"] = bool(rollup.get("pnl_disponible"))
+
+        # Precalentar lo que usa el primer rerun en modo histórico.
+        invalidate_startup_cache(conn)
+        forget_operation_index(conn)
+        # El rango que incluye la operativa dejó de estar "abierto": releer su estado.
+        forget_covered_ranges()
+        forget_rollup_ranges()
+        get_operation_index(conn)
+        load_snapshot_range(conn, operacion_id, operacion_id)
+        load_rollup_range(conn, operacion_id, operacion_id)
+        event["warm_s"] = round(time.perf_counter() - t2, 3)
+    except Exception as exc:
+        event["error"] = f"{type(exc).__name__}: {exc}"
+    event["total_s"] = round(time.perf_counter() - t0, 3)
+
+    _append_close_log(conn, event)
+    return event
+
+
+class OperationLifecycleWatcher:
+    """Sondea el estado de las últimas operativas y procesa los cierres detectados."""
+
+    def __init__(self, conn: Any, *, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.conn = conn
+        self.poll_interval = float(poll_interval)
+        self._states: dict[int, int] = {}
+        self._inicio_cierre: dict[int, float] = {}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def poll_once(self) -> list[dict[str, Any]]:
+        """Un ciclo de sondeo. Devuelve los eventos de cierre procesados."""
+
+        df = fetch_dataframe(self.conn, Q_RECENT_OPERATIONS_STATE)
+        current: dict[int, int] = {}
+        if df is not None and not df.empty:
+            for row in df.to_dict(orient="records"):
+                estado = row.get("estado_operacion_id")
+                if estado is not None:
+                    current[int(row["id_operacion"])] = int(estado)
+
+        first_poll = not self._states
+        now = time.monotonic()
+        events: list[dict[str, Any]] = []
+        for op_id, estado in sorted(current.items()):
+            previous = self._states.get(op_id)
+            if estado == ESTADO_INICIO_CIERRE:
+                self._inicio_cierre.setdefault(op_id, now)
+            if estado == ESTADO_CERRADO and previous in (ESTADO_EN_PROCESO, ESTADO_INICIO_CIERRE):
+                started = self._inicio_cierre.pop(op_id, None)
+                events.append(
+                    process_closed_operation(
+                        self.conn,
+                        op_id,
+                        cierre_s=(now - started) if started is not None else None,
+                    )
+                )
+
+        if first_poll:
+            cerradas = [op for op, estado in current.items() if estado == ESTADO_CERRADO]
+            if cerradas and not has_rollup(self.conn, max(cerradas)):
+                events.append(process_closed_operation(self.conn, max(cerradas), reason="pendiente"))
+
+        self._states = current
+        return events
+
+    def wake(self) -> None:
+        """Adelanta el próximo sondeo (p.ej. cuando el startup detecta una transición)."""
+
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as exc:
+                _append_close_log(
+                    self.conn,
+                    {
+                        "motivo": "error_sondeo",
+                        "detectado_en": datetime.now().isoformat(timespec="seconds"),
+                        "error": f"{type(exc).__name__}: {exc}",
+                    },
+                )
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dashback-lifecycle", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+
+@st.cache_resource(show_spinner=False)
+def _watcher_for(key: str, _conn: Any) -> OperationLifecycleWatcher:
+    # Un watcher por conexión y por proceso (compartido entre sesiones de Streamlit).
+    watcher = OperationLifecycleWatcher(_conn)
+
+    def _on_transition(conn: Any, previous: Any, current: Any) -> None:
+        if connection_key(conn) == key:
+            watcher.wake()
+
+    add_transition_listener(_on_transition)
+    watcher.start()
+    return watcher
+
+
+def ensure_lifecycle_watcher(conn: Any) -> OperationLifecycleWatcher | None:
+    """Arranca (una vez) el watcher de la conexión. `None` si está desactivado o no aplica.
+
+    Solo con `SQLConnection`: el pool de SQLAlchemy permite consultar desde otro hilo.
+    """
+
+    if os.environ.get(WATCHER_ENV, "1") == "0" or not hasattr(conn, "query"):
+        return None
+    return _watcher_for(connection_key(conn), conn)
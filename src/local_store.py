@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+"""Almacenamiento local (disco) para artefactos derivados de la base.
+
+Todo lo que se guarda aquí se deriva de datos que ya no cambian (operativas
+cerradas, días completos con todas sus operativas cerradas). La base sigue siendo la fuente de verdad:
+borrar el directorio de cache solo obliga a recalcular.
+
+Estructura:
+    <cache_root>/<connection_key>/<categoria>/...
+
+`connection_key` separa Local (`mysql`) de Producción (`mysql_prod`) para que
+los artefactos de una base nunca se mezclen con los de otra.
+"""
+
+import contextlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from src.perf import record_cache_hit
+
+
+CACHE_DIR_ENV = "DASHBACK_CACHE_DIR"
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+# Conexiones que atienden al bar (Producción): límites y trabajo de fondo más conservadores.
+PRODUCTION_CONNECTIONS = ("mysql_prod",)
+
+
+def cache_root() -> Path:
+    """Directorio raíz del cache local (configurable vía `DASHBACK_CACHE_DIR`)."""
+
+    return Path(os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR)
+
+
+def connection_key(conn: Any) -> str:
+    """Identificador estable (y seguro como nombre de carpeta) de la conexión.
+
+    - `SQLConnection`: nombre de la conexión en secrets (`mysql`, `mysql_prod`).
+    - `mysql.connector`: nombre de la base (`conn.database`).
+    """
+
+    name = getattr(conn, "_connection_name", None) or getattr(conn, "database", None) or "default"
+    return _UNSAFE_CHARS_RE.sub("_", str(name)) or "default"
+
+
+def is_production(conn: Any) -> bool:
+    """¿`conn` es la base que atiende el bar (`PRODUCTION_CONNECTIONS`)?"""
+
+    return connection_key(conn) in PRODUCTION_CONNECTIONS
+
+
+def store_dir(conn: Any, *parts: str) -> Path:
+    """Devuelve (y crea si no existe) un subdirectorio del cache para la conexión."""
+
+    path = cache_root().joinpath(connection_key(conn), *parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_arrow(path: Path, table: pa.Table) -> None:
+    """Escribe una tabla como Arrow IPC (formato archivo) de forma atómica.
+
+    Se escribe a un temporal y luego se renombra: un lector concurrente nunca ve
+    un archivo a medio escribir. El temporal es único por escritor (dos sesiones, o el
+    watcher de cierres y un rerun, pueden escribir el mismo archivo a la vez): gana el
+    último `os.replace`, siempre con un archivo completo.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def _cache_kind(path: Path) -> str:
+    try:
+        parts = path.resolve().relative_to(cache_root().resolve()).parts
+    except ValueError:
+        return "local"
+    return parts[1] if len(parts) > 2 else "local"
+
+
+def read_arrow(path: Path, *, record: bool = True) -> pa.Table | None:
+    """Abre un archivo Arrow IPC con memory mapping (zero-copy).
+
+    Los buffers de la tabla apuntan directamente al archivo mapeado: no se copia
+    a RAM hasta que algo (p.ej. `to_pandas`) lo materializa. Cada lectura queda como
+    acierto de cache en `src/perf.py` (`record=False` para no contarla).
+    """
+
+    if not path.exists():
+        return None
+    source = pa.memory_map(str(path), "r")
+    table = ipc.open_file(source).read_all()
+    if record:
+        record_cache_hit(_cache_kind(path), filas=table.num_rows, nbytes=table.nbytes)
+    return table
@@ -8,7 +8,8 @@ from src.query_store import (
 	Filters,
 	build_where,
 	fetch_dataframe,
-	q_comandas_emision_times,
+	q_comanda_productos,
+	q_comandas_emision_delta,
 	q_impresion_snapshot,
 	q_ids_comandas_anuladas,
 	q_ids_comandas_impresion_pendiente,
@@ -27,7 +28,27 @@ from src.query_store import (
 	q_consumo_sin_valorar,
 	q_cogs_por_comanda,
 	q_ventas_por_hora,
+	q_ventas_timeline,
 )
+from src.baskets import basket_rules, get_basket_counts
+from src.cadence import get_cadence
+from src.partitions import fetch_day_partitions, merge_day_partitions
+from src.rollups import KPI_SUM_COLUMNS, PNL_VIEW, load_rollup_range, operation_series, rollup_pnl
+from src.snapshots import (
+	SNAPSHOT_VIEW,
+	cached_snapshot_coverage,
+	get_snapshot_coverage,
+	load_snapshot_range,
+	snapshot_emision_times,
+	snapshot_estado_operativo,
+	snapshot_kpis,
+	snapshot_por_categoria,
+	snapshot_por_usuario,
+	snapshot_top_productos,
+	snapshot_ventas_por_hora,
+	snapshot_ventas_timeline,
+)
+from src.startup import get_startup_generation
 
 
 class QueryExecutionError(RuntimeError):
@@ -58,6 +79,68 @@ def _run_df(conn: Any, sql: str, params: dict[str, Any], *, context: str):
 		raise QueryExecutionError(context, sql=sql, params=params, original_exc=exc) from exc
 
 
+def _historical_snapshot(conn: Any, view_name: str, filters: Filters, mode: str):
+	"""Tabla Arrow (memory-mapped) del rango si está cerrado y cubierto por snapshots.
+
+	Solo aplica al histórico por operativas (`comandas_v6_todas` + `mode='ops'`).
+	Ante cualquier problema con el cache local se devuelve `None` y se usa SQL.
+	"""
+
+	if mode != "ops" or view_name != SNAPSHOT_VIEW:
+		return None
+	try:
+		return load_snapshot_range(conn, filters.op_ini, filters.op_fin)
+	except Exception:
+		return None
+
+
+def _known_closed_range(conn: Any, filters: Filters) -> bool:
+	"""¿El rango ya se verificó (en este rerun o hace poco) como todo cerrado?
+
+	Sin consultar: en tiempo real la vista P&L es la misma que en histórico y el rango incluye
+	la operativa abierta, así que probar rollups costaría un `Q_OPERATIONS_IN_RANGE` por rerun.
+	En histórico la cobertura ya la resolvieron los KPIs del mismo rerun.
+	"""
+
+	if filters.op_ini is None or filters.op_fin is None:
+		return False
+	coverage = cached_snapshot_coverage(conn, int(filters.op_ini), int(filters.op_fin))
+	return coverage is not None and bool(coverage.operaciones) and len(coverage.cerradas) == len(coverage.operaciones)
+
+
+def _day_partitions(
+	conn: Any,
+	name: str,
+	view_name: str,
+	filters: Filters,
+	build_sql,
+	*,
+	context: str,
+	table_alias: str | None = None,
+) -> pd.DataFrame:
+	"""Filas por día (`dia`) del rango `dates`, con días pasados cacheados en disco."""
+
+	return fetch_day_partitions(
+		conn,
+		name=name,
+		view_name=view_name,
+		filters=filters,
+		build_sql=build_sql,
+		run_df=lambda sql, params: _run_df(conn, sql, params, context=context),
+		table_alias=table_alias,
+	)
+
+
+def _with_ticket(df: pd.DataFrame, total_col: str, comandas_col: str, ticket_col: str) -> pd.DataFrame:
+	"""Recalcula el ticket promedio tras sumar días (el promedio no es aditivo)."""
+
+	if df is None or df.empty:
+		return df
+	comandas = pd.to_numeric(df[comandas_col], errors="coerce")
+	df[ticket_col] = (pd.to_numeric(df[total_col], errors="coerce") / comandas.where(comandas > 0)).round(2)
+	return df
+
+
 def _to_float(value: Any) -> float:
 	if value is None:
 		return 0.0
@@ -83,9 +166,40 @@ def get_kpis(conn: Any, view_name: str, filters: Filters, mode: str) -> dict[str
 	- `mode='ops'|'dates'`: histórico con filtros
 	"""
 
-	where_sql, params = build_where(filters, mode, table_alias="v")
-	sql = q_kpis(view_name, where_sql)
-	df = _run_df(conn, sql, params, context="Error ejecutando KPIs")
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		df = pd.DataFrame([snapshot_kpis(snap)])
+	elif mode == "dates":
+		days = _day_partitions(
+			conn,
+			"kpis",
+			view_name,
+			filters,
+			lambda where_sql: q_kpis(view_name, where_sql, by_day=True),
+			context="Error ejecutando KPIs",
+			table_alias="v",
+		)
+		df = merge_day_partitions(
+			days,
+			[],
+			[
+				"total_vendido",
+				"total_comandas",
+				"items_vendidos",
+				"total_vendido_impreso_log",
+				"total_comandas_impreso_log",
+				"items_vendidos_impreso_log",
+				"total_cortesia",
+				"items_cortesia",
+				"comandas_cortesia",
+			],
+		)
+		df = _with_ticket(df, "total_vendido", "total_comandas", "ticket_promedio")
+		df = _with_ticket(df, "total_vendido_impreso_log", "total_comandas_impreso_log", "ticket_promedio_impreso_log")
+	else:
+		where_sql, params = build_where(filters, mode, table_alias="v")
+		sql = q_kpis(view_name, where_sql)
+		df = _run_df(conn, sql, params, context="Error ejecutando KPIs")
 
 	if df is None or df.empty:
 		return {
@@ -133,6 +247,15 @@ def get_wac_cogs_summary(
 	- margen_pct: margen % (0-100)
 	"""
 
+	if mode == "ops" and view_name == PNL_VIEW and _known_closed_range(conn, filters):
+		# Operativas cerradas con rollup (generado al cierre): no se consulta la vista.
+		try:
+			pnl = rollup_pnl(load_rollup_range(conn, filters.op_ini, filters.op_fin))
+		except Exception:
+			pnl = None
+		if pnl is not None:
+			return pnl
+
 	where_sql, params = build_where(filters, mode, table_alias="v")
 	sql = q_wac_cogs_summary(view_name, where_sql)
 	df = _run_df(conn, sql, params, context="Error ejecutando P&L (WAC/COGS)")
@@ -154,6 +277,153 @@ def get_wac_cogs_summary(
 	}
 
 
+# Tope de operativas en la tendencia (las más recientes del rango).
+TREND_MAX_OPERATIONS = 120
+
+
+def _with_operation_ratios(df: pd.DataFrame) -> pd.DataFrame:
+	df = _with_ticket(df, "total_vendido", "total_comandas", "ticket_promedio")
+	df = _with_ticket(df, "total_vendido_impreso_log", "total_comandas_impreso_log", "ticket_promedio_impreso_log")
+	ventas = pd.to_numeric(df["total_ventas"], errors="coerce")
+	df["margen_pct"] = (pd.to_numeric(df["total_margen"], errors="coerce") / ventas.where(ventas > 0) * 100).round(2)
+	return df
+
+
+def get_kpis_por_operacion(
+	conn: Any,
+	view_name: str,
+	filters: Filters,
+	mode: str,
+	*,
+	max_operations: int = TREND_MAX_OPERATIONS,
+) -> pd.DataFrame:
+	"""KPIs, cortesías y P&L por operativa (una fila por `id_operacion`) para tendencias.
+
+	En histórico por operativas, las cerradas salen de rollups (`src/rollups.py`) y el
+	resto de una sola consulta agrupada por operativa (más una para el P&L). En otros
+	modos se agrupa directamente el contexto actual.
+	"""
+
+	def fetch_kpis(where_sql: str, params: dict[str, Any]) -> pd.DataFrame:
+		return _run_df(
+			conn, q_kpis(view_name, where_sql, by_operation=True), params, context="Error ejecutando KPIs por operativa"
+		)
+
+	def fetch_pnl(where_sql: str, params: dict[str, Any]) -> pd.DataFrame:
+		return _run_df(
+			conn,
+			q_wac_cogs_summary(PNL_VIEW, where_sql, by_operation=True),
+			params,
+			context="Error ejecutando P&L por operativa",
+		)
+
+	if mode == "ops" and view_name == SNAPSHOT_VIEW and filters.op_ini is not None and filters.op_fin is not None:
+		coverage = get_snapshot_coverage(conn, int(filters.op_ini), int(filters.op_fin))
+		op_ids = list(coverage.operaciones)[-int(max_operations):]
+
+		def by_range(fetch):
+			def run(op_ini: int, op_fin: int) -> pd.DataFrame:
+				where_sql, params = build_where(Filters(op_ini=op_ini, op_fin=op_fin), "ops", table_alias="v")
+				return fetch(where_sql, params)
+
+			return run
+
+		df = operation_series(
+			conn,
+			op_ids,
+			set(coverage.cerradas),
+			fetch_kpis=by_range(fetch_kpis),
+			fetch_pnl=by_range(fetch_pnl),
+		)
+	else:
+		where_sql, params = build_where(filters, mode, table_alias="v")
+		df = fetch_kpis(where_sql, params)
+		if df is None or df.empty:
+			return pd.DataFrame()
+		try:
+			pnl = fetch_pnl(where_sql, params)
+			df = df.merge(pnl, on="id_operacion", how="left", suffixes=("", "_pnl"))
+			df["pnl_disponible"] = True
+		except Exception:
+			df["pnl_disponible"] = False
+		for col in ("total_ventas", "total_cogs", "total_margen"):
+			df[col] = pd.to_numeric(df.get(col), errors="coerce").fillna(0.0) if col in df else 0.0
+		df = df.tail(int(max_operations)).reset_index(drop=True)
+
+	if df is None or df.empty:
+		return pd.DataFrame()
+	return _with_operation_ratios(df)
+
+
+KPI_SPARK_OPERATIONS = 12
+
+
+def get_kpis_recientes(
+	conn: Any,
+	filters: Filters,
+	mode: str,
+	current: dict[str, Any] | None = None,
+	*,
+	n: int = KPI_SPARK_OPERATIONS,
+) -> pd.DataFrame:
+	"""KPIs de las últimas `n` operativas hasta la del contexto (sparklines y deltas del bloque KPIs).
+
+	- Las operativas anteriores salen de rollups (`operation_series`): se consultan una
+	  sola vez (agrupadas) y luego se leen de disco.
+	- Si el contexto es una sola operativa y se pasa `current` (resultado de `get_kpis`),
+	  esa es la última fila: la operativa en curso no se vuelve a consultar.
+	- Por fechas, la referencia es la última operativa del prefiltro; sin operativa de
+	  referencia se devuelve un DataFrame vacío.
+	"""
+
+	if mode == "ops" and filters.op_fin is not None:
+		op_fin = int(filters.op_fin)
+		single = filters.op_ini is not None and int(filters.op_ini) == op_fin
+	elif mode == "dates" and filters.op_prefilter is not None and filters.op_prefilter[1] is not None:
+		op_fin = int(filters.op_prefilter[1])
+		single = False
+	else:
+		return pd.DataFrame()
+
+	use_current = single and current is not None
+	# Margen para ids salteados (operativas no HAB); luego se toman las últimas `n`.
+	coverage = get_snapshot_coverage(conn, max(op_fin - 2 * int(n), 0), op_fin)
+	op_ids = [op for op in coverage.operaciones if op < op_fin or (op == op_fin and not use_current)]
+	op_ids = op_ids[-(int(n) - 1 if use_current else int(n)):]
+
+	def fetch(build_sql, context: str):
+		def run(op_ini: int, op_fin: int) -> pd.DataFrame:
+			where_sql, params = build_where(Filters(op_ini=op_ini, op_fin=op_fin), "ops", table_alias="v")
+			return _run_df(conn, build_sql(where_sql), params, context=context)
+
+		return run
+
+	df = (
+		operation_series(
+			conn,
+			op_ids,
+			set(coverage.cerradas),
+			fetch_kpis=fetch(
+				lambda w: q_kpis(SNAPSHOT_VIEW, w, by_operation=True), "Error ejecutando KPIs por operativa"
+			),
+			fetch_pnl=fetch(
+				lambda w: q_wac_cogs_summary(PNL_VIEW, w, by_operation=True), "Error ejecutando P&L por operativa"
+			),
+		)
+		if op_ids
+		else pd.DataFrame()
+	)
+
+	if use_current:
+		row = {"id_operacion": op_fin, **{k: v for k, v in current.items() if k in KPI_SUM_COLUMNS}}
+		df = pd.concat([df, pd.DataFrame([row])], ignore_index=True) if not df.empty else pd.DataFrame([row])
+
+	if df.empty:
+		return df
+	df = _with_ticket(df, "total_vendido", "total_comandas", "ticket_promedio")
+	return _with_ticket(df, "total_vendido_impreso_log", "total_comandas_impreso_log", "ticket_promedio_impreso_log")
+
+
 def get_wac_cogs_detalle(
 	conn: Any,
 	view_name: str,
@@ -224,9 +494,32 @@ def get_estado_operativo(conn: Any, view_name: str, filters: Filters, mode: str)
 	Se apoya en los campos humanizados de la vista: `estado_comanda` y `estado_impresion`.
 	"""
 
-	where_sql, params = build_where(filters, mode)
-	sql = q_estado_operativo(view_name, where_sql)
-	df = _run_df(conn, sql, params, context="Error ejecutando estado operativo")
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		df = pd.DataFrame([snapshot_estado_operativo(snap)])
+	elif mode == "dates":
+		days = _day_partitions(
+			conn,
+			"estado_operativo",
+			view_name,
+			filters,
+			lambda where_sql: q_estado_operativo(view_name, where_sql, by_day=True),
+			context="Error ejecutando estado operativo",
+		)
+		df = merge_day_partitions(
+			days,
+			[],
+			[
+				"comandas_pendientes",
+				"comandas_anuladas",
+				"comandas_impresion_pendiente",
+				"comandas_sin_estado_impresion",
+			],
+		)
+	else:
+		where_sql, params = build_where(filters, mode)
+		sql = q_estado_operativo(view_name, where_sql)
+		df = _run_df(conn, sql, params, context="Error ejecutando estado operativo")
 
 	if df is None or df.empty:
 		return {
@@ -380,11 +673,105 @@ def get_ventas_por_hora(
 ):
 	"""Ventas por hora (para gráfico)."""
 
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		return snapshot_ventas_por_hora(snap, use_impresion_log=use_impresion_log)
+	if mode == "dates":
+		days = _day_partitions(
+			conn,
+			f"ventas_por_hora_log{int(use_impresion_log)}",
+			view_name,
+			filters,
+			lambda where_sql: q_ventas_por_hora(
+				view_name, where_sql, use_impresion_log=use_impresion_log, by_day=True
+			),
+			context="Error ejecutando ventas por hora",
+			table_alias="v",
+		)
+		df = merge_day_partitions(days, ["hora"], ["total_vendido", "comandas", "items"])
+		return df.sort_values("hora").reset_index(drop=True)
+
 	where_sql, params = build_where(filters, mode, table_alias="v")
 	sql = q_ventas_por_hora(view_name, where_sql, use_impresion_log=use_impresion_log)
 	return _run_df(conn, sql, params, context="Error ejecutando ventas por hora")
 
 
+# Sobre este tamaño no se rellenan los tramos sin ventas (rango demasiado largo).
+TIMELINE_MAX_FILLED_BUCKETS = 200_000
+
+
+def _timeline_frame(df: pd.DataFrame, bucket_minutes: int) -> pd.DataFrame:
+	"""`dia/hora/minuto` -> `momento` continuo; los tramos sin ventas quedan en 0."""
+
+	cols = ["momento", "total_vendido", "comandas", "items"]
+	if df is None or df.empty:
+		return pd.DataFrame(columns=cols)
+
+	momento = (
+		pd.to_datetime(df["dia"])
+		+ pd.to_timedelta(pd.to_numeric(df["hora"]), unit="h")
+		+ pd.to_timedelta(pd.to_numeric(df["minuto"]), unit="m")
+	)
+	out = pd.DataFrame(
+		{
+			"momento": momento.to_numpy(),
+			"total_vendido": pd.to_numeric(df["total_vendido"], errors="coerce").fillna(0.0).to_numpy(),
+			"comandas": pd.to_numeric(df["comandas"], errors="coerce").fillna(0).to_numpy(),
+			"items": pd.to_numeric(df["items"], errors="coerce").fillna(0.0).to_numpy(),
+		}
+	)
+	# Partición por día: un mismo tramo no se repite entre días, pero se agrupa por seguridad.
+	out = out.groupby("momento", sort=True, as_index=False).sum()
+
+	freq = pd.Timedelta(minutes=int(bucket_minutes))
+	n_buckets = (out["momento"].iloc[-1] - out["momento"].iloc[0]) // freq + 1
+	if n_buckets <= TIMELINE_MAX_FILLED_BUCKETS:
+		full = pd.date_range(out["momento"].iloc[0], out["momento"].iloc[-1], freq=freq)
+		out = out.set_index("momento").reindex(full, fill_value=0).rename_axis("momento").reset_index()
+	return out[cols]
+
+
+def get_ventas_timeline(
+	conn: Any,
+	view_name: str,
+	filters: Filters,
+	mode: str,
+	*,
+	bucket_minutes: int = 5,
+	use_impresion_log: bool = False,
+):
+	"""Línea de tiempo de ventas por tramo de `bucket_minutes` (momento, total_vendido, comandas, items).
+
+	A diferencia de `get_ventas_por_hora`, no mezcla noches distintas en las mismas 24 horas.
+	"""
+
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		df = snapshot_ventas_timeline(snap, bucket_minutes=bucket_minutes, use_impresion_log=use_impresion_log)
+		return _timeline_frame(df, bucket_minutes)
+
+	def build_sql(where_sql: str) -> str:
+		return q_ventas_timeline(
+			view_name, where_sql, bucket_minutes=bucket_minutes, use_impresion_log=use_impresion_log
+		)
+
+	if mode == "dates":
+		df = _day_partitions(
+			conn,
+			f"ventas_timeline_{int(bucket_minutes)}m_log{int(use_impresion_log)}",
+			view_name,
+			filters,
+			build_sql,
+			context="Error ejecutando línea de tiempo de ventas",
+			table_alias="v",
+		)
+		return _timeline_frame(df, bucket_minutes)
+
+	where_sql, params = build_where(filters, mode, table_alias="v")
+	df = _run_df(conn, build_sql(where_sql), params, context="Error ejecutando línea de tiempo de ventas")
+	return _timeline_frame(df, bucket_minutes)
+
+
 def get_ventas_por_categoria(
 	conn: Any,
 	view_name: str,
@@ -395,6 +782,24 @@ def get_ventas_por_categoria(
 ):
 	"""Ventas por categoría (para gráfico)."""
 
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		return snapshot_por_categoria(snap, use_impresion_log=use_impresion_log)
+	if mode == "dates":
+		days = _day_partitions(
+			conn,
+			f"por_categoria_log{int(use_impresion_log)}",
+			view_name,
+			filters,
+			lambda where_sql: q_por_categoria(
+				view_name, where_sql, use_impresion_log=use_impresion_log, by_day=True
+			),
+			context="Error ejecutando ventas por categoría",
+			table_alias="v",
+		)
+		df = merge_day_partitions(days, ["categoria"], ["total_vendido", "unidades", "comandas"])
+		return df.sort_values("total_vendido", ascending=False, kind="stable").reset_index(drop=True)
+
 	where_sql, params = build_where(filters, mode, table_alias="v")
 	sql = q_por_categoria(view_name, where_sql, use_impresion_log=use_impresion_log)
 	return _run_df(conn, sql, params, context="Error ejecutando ventas por categoría")
@@ -411,6 +816,26 @@ def get_ventas_por_usuario(
 ):
 	"""Ventas por usuario (ranking)."""
 
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		return snapshot_por_usuario(snap, limit=limit, use_impresion_log=use_impresion_log)
+	if mode == "dates":
+		days = _day_partitions(
+			conn,
+			f"por_usuario_log{int(use_impresion_log)}",
+			view_name,
+			filters,
+			lambda where_sql: q_por_usuario(
+				view_name, where_sql, limit=None, use_impresion_log=use_impresion_log, by_day=True
+			),
+			context="Error ejecutando ventas por usuario",
+			table_alias="v",
+		)
+		df = merge_day_partitions(days, ["usuario_reg"], ["total_vendido", "comandas", "items"])
+		df = _with_ticket(df, "total_vendido", "comandas", "ticket_promedio")
+		df = df.sort_values("total_vendido", ascending=False, kind="stable").head(int(limit))
+		return df.reset_index(drop=True)
+
 	where_sql, params = build_where(filters, mode, table_alias="v")
 	sql = q_por_usuario(view_name, where_sql, limit=limit, use_impresion_log=use_impresion_log)
 	return _run_df(conn, sql, params, context="Error ejecutando ventas por usuario")
@@ -427,11 +852,56 @@ def get_top_productos(
 ):
 	"""Top productos por total vendido (para gráfico)."""
 
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	if snap is not None:
+		return snapshot_top_productos(snap, limit=limit, use_impresion_log=use_impresion_log)
+	if mode == "dates":
+		days = _day_partitions(
+			conn,
+			f"top_productos_log{int(use_impresion_log)}",
+			view_name,
+			filters,
+			lambda where_sql: q_top_productos(
+				view_name, where_sql, limit=None, use_impresion_log=use_impresion_log, by_day=True
+			),
+			context="Error ejecutando top productos",
+			table_alias="v",
+		)
+		df = merge_day_partitions(days, ["nombre", "categoria"], ["unidades", "total_vendido"])
+		df = df.sort_values("total_vendido", ascending=False, kind="stable").head(int(limit))
+		return df.reset_index(drop=True)
+
 	where_sql, params = build_where(filters, mode, table_alias="v")
 	sql = q_top_productos(view_name, where_sql, limit=limit, use_impresion_log=use_impresion_log)
 	return _run_df(conn, sql, params, context="Error ejecutando top productos")
 
 
+def get_basket_analysis(
+	conn: Any,
+	view_name: str,
+	filters: Filters,
+	mode: str,
+	*,
+	min_comandas: int = 3,
+	limit: int = 50,
+	use_impresion_log: bool = False,
+) -> tuple[pd.DataFrame, int]:
+	"""Pares de productos pedidos juntos (soporte/confianza/lift). Devuelve (pares, comandas analizadas)."""
+
+	counts = get_basket_counts(
+		conn,
+		view_name=view_name,
+		filters=filters,
+		mode=mode,
+		use_impresion_log=use_impresion_log,
+		build_sql=lambda where_sql: q_comanda_productos(
+			view_name, where_sql, use_impresion_log=use_impresion_log
+		),
+		run_df=lambda sql, params: _run_df(conn, sql, params, context="Error ejecutando análisis de canasta"),
+	)
+	return basket_rules(counts, min_comandas=min_comandas, limit=limit), counts.n_comandas
+
+
 def get_detalle(
 	conn: Any,
 	view_name: str,
@@ -453,33 +923,6 @@ def get_impresion_snapshot(conn: Any, view_name: str, ids: list[int]):
 	return _run_df(conn, sql, {}, context="Error ejecutando snapshot de impresión")
 
 
-def _median_minutes_between(series) -> tuple[float | None, int]:
-	"""Devuelve (mediana_en_minutos, cantidad_de_intervalos)."""
-	if series is None:
-		return None, 0
-
-	dt = pd.to_datetime(series, errors="coerce")
-	dt = dt.dropna()
-	if len(dt) < 2:
-		return None, 0
-
-	deltas = dt.diff().dropna()
-	if deltas.empty:
-		return None, 0
-
-	minutes = deltas.dt.total_seconds() / 60.0
-	minutes = minutes[minutes >= 0]
-	if minutes.empty:
-		return None, 0
-
-	try:
-		median_val = float(minutes.median())
-	except Exception:
-		median_val = None
-
-	return median_val, int(minutes.shape[0])
-
-
 def get_actividad_emision_comandas(
 	conn: Any,
 	view_name: str,
@@ -494,55 +937,41 @@ def get_actividad_emision_comandas(
 	- Hora/fecha de última comanda (MAX fecha_emision)
 	- Minutos desde la última comanda (vs reloj del servidor Streamlit)
 	- Mediana de minutos entre comandas (últimas N)
-	- Mediana de minutos entre comandas (todo el rango/operativa)
+	- p50/p90/p99 de minutos entre comandas (todo el rango/operativa) + EWMA
+
+	Se mantiene en forma incremental (`src/cadence.py`): cada refresco lee solo las
+	comandas nuevas y los percentiles salen de un sketch combinable por operativa.
 
 	Nota: Se calcula por comanda (id_comanda), no por ítem.
 	"""
 
-	where_sql, params = build_where(filters, mode)
-
-	# Últimas N comandas (ordenadas asc para poder hacer diff).
-	recent_df = _run_df(
-		conn,
-		q_comandas_emision_times(view_name, where_sql, limit=int(recent_n)),
-		params,
-		context="Error obteniendo timestamps de emisión (últimas comandas)",
-	)
-
-	# Todas las comandas del contexto (para ritmo global).
-	all_df = _run_df(
+	snap = _historical_snapshot(conn, view_name, filters, mode)
+	act = get_cadence(
 		conn,
-		q_comandas_emision_times(view_name, where_sql, limit=None),
-		params,
-		context="Error obteniendo timestamps de emisión (todas las comandas)",
+		view_name=view_name,
+		filters=filters,
+		mode=mode,
+		build_sql=lambda where_sql: q_comandas_emision_delta(view_name, where_sql),
+		run_df=lambda sql, params: _run_df(
+			conn, sql, params, context="Error obteniendo timestamps de emisión (comandas nuevas)"
+		),
+		snapshot_rows=(lambda: snapshot_emision_times(snap, with_operation=True)) if snap is not None else None,
+		generation=get_startup_generation(conn) if mode == "none" else 0,
+		recent_n=int(recent_n),
 	)
 
-	last_ts = None
+	last_ts = pd.to_datetime(act.get("last_ts"), errors="coerce")
 	minutes_since_last = None
+	if pd.notna(last_ts):
+		minutes_since_last = float((pd.Timestamp.now() - last_ts).total_seconds() / 60.0)
+	else:
+		last_ts = None
 
-	if recent_df is not None and not recent_df.empty and "fecha_emision" in recent_df.columns:
-		last_ts = pd.to_datetime(recent_df["fecha_emision"].max(), errors="coerce")
-		if pd.notna(last_ts):
-			now = pd.Timestamp.now()
-			delta = now - last_ts
-			minutes_since_last = float(delta.total_seconds() / 60.0)
-		else:
-			last_ts = None
-			minutes_since_last = None
-
-	recent_median_min, recent_intervals = _median_minutes_between(
-		recent_df["fecha_emision"] if recent_df is not None and "fecha_emision" in getattr(recent_df, "columns", []) else None
-	)
-	all_median_min, all_intervals = _median_minutes_between(
-		all_df["fecha_emision"] if all_df is not None and "fecha_emision" in getattr(all_df, "columns", []) else None
-	)
-
+	ewma_min = act.get("ewma_min")
 	return {
+		**act,
 		"last_ts": last_ts,
 		"minutes_since_last": minutes_since_last,
-		"recent_median_min": recent_median_min,
-		"recent_intervals": recent_intervals,
-		"all_median_min": all_median_min,
-		"all_intervals": all_intervals,
+		"rate_per_hour": round(60.0 / ewma_min, 1) if ewma_min else None,
 		"recent_n": int(recent_n),
 	}
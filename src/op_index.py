@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+"""Índice local operativa → rango de `fecha_emision`.
+
+`fecha_emision` es `bar_comanda.fecha` proyectada por las vistas: filtrar solo por
+fecha en un rango amplio obliga a MySQL a recorrer la vista completa. Con el índice
+se agrega un prefiltro `id_operacion BETWEEN ...` (columna indexada) que acota las
+filas antes de aplicar el rango exacto de fechas.
+
+- Operativas CERRADAS (23), o en cualquier otro estado que no sea 22/24: su MIN/MAX no
+  cambia; se sondean una sola vez y se guardan en disco (`.cache/<conexión>/op_index/`).
+- Operativas abiertas (22/24): solo se conoce su primera comanda (el máximo sigue
+  creciendo); se sondean en cada refresco y no se guardan.
+- El índice se completa de a `BACKFILL_MAX_OPS` por refresco, de la más reciente a la
+  más antigua: el primer uso no recorre todo el histórico. Mientras queden operativas sin
+  sondear (`pendientes`), un rango que empieza antes de la primera fecha conocida las
+  incluye a todas (el prefiltro se abre hacia abajo).
+- El estado se lee una vez completo por proceso (`ope_operacion`, por PK); después solo
+  desde la abierta más antigua o desde la siguiente a la última vista.
+- Si el rango pedido llega hasta la última fecha conocida, el prefiltro queda abierto
+  hacia arriba (`id_operacion >= ...`): cubre operativas creadas después del sondeo
+  y comandas nuevas de las abiertas.
+
+El prefiltro es siempre un superconjunto: nunca excluye comandas del rango de fechas
+(con el mismo supuesto que el prefiltro abierto: los ids de operativa crecen con las fechas).
+
+El mismo sondeo cuenta las comandas de cada operativa (`comandas`): el estimador de
+costo (`src/cost_guard.py`) las usa para anticipar cuánto escanea un rango amplio. Las
+operativas del índice que no tienen conteo (índices guardados antes de contar) se completan
+a demanda con `get_operation_counts`, solo para el rango pedido y de a `COUNT_PROBE_MAX`.
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+
+from src.local_store import connection_key, read_arrow, store_dir, write_arrow
+from src.query_store import (
+    Q_OPERATION_DATE_BOUNDS,
+    Q_OPERATIONS_STATE,
+    contiguous_id_ranges,
+    fetch_dataframe,
+)
+
+
+ESTADOS_ABIERTOS = (22, 24)
+REFRESH_TTL_SECONDS = 60
+PROBE_CHUNK = 500
+# Operativas sin rango que se sondean por refresco (las más recientes primero).
+BACKFILL_MAX_OPS = 60
+# Operativas sin conteo que se sondean por llamada a `get_operation_counts` (las más recientes).
+COUNT_PROBE_MAX = 31
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("id_operacion", pa.int64()),
+        ("fecha_min", pa.timestamp("us")),
+        ("fecha_max", pa.timestamp("us")),
+        ("comandas", pa.int64()),
+    ]
+)
+
+# (conexión) -> (monotonic de la última carga, índice)
+_INDEX_CACHE: dict[str, tuple[float, "OperationIndex"]] = {}
+
+
+@dataclass
+class _StateScan:
+    """Estado leído de `ope_operacion` en este proceso (para leer solo lo nuevo)."""
+
+    finales: set[int]
+    abiertas: list[int]
+    ultima: int | None
+
+    @property
+    def desde(self) -> int:
+        if self.abiertas:
+            return min(self.abiertas)
+        return self.ultima + 1 if self.ultima is not None else 0
+
+
+# (conexión) -> último estado leído
+_STATES: dict[str, _StateScan] = {}
+
+
+@dataclass(frozen=True)
+class OperationIndex:
+    """Rangos de fechas de operativas cerradas + primera comanda de las abiertas."""
+
+    bounds: dict[int, tuple[datetime | None, datetime | None]]
+    abiertas: dict[int, datetime | None]
+    # Comandas por operativa (cerradas: fijo; abiertas: al último sondeo).
+    comandas: dict[int, int] = field(default_factory=dict)
+    # Cerradas (o en otro estado final) todavía sin sondear: las más antiguas.
+    pendientes: frozenset[int] = frozenset()
+
+    @property
+    def fecha_max_conocida(self) -> datetime | None:
+        fechas = [fin for _, fin in self.bounds.values() if fin is not None]
+        fechas += [ini for ini in self.abiertas.values() if ini is not None]
+        return max(fechas) if fechas else None
+
+    @property
+    def fecha_min_conocida(self) -> datetime | None:
+        fechas = [ini for ini, _ in self.bounds.values() if ini is not None]
+        fechas += [ini for ini in self.abiertas.values() if ini is not None]
+        return min(fechas) if fechas else None
+
+    def operations_for_dates(self, dt_ini: str, dt_fin: str) -> tuple[list[int], bool]:
+        """Operativas que pueden tener comandas en `dt_ini–dt_fin` y si el rango queda abierto."""
+
+        start = datetime.fromisoformat(str(dt_ini))
+        end = datetime.fromisoformat(str(dt_fin))
+
+        ids = [
+            op
+            for op, (ini, fin) in self.bounds.items()
+            if ini is not None and fin is not None and fin >= start and ini <= end
+        ]
+        newest = self.fecha_max_conocida
+        open_ended = newest is None or end >= newest
+
+        # Abierta: puede recibir comandas hasta ahora; sin comandas aún, solo cuenta si el
+        # rango llega a la última fecha conocida.
+        ids += [
+            op
+            for op, ini in self.abiertas.items()
+            if (ini is not None and ini <= end) or (ini is None and open_ended)
+        ]
+
+        # Sin sondear (las más antiguas): pueden caer en cualquier rango anterior a lo conocido.
+        oldest = self.fecha_min_conocida
+        if self.pendientes and (oldest is None or start < oldest):
+            ids += sorted(self.pendientes)
+        return ids, open_ended
+
+    def prefilter(self, dt_ini: str, dt_fin: str) -> tuple[int, int | None] | None:
+        """Rango de id_operacion que contiene todas las comandas de `dt_ini–dt_fin`."""
+
+        ids, open_ended = self.operations_for_dates(dt_ini, dt_fin)
+        if not ids:
+            if open_ended and self.bounds:
+                # Nada conocido en el rango: solo podrían aportar operativas nuevas.
+                return (max(self.bounds) + 1, None)
+            return None
+        return (min(ids), None if open_ended else max(ids))
+
+
+def _index_path(conn: Any):
+    return store_dir(conn, "op_index") / "operaciones.arrow"
+
+
+def _to_datetime(value: Any) -> datetime | None:
+    if value is None or pd.isna(value):
+        return None
+    return pd.Timestamp(value).to_pydatetime()
+
+
+def _load_bounds(conn: Any) -> tuple[dict[int, tuple[datetime | None, datetime | None]], dict[int, int]]:
+    table = read_arrow(_index_path(conn))
+    if table is None:
+        return {}, {}
+    df = table.to_pandas()
+    bounds: dict[int, tuple[datetime | None, datetime | None]] = {}
+    counts: dict[int, int] = {}
+    for row in df.to_dict(orient="records"):
+        op_id = int(row["id_operacion"])
+        bounds[op_id] = (_to_datetime(row["fecha_min"]), _to_datetime(row["fecha_max"]))
+        # Índices guardados antes de contar comandas no traen la columna.
+        if row.get("comandas") is not None and not pd.isna(row["comandas"]):
+            counts[op_id] = int(row["comandas"])
+    return bounds, counts
+
+
+def _save_bounds(
+    conn: Any,
+    bounds: dict[int, tuple[datetime | None, datetime | None]],
+    counts: dict[int, int],
+) -> None:
+    ops = sorted(bounds)
+    table = pa.Table.from_pydict(
+        {
+            "id_operacion": ops,
+            "fecha_min": [bounds[op][0] for op in ops],
+            "fecha_max": [bounds[op][1] for op in ops],
+            "comandas": [counts.get(op) for op in ops],
+        },
+        schema=INDEX_SCHEMA,
+    )
+    write_arrow(_index_path(conn), table)
+
+
+def _probe_bounds(
+    conn: Any, ops: list[int]
+) -> tuple[dict[int, tuple[datetime | None, datetime | None]], dict[int, int]]:
+    """MIN/MAX de fecha y comandas por operativa, una consulta por tramo contiguo de ids."""
+
+    found: dict[int, tuple[datetime | None, datetime | None]] = {}
+    counts: dict[int, int] = {}
+    wanted = set(ops)
+    for op_ini, op_fin in contiguous_id_ranges(ops, PROBE_CHUNK):
+        df = fetch_dataframe(conn, Q_OPERATION_DATE_BOUNDS, {"op_ini": op_ini, "op_fin": op_fin})
+        if df is None or df.empty:
+            continue
+        for row in df.to_dict(orient="records"):
+            op_id = int(row["id_operacion"])
+            if op_id in wanted:
+                found[op_id] = (_to_datetime(row["fecha_min"]), _to_datetime(row["fecha_max"]))
+                counts[op_id] = int(row.get("comandas") or 0)
+    return found, counts
+
+
+def _operation_states(conn: Any) -> tuple[set[int], list[int]]:
+    """(finales, abiertas 22/24). Relee solo desde `_StateScan.desde` si ya hubo una lectura."""
+
+    key = connection_key(conn)
+    scan = _STATES.get(key)
+    desde = scan.desde if scan is not None else 0
+
+    finales = {op for op in scan.finales if op < desde} if scan is not None else set()
+    abiertas: list[int] = []
+    ultima = scan.ultima if scan is not None else None
+    state = fetch_dataframe(conn, Q_OPERATIONS_STATE, {"op_desde": desde})
+    if state is not None and not state.empty:
+        for row in state.to_dict(orient="records"):
+            op_id = int(row["id_operacion"])
+            estado = row.get("estado_operacion_id")
+            if estado is not None and not pd.isna(estado) and int(estado) in ESTADOS_ABIERTOS:
+                abiertas.append(op_id)
+            else:
+                finales.add(op_id)
+            ultima = op_id if ultima is None else max(ultima, op_id)
+
+    _STATES[key] = _StateScan(finales=finales, abiertas=abiertas, ultima=ultima)
+    return finales, abiertas
+
+
+def refresh_operation_index(conn: Any) -> OperationIndex:
+    """Lee el estado de `ope_operacion` y sondea el MIN/MAX de las operativas nuevas.
+
+    De las finales sin rango se sondean a lo sumo `BACKFILL_MAX_OPS` (las más recientes);
+    las abiertas (22/24) se sondean siempre.
+    """
+
+    bounds, counts = _load_bounds(conn)
+    finales, abiertas = _operation_states(conn)
+
+    pendientes = sorted(op for op in finales if op not in bounds)
+    lote = pendientes[-BACKFILL_MAX_OPS:]
+    probed, probed_counts = _probe_bounds(conn, lote)
+    for op in lote:
+        # Operativa sin comandas: se registra sin rango para no volver a sondearla.
+        bounds[op] = probed.get(op, (None, None))
+        counts[op] = probed_counts.get(op, 0)
+    if lote:
+        _save_bounds(conn, bounds, counts)
+
+    abiertas_bounds, abiertas_counts = _probe_bounds(conn, abiertas)
+
+    return OperationIndex(
+        bounds={op: rng for op, rng in bounds.items() if op in finales},
+        abiertas={op: abiertas_bounds.get(op, (None, None))[0] for op in abiertas},
+        comandas={
+            **{op: n for op, n in counts.items() if op in finales},
+            **{op: abiertas_counts.get(op, 0) for op in abiertas},
+        },
+        pendientes=frozenset(pendientes[: len(pendientes) - len(lote)]),
+    )
+
+
+def get_operation_index(conn: Any, *, max_age_seconds: float = REFRESH_TTL_SECONDS) -> OperationIndex:
+    """Índice memorizado en proceso; se refresca como máximo cada `max_age_seconds`."""
+
+    key = connection_key(conn)
+    cached = _INDEX_CACHE.get(key)
+    if cached is not None and time.monotonic() - cached[0] < max_age_seconds:
+        return cached[1]
+
+    index = refresh_operation_index(conn)
+    _INDEX_CACHE[key] = (time.monotonic(), index)
+    return index
+
+
+def forget_operation_index(conn: Any | None = None) -> None:
+    """Descarta el índice memorizado (se vuelve a leer en la próxima consulta).
+
+    Con `conn` se conserva el estado leído de `ope_operacion`: la relectura parte de la
+    abierta más antigua, así que igual ve el cierre. Sin `conn` se olvida todo.
+    """
+
+    if conn is None:
+        _INDEX_CACHE.clear()
+        _STATES.clear()
+    else:
+        _INDEX_CACHE.pop(connection_key(conn), None)
+
+
+def get_op_prefilter(conn: Any, dt_ini: str, dt_fin: str) -> tuple[int, int | None] | None:
+    """Prefiltro por id_operacion para `mode='dates'` (None si no se puede calcular).
+
+    Es una optimización: ante cualquier error se devuelve None y la consulta sigue
+    filtrando solo por fecha.
+    """
+
+    try:
+        return get_operation_index(conn).prefilter(dt_ini, dt_fin)
+    except Exception:
+        return None
+
+
+def get_operation_counts(conn: Any, op_ids: list[int], *, cerradas: set[int]) -> dict[int, int]:
+    """Comandas por operativa de `op_ids`: las guardadas y, a lo sumo, `COUNT_PROBE_MAX` más.
+
+    Las faltantes se sondean por tramos (`Q_OPERATION_DATE_BOUNDS` sobre `id_operacion`,
+    solo dentro de `op_ids`); las cerradas quedan guardadas en el índice. El resto se omite:
+    quien llama lo estima y se completa en llamadas siguientes. Nunca recorre todo el histórico.
+    """
+
+    bounds, counts = _load_bounds(conn)
+    cached = _INDEX_CACHE.get(connection_key(conn))
+    if cached is not None:
+        counts = {**cached[1].comandas, **counts}
+
+    faltantes = sorted(op for op in set(op_ids) if op not in counts)[-COUNT_PROBE_MAX:]
+    if faltantes:
+        probed, probed_counts = _probe_bounds(conn, faltantes)
+        nuevas = [op for op in faltantes if op in cerradas]
+        for op in nuevas:
+            bounds[op] = probed.get(op, bounds.get(op, (None, None)))
+            counts[op] = probed_counts.get(op, 0)
+        if nuevas:
+            _save_bounds(conn, bounds, counts)
+        for op in faltantes:
+            counts.setdefault(op, probed_counts.get(op, 0))
+        if cached is not None:
+            cached[1].comandas.update({op: counts[op] for op in faltantes})
+
+    return {op: counts[op] for op in op_ids if op in counts}
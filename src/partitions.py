@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+"""Particiones por día para el histórico por fechas (`mode='dates'`).
+
+Un rango `dt_ini–dt_fin` se descompone en días. Cada día completo, ya terminado y con
+todas sus operativas cerradas se calcula una sola vez y se guarda en disco (Arrow); los
+demás (hoy, días parciales en los bordes, días con una operativa abierta) se consultan
+siempre.
+
+"Cerrada" sale del índice operativa → fechas (`src/op_index.py`): el día es cacheable si
+todas las operativas que pueden tener comandas en él están en `bounds` (estado final,
+no 22/24). Una operativa nocturna abierta, o todavía sin sondear, lo deja en vivo. Si el
+índice no se puede calcular, no se cachea ningún día.
+
+Los días faltantes contiguos se piden en una sola consulta agrupada por
+`DATE(fecha_emision)` y las consultas independientes se ejecutan en paralelo.
+
+Requisito para mezclar días: la métrica debe ser aditiva por día. Se cumple para
+sumas y para `COUNT(DISTINCT id_comanda)` porque cada comanda tiene un único
+`fecha_emision` (`bar_comanda.fecha`) y por lo tanto cae en un solo día.
+"""
+
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Callable
+
+import pandas as pd
+import pyarrow as pa
+
+from src.local_store import read_arrow, store_dir, write_arrow
+from src.op_index import OperationIndex, get_operation_index
+from src.query_store import Filters, build_where
+
+
+DEFAULT_MAX_WORKERS = 4
+DAY_FORMAT = "%Y-%m-%d"
+
+
+@dataclass(frozen=True)
+class DayPartition:
+    """Tramo de un día dentro de un rango `dt_ini–dt_fin`."""
+
+    day: date
+    dt_ini: str
+    dt_fin: str
+
+    @property
+    def full_day(self) -> bool:
+        return self.dt_ini == f"{self.day} 00:00:00" and self.dt_fin == f"{self.day} 23:59:59"
+
+    def finished(self, now: datetime) -> bool:
+        return self.full_day and datetime.combine(self.day + timedelta(days=1), time.min) <= now
+
+    def cacheable(self, now: datetime, index: OperationIndex | None) -> bool:
+        """Día terminado cuyas operativas están todas cerradas (no cambia más)."""
+
+        if index is None or not self.finished(now):
+            return False
+        ids, _ = index.operations_for_dates(self.dt_ini, self.dt_fin)
+        return all(op in index.bounds for op in ids)
+
+
+def split_days(dt_ini: str, dt_fin: str) -> list[DayPartition]:
+    """Descompone `dt_ini–dt_fin` ('YYYY-MM-DD HH:MM:SS') en tramos diarios."""
+
+    start = datetime.fromisoformat(str(dt_ini))
+    end = datetime.fromisoformat(str(dt_fin))
+    if start > end:
+        return []
+
+    parts: list[DayPartition] = []
+    day = start.date()
+    while day <= end.date():
+        ini = start if day == start.date() else datetime.combine(day, time.min)
+        fin = end if day == end.date() else datetime.combine(day, time(23, 59, 59))
+        parts.append(
+            DayPartition(day, ini.strftime("%Y-%m-%d %H:%M:%S"), fin.strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        day += timedelta(days=1)
+    return parts
+
+
+def _contiguous_runs(parts: list[DayPartition]) -> list[list[DayPartition]]:
+    runs: list[list[DayPartition]] = []
+    for part in parts:
+        if runs and runs[-1][-1].day + timedelta(days=1) == part.day:
+            runs[-1].append(part)
+        else:
+            runs.append([part])
+    return runs
+
+
+def _decimals_to_float(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.columns:
+        if df[col].dtype == object and df[col].map(lambda v: isinstance(v, Decimal)).any():
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def _normalize_dia(df: pd.DataFrame) -> pd.DataFrame:
+    if df is None or df.empty or "dia" not in df.columns:
+        return pd.DataFrame() if df is None else df
+    df = df.copy()
+    df["dia"] = pd.to_datetime(df["dia"]).dt.strftime(DAY_FORMAT)
+    return _decimals_to_float(df)
+
+
+def _run_in_script_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Propaga el ScriptRunContext de Streamlit (si existe) y los contextvars a los hilos del pool.
+
+    Evita warnings de "missing ScriptRunContext" cuando la conexión usa cache de Streamlit.
+    La sección/rerun de `src/perf.py` se propaga siempre (también fuera de Streamlit, p. ej.
+    `scripts/bench_metrics.py`): contextvars no pasan solos a otro hilo.
+    """
+
+    context = contextvars.copy_context()
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+
+    def _wrapped(*args: Any, **kwargs: Any) -> Any:
+        if ctx is not None:
+            import threading
+
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return context.copy().run(fn, *args, **kwargs)
+
+    return _wrapped
+
+
+def fetch_day_partitions(
+    conn: Any,
+    *,
+    name: str,
+    view_name: str,
+    filters: Filters,
+    build_sql: Callable[[str], str],
+    run_df: Callable[[str, dict[str, Any]], pd.DataFrame],
+    table_alias: str | None = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    now: datetime | None = None,
+) -> pd.DataFrame:
+    """Devuelve las filas por día (columna `dia`) del rango, usando el cache local.
+
+    - `build_sql(where_sql)` debe construir la consulta con `by_day=True`.
+    - `run_df(sql, params)` ejecuta la consulta (la capa de servicio envuelve errores).
+    """
+
+    if filters.dt_ini is None or filters.dt_fin is None:
+        raise ValueError("mode='dates' requiere dt_ini y dt_fin")
+
+    now = now or datetime.now()
+    parts = split_days(filters.dt_ini, filters.dt_fin)
+    index: OperationIndex | None = None
+    if any(part.finished(now) for part in parts):
+        try:
+            index = get_operation_index(conn)
+        except Exception:
+            index = None
+
+    # La key incluye el SQL "plantilla": si cambia la consulta, el cache viejo no se reutiliza.
+    template = hashlib.sha1(f"{name}|{view_name}|{build_sql('')}".encode("utf-8")).hexdigest()[:12]
+    cache_dir = store_dir(conn, "partitions", f"{name}_{template}")
+
+    frames: list[pd.DataFrame] = []
+    missing: list[DayPartition] = []
+    live: list[DayPartition] = []
+    for part in parts:
+        if not part.cacheable(now, index):
+            live.append(part)
+            continue
+        table = read_arrow(cache_dir / f"{part.day.strftime(DAY_FORMAT)}.arrow")
+        if table is None:
+            missing.append(part)
+        elif table.num_rows:
+            cached = table.to_pandas()
+            cached.insert(0, "dia", part.day.strftime(DAY_FORMAT))
+            frames.append(cached)
+
+    jobs: list[tuple[list[DayPartition], bool]] = [(run, True) for run in _contiguous_runs(missing)]
+    jobs += [([part], False) for part in live]
+
+    def _fetch(job: tuple[list[DayPartition], bool]) -> pd.DataFrame:
+        run, _ = job
+        job_filters = replace(filters, dt_ini=run[0].dt_ini, dt_fin=run[-1].dt_fin)
+        where_sql, params = build_where(job_filters, "dates", table_alias=table_alias)
+        return _normalize_dia(run_df(build_sql(where_sql), params))
+
+    # mysql.connector (cursor) usa una única conexión: no es seguro compartirla entre hilos.
+    workers = max(1, min(int(max_workers), len(jobs))) if hasattr(conn, "query") else 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dashback-day") as pool:
+            results = list(pool.map(_run_in_script_context(_fetch), jobs))
+    else:
+        results = [_fetch(job) for job in jobs]
+
+    for (run, persist), df in zip(jobs, results):
+        if persist:
+            for part in run:
+                dia = part.day.strftime(DAY_FORMAT)
+                day_df = df[df["dia"] == dia].drop(columns="dia") if "dia" in df.columns else pd.DataFrame()
+                write_arrow(
+                    cache_dir / f"{dia}.arrow",
+                    pa.Table.from_pandas(day_df.reset_index(drop=True), preserve_index=False),
+                )
+        if df is not None and not df.empty:
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_day_partitions(df: pd.DataFrame, by: list[str], sum_columns: list[str]) -> pd.DataFrame:
+    """Suma las columnas aditivas de varios días agrupando por `by` (sin `dia`)."""
+
+    if df is None or df.empty:
+        return pd.DataFrame(columns=by + sum_columns)
+
+    out = df.copy()
+    for col in sum_columns:
+        out[col] = pd.to_numeric(out[col], errors="coerce").fillna(0)
+    if not by:
+        return out[sum_columns].sum().to_frame().T
+    # `observed=True`: con claves categóricas no se generan combinaciones inexistentes.
+    return out.groupby(by, as_index=False, sort=False, dropna=False, observed=True)[sum_columns].sum()
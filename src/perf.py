@@ -0,0 +1,622 @@
+from __future__ import annotations
+
+"""Instrumentación de consultas: tiempos, filas, bytes y aciertos del cache local.
+
+Cada ejecución de `fetch_dataframe` deja un `QueryRecord` en un registro en memoria:
+
+- consulta: builder que armó el SQL (`q_kpis`, `Q_STARTUP_COMBINED`, ...), leído del
+  comentario `/* nombre */` que agrega `tag_builder` al inicio del SQL.
+- tiempo total, tiempo en la base (execute; con `SQLConnection` se mide con los eventos
+  `before/after_cursor_execute` de SQLAlchemy) y tiempo armando el DataFrame (fetch +
+  `normalize_fetched`).
+- filas y bytes del resultado.
+- sección del dashboard que la pidió (`enter_section`) y rerun (`begin_rerun`).
+
+Las lecturas del cache local (snapshots, rollups, particiones, ...) quedan como
+aciertos (`cache='hit'`, sin SQL). `query_summary` / `rerun_summary` resumen el
+registro para el panel "Rendimiento" (p50/p95 por consulta, consultas por rerun).
+
+Perfil por rerun (`RerunProfile`): cada `enter_section` abre un tramo de tiempo de
+pared con sus consultas, tiempo en base y tiempo Python en Plotly / formatters
+(`python_time`, `timed`; solo con el perfil activo, ver `set_python_timing`). `end_rerun`
+cierra el último tramo; el resultado alimenta la cascada del sidebar y el presupuesto de
+consultas por rerun (`DASHBACK_QUERY_BUDGET`; por defecto `DEFAULT_QUERY_BUDGET`, que
+`scripts/check_query_shapes.py` hace cumplir a cada escenario).
+"""
+
+import cProfile
+import functools
+import itertools
+import marshal
+import os
+import pstats
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+
+RECORDS_MAX = 2000
+PROFILES_MAX = 50
+
+QUERY_BUDGET_ENV = "DASHBACK_QUERY_BUDGET"
+# Consultas por rerun sin variable: el peor escenario de `scripts/check_query_shapes.py`
+# (histórico, rango de 30 operativas: 15). El chequeo falla si un escenario lo supera, así
+# que subirlo es un cambio explícito acá, no un efecto de regenerar la línea base.
+DEFAULT_QUERY_BUDGET = 15
+
+# Categorías de tiempo Python que se miden por sección.
+PYTHON_KINDS = ("plotly", "formatters")
+
+_TAG_RE = re.compile(r"^\s*(EXPLAIN\s+)?/\*\s*([A-Za-z_][A-Za-z0-9_]*)\s*\*/", re.IGNORECASE)
+_FROM_RE = re.compile(r"\bFROM\s+([A-Za-z_][A-Za-z0-9_.]*)", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class QueryRecord:
+    """Una ejecución de consulta (o lectura del cache local)."""
+
+    consulta: str
+    seccion: str | None
+    rerun: int
+    cache: str  # 'miss' (fue a la base) | 'hit' (cache local)
+    total_ms: float
+    db_ms: float
+    frame_ms: float
+    filas: int
+    bytes: int
+    error: bool
+    registrado_en: datetime
+
+
+@dataclass
+class SectionSpan:
+    """Tramo de un rerun entre dos `enter_section`."""
+
+    seccion: str | None
+    inicio_ms: float
+    dur_ms: float | None = None
+    consultas: int = 0
+    aciertos_cache: int = 0
+    db_ms: float = 0.0
+    python_ms: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class RerunProfile:
+    """Tramos de un rerun del script, en orden."""
+
+    rerun: int
+    inicio: datetime
+    t0: float
+    spans: list[SectionSpan] = field(default_factory=list)
+    total_ms: float | None = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def span_for(self, seccion: str | None) -> SectionSpan | None:
+        """Tramo abierto si coincide la sección; si no, el último con ese nombre."""
+
+        for span in reversed(self.spans):
+            if span.seccion == seccion:
+                return span
+        return None
+
+
+_RECORDS: deque[QueryRecord] = deque(maxlen=RECORDS_MAX)
+_PROFILES: OrderedDict[int, RerunProfile] = OrderedDict()
+_LOCK = threading.Lock()
+
+_SECTION: ContextVar[str | None] = ContextVar("dashback_perf_section", default=None)
+_RERUN: ContextVar[int] = ContextVar("dashback_perf_rerun", default=0)
+_RERUN_SEQ = itertools.count(1)
+
+# Timer activo en este hilo (los eventos de SQLAlchemy le suman el tiempo de execute).
+_ACTIVE = threading.local()
+# Profundidad de `python_time` en este hilo: solo el bloque externo suma tiempo.
+_PYTHON_DEPTH = threading.local()
+_CPROFILE = threading.local()
+# Tiempo Python por categoría (Plotly / formatters): apagado salvo con el perfil activo.
+# Se consulta antes de cualquier lock o contextmanager: apagado cuesta un `ContextVar.get`.
+_PYTHON_TIMING: ContextVar[bool] = ContextVar("dashback_perf_python_timing", default=False)
+_NO_TIMING = nullcontext()
+_INSTRUMENTED: weakref.WeakSet = weakref.WeakSet()
+
+
+def begin_rerun() -> int:
+    """Marca el inicio de un rerun del script; las consultas siguientes quedan asociadas a él."""
+
+    rerun = next(_RERUN_SEQ)
+    _RERUN.set(rerun)
+    _SECTION.set(None)
+    _PYTHON_TIMING.set(False)
+    profile = RerunProfile(rerun=rerun, inicio=datetime.now(), t0=time.perf_counter())
+    profile.spans.append(SectionSpan(seccion=None, inicio_ms=0.0))
+    with _LOCK:
+        _PROFILES[rerun] = profile
+        while len(_PROFILES) > PROFILES_MAX:
+            _PROFILES.popitem(last=False)
+    return rerun
+
+
+def _current_profile() -> RerunProfile | None:
+    with _LOCK:
+        return _PROFILES.get(_RERUN.get())
+
+
+def _close_span(profile: RerunProfile, now_ms: float) -> None:
+    if profile.spans and profile.spans[-1].dur_ms is None:
+        span = profile.spans[-1]
+        span.dur_ms = round(now_ms - span.inicio_ms, 2)
+
+
+def enter_section(name: str | None) -> None:
+    """Sección del dashboard a la que se atribuyen las consultas siguientes.
+
+    También cierra el tramo de tiempo anterior del perfil del rerun y abre uno nuevo.
+    """
+
+    _SECTION.set(name)
+    profile = _current_profile()
+    if profile is None or profile.total_ms is not None:
+        return
+    now_ms = profile.elapsed_ms()
+    with _LOCK:
+        _close_span(profile, now_ms)
+        profile.spans.append(SectionSpan(seccion=name, inicio_ms=round(now_ms, 2)))
+
+
+def end_rerun() -> RerunProfile | None:
+    """Cierra el último tramo del rerun actual y devuelve su perfil."""
+
+    profile = _current_profile()
+    if profile is None:
+        return None
+    if profile.total_ms is None:
+        now_ms = profile.elapsed_ms()
+        with _LOCK:
+            _close_span(profile, now_ms)
+            profile.total_ms = round(now_ms, 2)
+    return profile
+
+
+def get_profile(rerun: int) -> RerunProfile | None:
+    with _LOCK:
+        return _PROFILES.get(int(rerun))
+
+
+def set_python_timing(enabled: bool) -> None:
+    """Activa la medición de tiempo Python del rerun actual (checkbox "Perfil por rerun")."""
+
+    _PYTHON_TIMING.set(bool(enabled))
+
+
+def python_time(kind: str) -> Any:
+    """Suma el tiempo del bloque a la categoría `kind` del tramo actual (p.ej. 'plotly').
+
+    Bloques anidados (un formatter dentro de un gráfico) cuentan solo para el externo.
+    Sin `set_python_timing(True)` no mide nada.
+    """
+
+    if not _PYTHON_TIMING.get():
+        return _NO_TIMING
+    return _python_timer(kind)
+
+
+@contextmanager
+def _python_timer(kind: str) -> Iterator[None]:
+    depth = getattr(_PYTHON_DEPTH, "value", 0)
+    _PYTHON_DEPTH.value = depth + 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _PYTHON_DEPTH.value = depth
+        if depth == 0:
+            _add_python_ms(kind, (time.perf_counter() - t0) * 1000)
+
+
+def timed(kind: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorador: `python_time(kind)` alrededor de cada llamada."""
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _PYTHON_TIMING.get():
+                return fn(*args, **kwargs)
+            with _python_timer(kind):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _add_python_ms(kind: str, elapsed_ms: float) -> None:
+    profile = _current_profile()
+    if profile is None or profile.total_ms is not None:
+        return
+    with _LOCK:
+        span = profile.span_for(_SECTION.get())
+        if span is not None:
+            span.python_ms[kind] = span.python_ms.get(kind, 0.0) + elapsed_ms
+
+
+def current_section() -> str | None:
+    return _SECTION.get()
+
+
+def tag_builder(fn: Callable[..., str]) -> Callable[..., str]:
+    """Decorador para `q_*`: antepone `/* q_nombre */` al SQL (MySQL ignora el comentario).
+
+    Además de identificar la consulta en este registro, el comentario se ve en
+    `SHOW PROCESSLIST` y en el slow log del servidor.
+    """
+
+    tag = f"/* {fn.__name__} */"
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> str:
+        return f"{tag}{fn(*args, **kwargs)}"
+
+    return wrapper
+
+
+def query_name(sql: str) -> str:
+    """Nombre del builder (comentario inicial) o, si no hay, la vista/tabla del `FROM`.
+
+    Un `EXPLAIN` de una consulta etiquetada queda como `EXPLAIN q_nombre` (no se mezcla
+    con los tiempos del builder).
+    """
+
+    match = _TAG_RE.match(sql or "")
+    if match:
+        return f"EXPLAIN {match.group(2)}" if match.group(1) else match.group(2)
+    match = _FROM_RE.search(sql or "")
+    return f"FROM {match.group(1)}" if match else "consulta"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("dashback_perf_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("dashback_perf_t0")
+    if not starts:
+        return
+    elapsed = (time.perf_counter() - starts.pop()) * 1000
+    timer = getattr(_ACTIVE, "timer", None)
+    if timer is not None:
+        timer.event_ms += elapsed
+
+
+def instrument_connection(conn: Any) -> None:
+    """Registra los eventos de SQLAlchemy en el engine de una `SQLConnection` (una sola vez).
+
+    Sin engine (p.ej. `mysql.connector`) no hace nada: el tiempo en la base se mide
+    alrededor de execute + fetch.
+    """
+
+    try:
+        engine = getattr(conn, "engine", None)
+        if engine is None or engine in _INSTRUMENTED:
+            return
+        from sqlalchemy import event
+
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _INSTRUMENTED.add(engine)
+    except Exception:
+        return
+
+
+class QueryTimer:
+    """Mide una ejecución de `fetch_dataframe` y la registra al salir del `with`."""
+
+    def __init__(self, sql: str):
+        self.consulta = query_name(sql)
+        self.event_ms = 0.0
+        self.db_ms = 0.0
+        self.filas = 0
+        self.bytes = 0
+        self.record: QueryRecord | None = None
+
+    def __enter__(self) -> QueryTimer:
+        self._previous = getattr(_ACTIVE, "timer", None)
+        _ACTIVE.timer = self
+        self._t0 = time.perf_counter()
+        return self
+
+    def database(self) -> _DatabaseSpan:
+        """Bloque que habla con la base (execute / fetch del driver)."""
+
+        return _DatabaseSpan(self)
+
+    def result(self, df: pd.DataFrame | None) -> pd.DataFrame | None:
+        if df is not None:
+            self.filas = int(len(df))
+            self.bytes = int(df.memory_usage(index=False, deep=True).sum()) if len(df.columns) else 0
+        return df
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        total_ms = (time.perf_counter() - self._t0) * 1000
+        _ACTIVE.timer = self._previous
+        db_ms = min(self.db_ms, total_ms)
+        self.record = QueryRecord(
+            consulta=self.consulta,
+            seccion=_SECTION.get(),
+            rerun=_RERUN.get(),
+            cache="miss",
+            total_ms=round(total_ms, 2),
+            db_ms=round(db_ms, 2),
+            frame_ms=round(total_ms - db_ms, 2),
+            filas=self.filas,
+            bytes=self.bytes,
+            error=exc_type is not None,
+            registrado_en=datetime.now(),
+        )
+        _append(self.record)
+
+
+class _DatabaseSpan:
+    def __init__(self, timer: QueryTimer):
+        self.timer = timer
+
+    def __enter__(self) -> None:
+        self._events_before = self.timer.event_ms
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        events = self.timer.event_ms - self._events_before
+        # Con eventos de SQLAlchemy solo cuenta execute; sin eventos, todo el bloque.
+        self.timer.db_ms += events if events > 0 else (time.perf_counter() - self._t0) * 1000
+
+
+def record_cache_hit(kind: str, *, filas: int = 0, nbytes: int = 0) -> None:
+    """Registra una lectura servida por el cache local (sin SQL)."""
+
+    _append(
+        QueryRecord(
+            consulta=f"cache:{kind}",
+            seccion=_SECTION.get(),
+            rerun=_RERUN.get(),
+            cache="hit",
+            total_ms=0.0,
+            db_ms=0.0,
+            frame_ms=0.0,
+            filas=int(filas),
+            bytes=int(nbytes),
+            error=False,
+            registrado_en=datetime.now(),
+        )
+    )
+
+
+def _append(record: QueryRecord) -> None:
+    with _LOCK:
+        _RECORDS.append(record)
+        profile = _PROFILES.get(record.rerun)
+        span = profile.span_for(record.seccion) if profile is not None and profile.total_ms is None else None
+        if span is not None:
+            if record.cache == "miss":
+                span.consultas += 1
+                span.db_ms += record.db_ms
+            else:
+                span.aciertos_cache += 1
+
+
+def get_records(*, rerun: int | None = None) -> pd.DataFrame:
+    """Registro como tabla (más antiguo primero); `rerun` filtra un rerun puntual."""
+
+    with _LOCK:
+        records = list(_RECORDS)
+    if rerun is not None:
+        records = [r for r in records if r.rerun == rerun]
+    columns = list(QueryRecord.__dataclass_fields__)
+    return pd.DataFrame([asdict(r) for r in records], columns=columns)
+
+
+def _pct(values: pd.Series, q: float) -> float:
+    return round(float(np.percentile(values.to_numpy(dtype=np.float64), q)), 1) if len(values) else 0.0
+
+
+def query_summary() -> pd.DataFrame:
+    """Una fila por consulta: ejecuciones, aciertos de cache, p50/p95 y promedios."""
+
+    df = get_records()
+    columns = [
+        "consulta",
+        "ejecuciones",
+        "aciertos_cache",
+        "p50_ms",
+        "p95_ms",
+        "db_p50_ms",
+        "frame_p50_ms",
+        "filas_prom",
+        "kb_prom",
+        "errores",
+        "secciones",
+    ]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    rows: list[dict[str, Any]] = []
+    for name, group in df.groupby("consulta", sort=False):
+        misses = group[group["cache"] == "miss"]
+        rows.append(
+            {
+                "consulta": name,
+                "ejecuciones": int(len(misses)),
+                "aciertos_cache": int((group["cache"] == "hit").sum()),
+                "p50_ms": _pct(misses["total_ms"], 50),
+                "p95_ms": _pct(misses["total_ms"], 95),
+                "db_p50_ms": _pct(misses["db_ms"], 50),
+                "frame_p50_ms": _pct(misses["frame_ms"], 50),
+                "filas_prom": round(float(group["filas"].mean()), 1),
+                "kb_prom": round(float(group["bytes"].mean()) / 1024, 1),
+                "errores": int(group["error"].sum()),
+                "secciones": ", ".join(sorted({str(s) for s in group["seccion"].dropna()})),
+            }
+        )
+    return pd.DataFrame(rows, columns=columns).sort_values("p95_ms", ascending=False).reset_index(drop=True)
+
+
+def rerun_summary(limit: int = 20) -> pd.DataFrame:
+    """Consultas, aciertos de cache y tiempos por rerun (más reciente primero)."""
+
+    df = get_records()
+    columns = ["rerun", "consultas", "aciertos_cache", "total_ms", "db_ms", "filas", "inicio"]
+    df = df[df["rerun"] > 0]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    misses = df["cache"] == "miss"
+    out = (
+        df.assign(
+            consultas=misses.astype(int),
+            aciertos_cache=(~misses).astype(int),
+        )
+        .groupby("rerun", as_index=False)
+        .agg(
+            consultas=("consultas", "sum"),
+            aciertos_cache=("aciertos_cache", "sum"),
+            total_ms=("total_ms", "sum"),
+            db_ms=("db_ms", "sum"),
+            filas=("filas", "sum"),
+            inicio=("registrado_en", "min"),
+        )
+    )
+    out["total_ms"] = out["total_ms"].round(1)
+    out["db_ms"] = out["db_ms"].round(1)
+    return out.sort_values("rerun", ascending=False).head(int(limit)).reset_index(drop=True)[columns]
+
+
+def clear_records() -> None:
+    with _LOCK:
+        _RECORDS.clear()
+
+
+def get_query_budget() -> int:
+    """Máximo de consultas por rerun (`DASHBACK_QUERY_BUDGET`; 0 = sin límite).
+
+    Por defecto `DEFAULT_QUERY_BUDGET`: avisa solo si un rerun hace más idas a la base que
+    cualquier escenario de `scripts/check_query_shapes.py`.
+    """
+
+    try:
+        return max(0, int(os.environ.get(QUERY_BUDGET_ENV) or DEFAULT_QUERY_BUDGET))
+    except ValueError:
+        return DEFAULT_QUERY_BUDGET
+
+
+def profile_frame(profile: RerunProfile | None) -> pd.DataFrame:
+    """Un tramo por fila (orden de ejecución) para la cascada del sidebar."""
+
+    columns = ["seccion", "inicio_ms", "dur_ms", "consultas", "aciertos_cache", "db_ms"] + [
+        f"{kind}_ms" for kind in PYTHON_KINDS
+    ]
+    if profile is None:
+        return pd.DataFrame(columns=columns)
+    with _LOCK:
+        spans = list(profile.spans)
+    rows = [
+        {
+            "seccion": span.seccion or "(sin sección)",
+            "inicio_ms": span.inicio_ms,
+            "dur_ms": span.dur_ms if span.dur_ms is not None else round(profile.elapsed_ms() - span.inicio_ms, 2),
+            "consultas": span.consultas,
+            "aciertos_cache": span.aciertos_cache,
+            "db_ms": round(span.db_ms, 2),
+            **{f"{kind}_ms": round(span.python_ms.get(kind, 0.0), 2) for kind in PYTHON_KINDS},
+        }
+        for span in spans
+    ]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def profile_summary(profile: RerunProfile | None) -> dict[str, Any]:
+    """Totales del rerun: consultas, tiempo en base, tiempo Python por categoría."""
+
+    frame = profile_frame(profile)
+    return {
+        "rerun": profile.rerun if profile is not None else None,
+        "inicio": profile.inicio.isoformat(timespec="seconds") if profile is not None else None,
+        "total_ms": profile.total_ms if profile is not None else None,
+        "consultas": int(frame["consultas"].sum()),
+        "aciertos_cache": int(frame["aciertos_cache"].sum()),
+        "db_ms": round(float(frame["db_ms"].sum()), 2),
+        **{f"{kind}_ms": round(float(frame[f"{kind}_ms"].sum()), 2) for kind in PYTHON_KINDS},
+    }
+
+
+def profile_json(profile: RerunProfile | None, *, budget: int) -> dict[str, Any]:
+    """Perfil completo (totales, tramos y consultas del rerun) para descargar como JSON."""
+
+    summary = profile_summary(profile)
+    queries = get_records(rerun=profile.rerun) if profile is not None else get_records().iloc[0:0]
+    return {
+        **summary,
+        "presupuesto_consultas": int(budget),
+        "excede_presupuesto": bool(budget and summary["consultas"] > budget),
+        "secciones": profile_frame(profile).to_dict(orient="records"),
+        "consultas_detalle": queries.assign(registrado_en=queries["registrado_en"].astype(str)).to_dict(orient="records"),
+    }
+
+
+def start_cprofile() -> cProfile.Profile | None:
+    """Activa cProfile en el hilo del script; `None` si otro profiler ya está activo.
+
+    Si un rerun anterior se interrumpió (p.ej. `RerunException`) sin desactivar el suyo,
+    se desactiva antes de empezar.
+    """
+
+    previous = getattr(_CPROFILE, "profiler", None)
+    if previous is not None:
+        previous.disable()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _CPROFILE.profiler = None
+        return None
+    _CPROFILE.profiler = profiler
+    return profiler
+
+
+def cprofile_bytes(profiler: cProfile.Profile) -> bytes:
+    """Estadísticas en el formato de `pstats` (`pstats.Stats("archivo.prof")`, snakeviz)."""
+
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+def cprofile_top(profiler: cProfile.Profile, limit: int = 15) -> pd.DataFrame:
+    """Funciones con más tiempo acumulado."""
+
+    profiler.create_stats()
+    stats = pstats.Stats(profiler)
+    rows = [
+        {
+            "funcion": f"{_short_filename(filename)}:{line}({name})",
+            "llamadas": int(nc),
+            "propio_ms": round(tt * 1000, 2),
+            "acumulado_ms": round(ct * 1000, 2),
+        }
+        for (filename, line, name), (cc, nc, tt, ct, _callers) in stats.stats.items()
+    ]
+    df = pd.DataFrame(rows, columns=["funcion", "llamadas", "propio_ms", "acumulado_ms"])
+    return df.sort_values("acumulado_ms", ascending=False).head(int(limit)).reset_index(drop=True)
+
+
+def _short_filename(filename: str) -> str:
+    return os.path.basename(filename) if filename and not filename.startswith("<") else filename
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from contextlib import nullcontext
 from dataclasses import dataclass
 from typing import Any, Iterable
 
@@ -7,10 +8,15 @@ import re
 
 import pandas as pd
 
+from src.cancellation import install_cancellation
+from src.dtypes import normalize_fetched
+from src.perf import QueryTimer, instrument_connection, tag_builder
+from src.slow_queries import record_if_slow
+
 
 # Define aquí tus consultas SQL reutilizables
 # Healthcheck: valida conexión y existencia de vistas/tablas esperadas en la DB activa.
-Q_HEALTHCHECK = """
+Q_HEALTHCHECK = """/* Q_HEALTHCHECK */
 SELECT
     req.object_name,
     CASE WHEN t.TABLE_NAME IS NULL THEN 0 ELSE 1 END AS exists_in_db,
@@ -30,7 +36,7 @@ LEFT JOIN information_schema.TABLES t
 """
 
 # Startup / modo operativo (ver docs/01-flujo_inicio_dashboard.md)
-Q_STARTUP_ACTIVE_OPERATION = """
+Q_STARTUP_ACTIVE_OPERATION = """/* Q_STARTUP_ACTIVE_OPERATION */
 SELECT
     op.id AS id_operacion,
     op.estado_operacion AS estado_operacion_id,
@@ -46,7 +52,7 @@ ORDER BY op.id DESC
 LIMIT 1;
 """
 
-Q_STARTUP_LAST_CLOSED_OPERATION = """
+Q_STARTUP_LAST_CLOSED_OPERATION = """/* Q_STARTUP_LAST_CLOSED_OPERATION */
 SELECT
     op.id AS id_operacion,
     op.estado_operacion AS estado_operacion_id,
@@ -62,11 +68,11 @@ ORDER BY op.id DESC
 LIMIT 1;
 """
 
-Q_STARTUP_HAS_REALTIME_ROWS = "SELECT 1 AS has_rows FROM comandas_v6 LIMIT 1;"
+Q_STARTUP_HAS_REALTIME_ROWS = "/* Q_STARTUP_HAS_REALTIME_ROWS */ SELECT 1 AS has_rows FROM comandas_v6 LIMIT 1;"
 
 
 # Selector UI (ver docs/02-guia_dashboard_backstage.md, Apéndice A)
-Q_LIST_OPERATIONS = """
+Q_LIST_OPERATIONS = """/* Q_LIST_OPERATIONS */
 SELECT
   op.id,
   op.fecha,
@@ -83,6 +89,172 @@ ORDER BY op.id DESC
 LIMIT 200;
 """
 
+# Startup en un solo round trip (ver src/startup.py): operativa activa, última cerrada,
+# si la vista realtime tiene filas y el listado del selector. Cada bloque se marca con `kind`.
+# - `has_rows` solo consulta `comandas_v6` si existe una operativa activa.
+# - Las subconsultas con ORDER BY/LIMIT van como tablas derivadas (válido en MySQL 5.6).
+Q_STARTUP_COMBINED = """/* Q_STARTUP_COMBINED */
+SELECT * FROM (
+    SELECT
+        'active' AS kind,
+        op.id AS id_operacion,
+        op.fecha AS fecha,
+        op.nombre_operacion AS nombre_operacion,
+        op.estado_operacion AS estado_operacion_id,
+        eop.nombre AS estado_operacion,
+        NULL AS has_rows
+    FROM ope_operacion op
+    LEFT JOIN parameter_table eop
+        ON eop.id = op.estado_operacion
+     AND eop.id_master = 6
+     AND eop.estado = 'HAB'
+    WHERE op.estado = 'HAB'
+        AND op.estado_operacion IN (22, 24)
+    ORDER BY op.id DESC
+    LIMIT 1
+) active_op
+UNION ALL
+SELECT * FROM (
+    SELECT
+        'closed' AS kind,
+        op.id AS id_operacion,
+        op.fecha AS fecha,
+        op.nombre_operacion AS nombre_operacion,
+        op.estado_operacion AS estado_operacion_id,
+        eop.nombre AS estado_operacion,
+        NULL AS has_rows
+    FROM ope_operacion op
+    LEFT JOIN parameter_table eop
+        ON eop.id = op.estado_operacion
+     AND eop.id_master = 6
+     AND eop.estado = 'HAB'
+    WHERE op.estado = 'HAB'
+        AND op.estado_operacion = 23
+    ORDER BY op.id DESC
+    LIMIT 1
+) closed_op
+UNION ALL
+SELECT * FROM (
+    SELECT
+        'has_rows' AS kind,
+        NULL AS id_operacion,
+        NULL AS fecha,
+        NULL AS nombre_operacion,
+        NULL AS estado_operacion_id,
+        NULL AS estado_operacion,
+        1 AS has_rows
+    FROM ope_operacion op
+    WHERE op.estado = 'HAB'
+        AND op.estado_operacion IN (22, 24)
+        AND EXISTS (SELECT 1 FROM comandas_v6)
+    LIMIT 1
+) realtime_rows
+UNION ALL
+SELECT * FROM (
+    SELECT
+        'operation' AS kind,
+        op.id AS id_operacion,
+        op.fecha AS fecha,
+        op.nombre_operacion AS nombre_operacion,
+        op.estado_operacion AS estado_operacion_id,
+        eop.nombre AS estado_operacion,
+        NULL AS has_rows
+    FROM ope_operacion op
+    LEFT JOIN parameter_table eop
+        ON eop.id = op.estado_operacion
+     AND eop.id_master = 6
+     AND eop.estado = 'HAB'
+    WHERE op.estado = 'HAB'
+    ORDER BY op.id DESC
+    LIMIT 200
+) operation_list;
+"""
+
+# Snapshots locales (ver src/snapshots.py): estado de las operativas de un rango.
+# Consulta por PK de ope_operacion; se usa para decidir si un rango está cerrado (23)
+# y cubierto por snapshots antes de tocar la vista de comandas.
+Q_OPERATIONS_IN_RANGE = """/* Q_OPERATIONS_IN_RANGE */
+SELECT
+    op.id AS id_operacion,
+    op.estado_operacion AS estado_operacion_id
+FROM ope_operacion op
+WHERE op.estado = 'HAB'
+    AND op.id BETWEEN :op_ini AND :op_fin
+ORDER BY op.id;
+"""
+
+# Índice operativa → rango de fechas (ver src/op_index.py).
+# Estado de las operativas HAB desde `op_desde` (por PK): la primera lectura del proceso
+# usa 0; las siguientes arrancan en la abierta más antigua o en la siguiente a la última vista.
+Q_OPERATIONS_STATE = """/* Q_OPERATIONS_STATE */
+SELECT
+    op.id AS id_operacion,
+    op.estado_operacion AS estado_operacion_id
+FROM ope_operacion op
+WHERE op.estado = 'HAB'
+    AND op.id >= :op_desde
+ORDER BY op.id;
+"""
+
+# Watcher de ciclo de vida (ver src/lifecycle.py): estado de las últimas operativas.
+# Recorre la PK en orden descendente: costo constante sin importar el tamaño del histórico.
+Q_RECENT_OPERATIONS_STATE = """/* Q_RECENT_OPERATIONS_STATE */
+SELECT
+    op.id AS id_operacion,
+    op.estado_operacion AS estado_operacion_id
+FROM ope_operacion op
+WHERE op.estado = 'HAB'
+ORDER BY op.id DESC
+LIMIT 10;
+"""
+
+# Sondeo incremental: MIN/MAX de `bar_comanda.fecha` (= `fecha_emision` en las vistas)
+# por operativa. Se consulta la tabla base (todas las comandas, sin filtrar estado) para
+# que el rango cubra a cualquier vista que proyecte `fecha_emision` desde `bar_comanda`.
+# `comandas` alimenta el estimador de costo (ver src/cost_guard.py) sin otra ida a la base.
+Q_OPERATION_DATE_BOUNDS = """/* Q_OPERATION_DATE_BOUNDS */
+SELECT
+    c.id_operacion AS id_operacion,
+    MIN(c.fecha) AS fecha_min,
+    MAX(c.fecha) AS fecha_max,
+    COUNT(*) AS comandas
+FROM bar_comanda c
+WHERE c.id_operacion BETWEEN :op_ini AND :op_fin
+GROUP BY c.id_operacion;
+"""
+
+# Asesor de índices (ver src/index_advisor.py): metadatos de la base activa.
+Q_INDEX_STATISTICS = """/* Q_INDEX_STATISTICS */
+SELECT
+    s.TABLE_NAME,
+    s.INDEX_NAME,
+    s.SEQ_IN_INDEX,
+    s.COLUMN_NAME,
+    s.NON_UNIQUE,
+    s.CARDINALITY
+FROM information_schema.STATISTICS s
+WHERE s.TABLE_SCHEMA = DATABASE()
+ORDER BY s.TABLE_NAME, s.INDEX_NAME, s.SEQ_IN_INDEX;
+"""
+
+# TABLE_ROWS es una estimación en InnoDB: alcanza para ordenar recomendaciones.
+Q_TABLE_ROWS = """/* Q_TABLE_ROWS */
+SELECT
+    t.TABLE_NAME,
+    t.TABLE_ROWS
+FROM information_schema.TABLES t
+WHERE t.TABLE_SCHEMA = DATABASE()
+  AND t.TABLE_TYPE = 'BASE TABLE';
+"""
+
+Q_VIEW_DEFINITIONS = """/* Q_VIEW_DEFINITIONS */
+SELECT
+    v.TABLE_NAME,
+    v.VIEW_DEFINITION
+FROM information_schema.VIEWS v
+WHERE v.TABLE_SCHEMA = DATABASE();
+"""
+
 
 @dataclass(frozen=True)
 class Filters:
@@ -95,6 +267,9 @@ class Filters:
     op_fin: int | None = None
     dt_ini: str | None = None  # 'YYYY-MM-DD HH:MM:SS'
     dt_fin: str | None = None
+    # Solo modo 'dates': rango de id_operacion que contiene todas las comandas del rango de
+    # fechas (ver src/op_index.py). `(op_ini, None)` = abierto hacia arriba.
+    op_prefilter: tuple[int, int | None] | None = None
 
 
 def build_where(
@@ -107,7 +282,8 @@ def build_where(
 
     mode:
       - 'ops'   -> filtra por id_operacion BETWEEN
-      - 'dates' -> filtra por fecha_emision BETWEEN
+      - 'dates' -> filtra por fecha_emision BETWEEN (+ prefiltro por id_operacion si
+                   `filters.op_prefilter` está definido, para que MySQL use el índice)
       - 'none'  -> sin rango (solo tiempo real; la vista ya viene acotada)
     """
 
@@ -126,6 +302,14 @@ def build_where(
     elif mode == "dates":
         if filters.dt_ini is None or filters.dt_fin is None:
             raise ValueError("mode='dates' requiere dt_ini y dt_fin")
+        if filters.op_prefilter is not None:
+            pre_ini, pre_fin = filters.op_prefilter
+            params["op_pre_ini"] = int(pre_ini)
+            if pre_fin is None:
+                clauses.append(f"{_col('id_operacion')} >= :op_pre_ini")
+            else:
+                clauses.append(f"{_col('id_operacion')} BETWEEN :op_pre_ini AND :op_pre_fin")
+                params["op_pre_fin"] = int(pre_fin)
         clauses.append(f"{_col('fecha_emision')} BETWEEN :dt_ini AND :dt_fin")
         params["dt_ini"] = filters.dt_ini
         params["dt_fin"] = filters.dt_fin
@@ -141,6 +325,21 @@ def build_where(
     return where_sql, params
 
 
+def contiguous_id_ranges(ids: list[int], max_span: int) -> list[tuple[int, int]]:
+    """Agrupa ids en tramos contiguos `(ini, fin)` de a lo sumo `max_span` ids.
+
+    Cada tramo se consulta con `id_operacion BETWEEN :op_ini AND :op_fin` (columna indexada).
+    """
+
+    ranges: list[tuple[int, int]] = []
+    for op in sorted(ids):
+        if ranges and ranges[-1][1] + 1 == op and op - ranges[-1][0] < max_span:
+            ranges[-1] = (ranges[-1][0], op)
+        else:
+            ranges.append((op, op))
+    return ranges
+
+
 _SQLA_PARAM_RE = re.compile(r":([A-Za-z_][A-Za-z0-9_]*)")
 
 
@@ -178,7 +377,25 @@ def _cond_cortesia_final(table_alias: str | None = None) -> str:
     )
 
 
-def q_kpis(view_name: str, where_sql: str) -> str:
+def _day_select(table_alias: str | None = None) -> str:
+    """Columna `dia` para consultas particionadas por día (ver src/partitions.py)."""
+
+    p = f"{table_alias}." if table_alias else ""
+    return f"DATE({p}fecha_emision) AS dia,"
+
+
+def _day_group(table_alias: str | None = None) -> str:
+    p = f"{table_alias}." if table_alias else ""
+    return f"DATE({p}fecha_emision)"
+
+
+@tag_builder
+def q_kpis(view_name: str, where_sql: str, *, by_day: bool = False, by_operation: bool = False) -> str:
+    """KPIs de ventas/cortesías (una fila; una por día o por operativa si se pide).
+
+    `by_operation=True`: una fila por `id_operacion` en una sola pasada (tendencias).
+    """
+
     cond_venta = _cond_venta_final("v")
     cond_cortesia = _cond_cortesia_final("v")
 
@@ -190,8 +407,15 @@ def q_kpis(view_name: str, where_sql: str) -> str:
         "AND (v.estado_impresion = 'IMPRESO' OR ei_log.nombre = 'IMPRESO')"
     )
 
+    day_sql = _day_select("v") if by_day else ""
+    group_sql = f"GROUP BY {_day_group('v')}" if by_day else ""
+    if by_operation:
+        day_sql = "v.id_operacion,"
+        group_sql = "GROUP BY v.id_operacion ORDER BY v.id_operacion"
+
     return f"""
     SELECT
+            {day_sql}
             COALESCE(SUM(CASE WHEN {cond_venta} THEN v.sub_total ELSE 0 END), 0) AS total_vendido,
             COUNT(DISTINCT CASE WHEN {cond_venta} THEN v.id_comanda END)  AS total_comandas,
             COALESCE(SUM(CASE WHEN {cond_venta} THEN v.cantidad ELSE 0 END), 0)  AS items_vendidos,
@@ -263,7 +487,8 @@ def q_kpis(view_name: str, where_sql: str) -> str:
         ON ei_log.id = imp.ind_estado_impresion
        AND ei_log.id_master = 10
        AND ei_log.estado = 'HAB'
-    {where_sql};
+    {where_sql}
+    {group_sql};
     """
 
 
@@ -284,9 +509,13 @@ def _cond_venta_final_impreso_log() -> str:
     )
 
 
-def q_estado_operativo(view_name: str, where_sql: str) -> str:
+@tag_builder
+def q_estado_operativo(view_name: str, where_sql: str, *, by_day: bool = False) -> str:
+        day_sql = _day_select() if by_day else ""
+        group_sql = f"GROUP BY {_day_group()}" if by_day else ""
         return f"""
         SELECT
+            {day_sql}
             COUNT(DISTINCT CASE WHEN estado_comanda = 'PENDIENTE' THEN id_comanda END) AS comandas_pendientes,
             COUNT(DISTINCT CASE WHEN estado_comanda = 'ANULADO' THEN id_comanda END) AS comandas_anuladas,
             COUNT(
@@ -300,7 +529,8 @@ def q_estado_operativo(view_name: str, where_sql: str) -> str:
                 END
             ) AS comandas_sin_estado_impresion
         FROM {view_name}
-        {where_sql};
+        {where_sql}
+        {group_sql};
         """
 
 
@@ -310,6 +540,7 @@ def _append_condition(where_sql: str, condition_sql: str) -> str:
         return f"WHERE {condition_sql}"
 
 
+@tag_builder
 def q_ids_comandas_pendientes(view_name: str, where_sql: str, limit: int = 50) -> str:
         where2 = _append_condition(where_sql, "estado_comanda = 'PENDIENTE'")
         return f"""
@@ -322,6 +553,7 @@ def q_ids_comandas_pendientes(view_name: str, where_sql: str, limit: int = 50) -
         """
 
 
+@tag_builder
 def q_ids_comandas_no_impresas(view_name: str, where_sql: str, limit: int = 50) -> str:
     where2 = _append_condition(
         where_sql,
@@ -337,6 +569,7 @@ def q_ids_comandas_no_impresas(view_name: str, where_sql: str, limit: int = 50)
     """
 
 
+@tag_builder
 def q_ids_comandas_impresion_pendiente(view_name: str, where_sql: str, limit: int = 50) -> str:
     where2 = _append_condition(
         where_sql,
@@ -352,6 +585,7 @@ def q_ids_comandas_impresion_pendiente(view_name: str, where_sql: str, limit: in
     """
 
 
+@tag_builder
 def q_ids_comandas_sin_estado_impresion(view_name: str, where_sql: str, limit: int = 50) -> str:
     where2 = _append_condition(
         where_sql,
@@ -367,6 +601,7 @@ def q_ids_comandas_sin_estado_impresion(view_name: str, where_sql: str, limit: i
     """
 
 
+@tag_builder
 def q_ids_comandas_anuladas(view_name: str, where_sql: str, limit: int = 50) -> str:
 		where2 = _append_condition(where_sql, "estado_comanda = 'ANULADO'")
 		return f"""
@@ -379,7 +614,14 @@ def q_ids_comandas_anuladas(view_name: str, where_sql: str, limit: int = 50) ->
 		"""
 
 
-def q_ventas_por_hora(view_name: str, where_sql: str, *, use_impresion_log: bool = False) -> str:
+@tag_builder
+def q_ventas_por_hora(
+    view_name: str,
+    where_sql: str,
+    *,
+    use_impresion_log: bool = False,
+    by_day: bool = False,
+) -> str:
     cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
     where2 = _append_condition(where_sql, cond)
 
@@ -396,6 +638,7 @@ def q_ventas_por_hora(view_name: str, where_sql: str, *, use_impresion_log: bool
 
     return f"""
         SELECT
+            {_day_select("v") if by_day else ""}
             HOUR(v.fecha_emision) AS hora,
             COALESCE(SUM(v.sub_total), 0) AS total_vendido,
             COUNT(DISTINCT v.id_comanda) AS comandas,
@@ -403,12 +646,32 @@ def q_ventas_por_hora(view_name: str, where_sql: str, *, use_impresion_log: bool
         FROM {view_name} v
         {join_sql}
         {where2}
-        GROUP BY HOUR(v.fecha_emision)
+        GROUP BY {_day_group("v") + ", " if by_day else ""}HOUR(v.fecha_emision)
         ORDER BY hora;
         """
 
 
-def q_por_categoria(view_name: str, where_sql: str, *, use_impresion_log: bool = False) -> str:
+TIMELINE_BUCKET_MINUTES = (1, 5, 15)
+
+
+@tag_builder
+def q_ventas_timeline(
+    view_name: str,
+    where_sql: str,
+    *,
+    bucket_minutes: int = 5,
+    use_impresion_log: bool = False,
+) -> str:
+    """Ventas por tramo de `bucket_minutes` (1/5/15) en todo el rango, un solo agregado.
+
+    Devuelve `dia`, `hora` y `minuto` (inicio del tramo) en vez de un timestamp: las tres
+    funciones existen en MySQL 5.6 y `dia` permite particionar por día (ver `src/partitions.py`).
+    """
+
+    bucket = int(bucket_minutes)
+    if bucket not in TIMELINE_BUCKET_MINUTES:
+        raise ValueError(f"Granularidad no soportada: {bucket_minutes} min")
+
     cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
     where2 = _append_condition(where_sql, cond)
 
@@ -423,8 +686,48 @@ def q_por_categoria(view_name: str, where_sql: str, *, use_impresion_log: bool =
            AND ei_log.estado = 'HAB'
         """
 
+    minuto = f"FLOOR(MINUTE(v.fecha_emision) / {bucket}) * {bucket}"
     return f"""
         SELECT
+            {_day_select("v")}
+            HOUR(v.fecha_emision) AS hora,
+            {minuto} AS minuto,
+            COALESCE(SUM(v.sub_total), 0) AS total_vendido,
+            COUNT(DISTINCT v.id_comanda) AS comandas,
+            COALESCE(SUM(v.cantidad), 0) AS items
+        FROM {view_name} v
+        {join_sql}
+        {where2}
+        GROUP BY {_day_group("v")}, HOUR(v.fecha_emision), {minuto}
+        ORDER BY dia, hora, minuto;
+        """
+
+
+@tag_builder
+def q_por_categoria(
+    view_name: str,
+    where_sql: str,
+    *,
+    use_impresion_log: bool = False,
+    by_day: bool = False,
+) -> str:
+    cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
+    where2 = _append_condition(where_sql, cond)
+
+    join_sql = ""
+    if use_impresion_log:
+        join_sql = """
+        LEFT JOIN vw_comanda_ultima_impresion imp
+            ON imp.id_comanda = v.id_comanda
+        LEFT JOIN parameter_table ei_log
+            ON ei_log.id = imp.ind_estado_impresion
+           AND ei_log.id_master = 10
+           AND ei_log.estado = 'HAB'
+        """
+
+    return f"""
+        SELECT
+            {_day_select("v") if by_day else ""}
             COALESCE(v.categoria, 'SIN CATEGORIA') AS categoria,
             COALESCE(SUM(v.sub_total), 0) AS total_vendido,
             COALESCE(SUM(v.cantidad), 0)  AS unidades,
@@ -432,18 +735,26 @@ def q_por_categoria(view_name: str, where_sql: str, *, use_impresion_log: bool =
         FROM {view_name} v
         {join_sql}
         {where2}
-        GROUP BY COALESCE(v.categoria, 'SIN CATEGORIA')
+        GROUP BY {_day_group("v") + ", " if by_day else ""}COALESCE(v.categoria, 'SIN CATEGORIA')
         ORDER BY total_vendido DESC;
         """
 
 
+@tag_builder
 def q_top_productos(
     view_name: str,
     where_sql: str,
-    limit: int = 20,
+    limit: int | None = 20,
     *,
     use_impresion_log: bool = False,
+    by_day: bool = False,
 ) -> str:
+    """Ranking de productos.
+
+    Con `by_day=True` se agrupa además por día y se omite el LIMIT: el top-N de cada
+    día no sirve para armar el top-N del rango, se recorta después de sumar.
+    """
+
     cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
     where2 = _append_condition(where_sql, cond)
 
@@ -460,6 +771,7 @@ def q_top_productos(
 
     return f"""
         SELECT
+            {_day_select("v") if by_day else ""}
             v.nombre,
             COALESCE(v.categoria, 'SIN CATEGORIA') AS categoria,
             COALESCE(SUM(v.cantidad), 0) AS unidades,
@@ -467,13 +779,21 @@ def q_top_productos(
         FROM {view_name} v
         {join_sql}
         {where2}
-        GROUP BY v.nombre, COALESCE(v.categoria, 'SIN CATEGORIA')
+        GROUP BY {_day_group("v") + ", " if by_day else ""}v.nombre, COALESCE(v.categoria, 'SIN CATEGORIA')
         ORDER BY total_vendido DESC
-        LIMIT {int(limit)};
+        {"" if by_day or limit is None else f"LIMIT {int(limit)}"};
         """
 
 
-def q_por_usuario(view_name: str, where_sql: str, limit: int = 20, *, use_impresion_log: bool = False) -> str:
+@tag_builder
+def q_por_usuario(
+    view_name: str,
+    where_sql: str,
+    limit: int | None = 20,
+    *,
+    use_impresion_log: bool = False,
+    by_day: bool = False,
+) -> str:
     cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
     where2 = _append_condition(where_sql, cond)
 
@@ -490,6 +810,7 @@ def q_por_usuario(view_name: str, where_sql: str, limit: int = 20, *, use_impres
 
     return f"""
         SELECT
+            {_day_select("v") if by_day else ""}
             COALESCE(v.usuario_reg, 'SIN USUARIO') AS usuario_reg,
             COALESCE(SUM(v.sub_total), 0) AS total_vendido,
             COUNT(DISTINCT v.id_comanda)  AS comandas,
@@ -498,12 +819,46 @@ def q_por_usuario(view_name: str, where_sql: str, limit: int = 20, *, use_impres
         FROM {view_name} v
         {join_sql}
         {where2}
-        GROUP BY COALESCE(v.usuario_reg, 'SIN USUARIO')
+        GROUP BY {_day_group("v") + ", " if by_day else ""}COALESCE(v.usuario_reg, 'SIN USUARIO')
         ORDER BY total_vendido DESC
-        LIMIT {int(limit)};
+        {"" if by_day or limit is None else f"LIMIT {int(limit)}"};
         """
 
 
+@tag_builder
+def q_comanda_productos(view_name: str, where_sql: str, *, use_impresion_log: bool = False) -> str:
+    """Pares (comanda, producto) distintos de ventas finalizadas, para análisis de canasta.
+
+    Una fila por producto presente en cada comanda (sin cantidades): la entrada de
+    `src/baskets.py`, que arma la matriz comanda × producto y cuenta los pares.
+    """
+
+    cond = _cond_venta_final("v") if not use_impresion_log else _cond_venta_final_impreso_log()
+    where2 = _append_condition(_append_condition(where_sql, cond), "v.nombre IS NOT NULL")
+
+    join_sql = ""
+    if use_impresion_log:
+        join_sql = """
+        LEFT JOIN vw_comanda_ultima_impresion imp
+            ON imp.id_comanda = v.id_comanda
+        LEFT JOIN parameter_table ei_log
+            ON ei_log.id = imp.ind_estado_impresion
+           AND ei_log.id_master = 10
+           AND ei_log.estado = 'HAB'
+        """
+
+    return f"""
+        SELECT DISTINCT
+            v.id_operacion,
+            v.id_comanda,
+            v.nombre
+        FROM {view_name} v
+        {join_sql}
+        {where2};
+        """
+
+
+@tag_builder
 def q_detalle(view_name: str, where_sql: str, limit: int = 500) -> str:
         return f"""
         SELECT
@@ -529,6 +884,7 @@ def q_detalle(view_name: str, where_sql: str, limit: int = 500) -> str:
         """
 
 
+@tag_builder
 def q_comandas_emision_times(view_name: str, where_sql: str, *, limit: int | None = None) -> str:
         """Timestamps de emisión por comanda (una fila por id_comanda).
 
@@ -568,6 +924,66 @@ def q_comandas_emision_times(view_name: str, where_sql: str, *, limit: int | Non
         """
 
 
+@tag_builder
+def q_comandas_emision_delta(view_name: str, where_sql: str) -> str:
+    """Timestamps de emisión de las comandas nuevas (`id_comanda > :cad_ultimo_id`).
+
+    Igual que `q_comandas_emision_times` (MIN(fecha_emision) por comanda) pero con la
+    operativa de cada comanda y solo lo que llegó desde la última lectura (ver
+    `src/cadence.py`). `id_comanda` es la PK de `bar_comanda`: el corte usa el índice.
+    """
+
+    where2 = _append_condition(where_sql, "id_comanda > :cad_ultimo_id")
+    return f"""
+        SELECT
+            id_operacion,
+            id_comanda,
+            MIN(fecha_emision) AS fecha_emision
+        FROM {view_name}
+        {where2}
+        GROUP BY id_operacion, id_comanda
+        ORDER BY id_comanda ASC;
+        """
+
+
+@tag_builder
+def q_snapshot_items(view_name: str) -> str:
+    """Filas de ítems de UNA operativa para el snapshot local (Arrow).
+
+    Trae solo las columnas que usan KPIs/gráficos/estado operativo/actividad, más el
+    nombre del último estado del log de impresión (`estado_impresion_log`) para poder
+    recalcular la variante "con log" sin volver a la base.
+
+    Parámetro: `:id_operacion`.
+    """
+
+    return f"""
+    SELECT
+        v.id_operacion,
+        v.id_comanda,
+        v.fecha_emision,
+        v.usuario_reg,
+        v.nombre,
+        v.categoria,
+        v.cantidad,
+        v.sub_total,
+        v.cor_subtotal_anterior,
+        v.tipo_salida,
+        v.estado_comanda,
+        v.estado_impresion,
+        ei_log.nombre AS estado_impresion_log
+    FROM {view_name} v
+    LEFT JOIN vw_comanda_ultima_impresion imp
+        ON imp.id_comanda = v.id_comanda
+    LEFT JOIN parameter_table ei_log
+        ON ei_log.id = imp.ind_estado_impresion
+       AND ei_log.id_master = 10
+       AND ei_log.estado = 'HAB'
+    WHERE v.id_operacion = :id_operacion;
+    """
+
+
+@tag_builder
 def q_impresion_snapshot(view_name: str, ids: list[int]) -> str:
     """Snapshot de estados de impresión para depuración.
 
@@ -636,27 +1052,57 @@ def fetch_dataframe(conn: Any, query: str, params: dict[str, Any] | None = None)
     Soporta:
     - `streamlit.connections.sql_connection.SQLConnection` (usa `conn.query`).
     - `mysql.connector` (usa cursor `dictionary=True`).
+
+    El resultado pasa por `normalize_fetched` (tipos compactos, ver `src/dtypes.py`).
+    Cada ejecución queda registrada en `src/perf.py` (tiempo en la base vs armado del
+    DataFrame, filas, bytes, sección) y, si supera el umbral, en el log de consultas
+    lentas con su `EXPLAIN` (`src/slow_queries.py`). Con `SQLConnection`, si la sesión pide
+    otro rerun mientras la consulta corre, se cancela en el servidor (`src/cancellation.py`).
     """
 
+    timer = QueryTimer(query)
+    try:
+        with timer:
+            if hasattr(conn, "query"):
+                instrument_connection(conn)
+                install_cancellation(conn)
+            return timer.result(normalize_fetched(_raw_query(conn, query, params, timer=timer), query))
+    finally:
+        record_if_slow(conn, query, params, timer.record, execute=_raw_query)
+
+
+def _raw_query(
+    conn: Any,
+    query: str,
+    params: dict[str, Any] | None = None,
+    *,
+    timer: QueryTimer | None = None,
+) -> pd.DataFrame:
+    """Ejecución sin normalizar ni registrar (también usada para `EXPLAIN`)."""
+
+    span = timer.database() if timer is not None else nullcontext()
     if hasattr(conn, "query"):
-        try:
-            return conn.query(query, params=params or {}, ttl=0)
-        except TypeError:
-            return conn.query(query, params=params or {})
+        with span:
+            try:
+                return conn.query(query, params=params or {}, ttl=0)
+            except TypeError:
+                return conn.query(query, params=params or {})
 
     query = _to_mysqlconnector_paramstyle(query)
 
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute(query, params or {})
-        rows: Iterable[dict[str, Any]] = cursor.fetchall()
+        with span:
+            cursor.execute(query, params or {})
+            rows: Iterable[dict[str, Any]] = cursor.fetchall()
         return pd.DataFrame(list(rows))
     finally:
         cursor.close()
 
 # ===== WAC / COGS / MÁRGENES =====
 
-def q_wac_cogs_summary(view_name: str, where_sql: str) -> str:
+@tag_builder
+def q_wac_cogs_summary(view_name: str, where_sql: str, *, by_operation: bool = False) -> str:
     """P&L consolidado de la operativa (ventas, COGS, margen).
 	
     Ejecutivo: lo que mira el dueño.
@@ -672,10 +1118,15 @@ def q_wac_cogs_summary(view_name: str, where_sql: str) -> str:
     Supuesto: vw_margen_comanda ya existe en la BD con columnas:
     - total_venta, cogs_comanda, margen_comanda
     - id_operacion (y/o fecha_emision si se usa filtro por fechas)
+
+    `by_operation=True`: una fila por `id_operacion` (tendencias por operativa).
     """
 	
+    op_sql = "v.id_operacion," if by_operation else ""
+    group_sql = "GROUP BY v.id_operacion ORDER BY v.id_operacion" if by_operation else ""
     return f"""
     SELECT
+        {op_sql}
         COALESCE(SUM(total_venta), 0) AS total_ventas,
         COALESCE(SUM(cogs_comanda), 0) AS total_cogs,
         COALESCE(SUM(margen_comanda), 0) AS total_margen,
@@ -684,10 +1135,12 @@ def q_wac_cogs_summary(view_name: str, where_sql: str) -> str:
             2
         ) AS margen_pct
     FROM {view_name} v
-    {where_sql};
+    {where_sql}
+    {group_sql};
     """
 
 
+@tag_builder
 def q_wac_cogs_detalle(view_name: str, where_sql: str, *, limit: int) -> str:
     """Detalle P&L por comanda.
 
@@ -709,6 +1162,7 @@ def q_wac_cogs_detalle(view_name: str, where_sql: str, *, limit: int) -> str:
     """
 
 
+@tag_builder
 def q_consumo_valorizado(view_name: str, where_sql: str, *, limit: int) -> str:
     """Consumo valorizado de insumos por producto.
 
@@ -734,6 +1188,7 @@ def q_consumo_valorizado(view_name: str, where_sql: str, *, limit: int) -> str:
     """
 
 
+@tag_builder
 def q_consumo_sin_valorar(view_name: str, where_sql: str, *, limit: int) -> str:
     """Consumo sin valorar (sanidad de cantidades).
 
@@ -758,6 +1213,7 @@ def q_consumo_sin_valorar(view_name: str, where_sql: str, *, limit: int) -> str:
     """
 
 
+@tag_builder
 def q_cogs_por_comanda(view_name: str, where_sql: str, *, limit: int) -> str:
     """COGS por comanda (sin ventas).
 
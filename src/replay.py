@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+"""Conexiones de grabación y reproducción para benchmarks sin la base del POS.
+
+- `RecordingConnection(conn, directorio)`: envuelve una conexión real (`SQLConnection`
+  o `mysql.connector`) y guarda cada resultado como Arrow junto a un índice JSONL
+  (builder, SQL, params, filas, ms).
+- `ReplayConnection(directorio)`: sirve esas grabaciones sin base. La respuesta es
+  determinista: la n-ésima ejecución de un mismo (SQL, params) devuelve el resultado
+  que tenía en la n-ésima ejecución grabada (si no cambió, se guarda una sola versión).
+  Una consulta no grabada levanta `ReplayMiss`.
+- Latencia simulada opcional: fija (ms) o la grabada (`"recorded"`).
+
+Ambas exponen `.query(sql, params=..., ttl=...)` como `SQLConnection`, así que
+`fetch_dataframe` y la instrumentación (`src/perf.py`) las tratan igual que a una real.
+`get_connection` las activa con `DASHBACK_RECORD_DIR` / `DASHBACK_REPLAY_DIR` (ver
+`src/db.py`).
+
+Grabación y reproducción usan el mismo cache local (`.cache/replay_<directorio>/`).
+Para reproducir un arranque en frío, borrar ese directorio (o usar otro
+`DASHBACK_CACHE_DIR`) antes de grabar y antes de cada corrida.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+
+from src.local_store import read_arrow, write_arrow
+from src.perf import query_name
+from src.query_store import _raw_query
+
+
+RECORD_DIR_ENV = "DASHBACK_RECORD_DIR"
+REPLAY_DIR_ENV = "DASHBACK_REPLAY_DIR"
+REPLAY_LATENCY_ENV = "DASHBACK_REPLAY_LATENCY_MS"  # ms fijos o "recorded"
+
+INDEX_NAME = "index.jsonl"
+RESULTS_DIR = "results"
+
+
+class ReplayMiss(LookupError):
+    """La consulta no está en la grabación."""
+
+
+def recording_key(sql: str, params: dict[str, Any] | None) -> str:
+    """Clave estable de (SQL, params): espacios normalizados y params ordenados."""
+
+    payload = json.dumps(
+        {"sql": " ".join(str(sql).split()), "params": params or {}},
+        sort_keys=True,
+        default=str,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _connection_name(directory: Path) -> str:
+    return f"replay_{directory.resolve().name}"
+
+
+def _to_table(df: pd.DataFrame) -> tuple[pa.Table, list[str]]:
+    """DataFrame → Arrow. Columnas object que Arrow no puede tipar se guardan como texto."""
+
+    df = df if df is not None else pd.DataFrame()
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False), []
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        pass
+    as_text: list[str] = []
+    out = df.copy()
+    for col in out.columns:
+        try:
+            pa.array(out[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            out[col] = out[col].map(lambda v: None if v is None else str(v))
+            as_text.append(str(col))
+    return pa.Table.from_pandas(out, preserve_index=False), as_text
+
+
+@dataclass(frozen=True)
+class RecordedVersion:
+    """Resultado grabado de una consulta, vigente desde la llamada `desde_llamada`."""
+
+    desde_llamada: int
+    archivo: str
+    ms: float
+
+
+def _load_index(directory: Path) -> dict[str, list[RecordedVersion]]:
+    versions: dict[str, list[RecordedVersion]] = {}
+    index = directory / INDEX_NAME
+    if not index.exists():
+        return versions
+    with index.open(encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            versions.setdefault(entry["key"], []).append(
+                RecordedVersion(int(entry["desde_llamada"]), str(entry["archivo"]), float(entry.get("ms") or 0.0))
+            )
+    for items in versions.values():
+        items.sort(key=lambda v: v.desde_llamada)
+    return versions
+
+
+class RecordingConnection:
+    """Conexión real + grabación de cada resultado (Arrow) en `directory`."""
+
+    def __init__(self, conn: Any, directory: str | Path):
+        self.conn = conn
+        self.directory = Path(directory)
+        (self.directory / RESULTS_DIR).mkdir(parents=True, exist_ok=True)
+        self._connection_name = _connection_name(self.directory)
+        self._lock = threading.Lock()
+        versions = _load_index(self.directory)
+        # Se continúa una grabación existente: la próxima llamada va después de la última versión.
+        self._calls: dict[str, int] = {key: items[-1].desde_llamada + 1 for key, items in versions.items()}
+        self._last: dict[str, pa.Table] = {}
+
+    def query(self, sql: str, params: dict[str, Any] | None = None, ttl: Any = None, **kwargs: Any) -> pd.DataFrame:
+        t0 = time.perf_counter()
+        df = _raw_query(self.conn, sql, params)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        self._record(sql, params, df, elapsed_ms)
+        return df
+
+    def _record(self, sql: str, params: dict[str, Any] | None, df: pd.DataFrame, elapsed_ms: float) -> None:
+        key = recording_key(sql, params)
+        table, as_text = _to_table(df)
+        with self._lock:
+            call = self._calls.get(key, 0)
+            self._calls[key] = call + 1
+            previous = self._last.get(key)
+            if previous is not None and previous.equals(table):
+                return
+            self._last[key] = table
+            archivo = f"{RESULTS_DIR}/{key}_{call}.arrow"
+            write_arrow(self.directory / archivo, table)
+            entry = {
+                "key": key,
+                "desde_llamada": call,
+                "archivo": archivo,
+                "consulta": query_name(sql),
+                "ms": round(elapsed_ms, 2),
+                "filas": int(table.num_rows),
+                "columnas_texto": as_text,
+                "sql": sql.strip(),
+                "params": params or {},
+                "grabado_en": datetime.now().isoformat(timespec="seconds"),
+            }
+            with (self.directory / INDEX_NAME).open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+class ReplayConnection:
+    """Sirve una grabación de `RecordingConnection` sin base de datos."""
+
+    def __init__(self, directory: str | Path, *, latency_ms: float | str | None = None):
+        self.directory = Path(directory)
+        if not (self.directory / INDEX_NAME).exists():
+            raise FileNotFoundError(f"No hay grabación en {self.directory} (falta {INDEX_NAME}).")
+        self._connection_name = _connection_name(self.directory)
+        self.latency_ms = latency_ms
+        self._versions = _load_index(self.directory)
+        self._calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def query(self, sql: str, params: dict[str, Any] | None = None, ttl: Any = None, **kwargs: Any) -> pd.DataFrame:
+        key = recording_key(sql, params)
+        versions = self._versions.get(key)
+        if not versions:
+            raise ReplayMiss(f"Consulta no grabada: {query_name(sql)} (params={params or {}})")
+        with self._lock:
+            call = self._calls.get(key, 0)
+            self._calls[key] = call + 1
+        version = versions[0]
+        for candidate in versions:
+            if candidate.desde_llamada > call:
+                break
+            version = candidate
+
+        delay_ms = version.ms if self.latency_ms == "recorded" else float(self.latency_ms or 0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        table = read_arrow(self.directory / version.archivo, record=False)
+        if table is None:
+            raise ReplayMiss(f"Falta el archivo grabado {version.archivo}")
+        return table.to_pandas()
+
+    def reset(self) -> None:
+        """Vuelve a la primera versión de cada consulta (nueva corrida del benchmark)."""
+
+        with self._lock:
+            self._calls.clear()
+
+
+def parse_latency(value: str | None) -> float | str | None:
+    """`DASHBACK_REPLAY_LATENCY_MS`: número de ms, `recorded` o vacío (sin latencia)."""
+
+    if not value:
+        return None
+    if value.strip().lower() == "recorded":
+        return "recorded"
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+"""Rollups por operativa cerrada (KPIs + P&L en una fila).
+
+Se generan una vez cuando la operativa pasa a CERRADO (23) (ver `src/lifecycle.py`)
+y se guardan como Arrow (`.cache/<conexión>/rollups/op_<id>.arrow`).
+
+- KPIs: se calculan desde el snapshot de la operativa (`src/snapshots.py`).
+- P&L: `q_wac_cogs_summary` sobre `vw_margen_comanda` para esa operativa.
+
+Un rollup solo se guarda con su P&L: si la consulta falla, se reintenta más adelante.
+
+Un rango de operativas se sirve desde rollups solo si todas están cerradas y tienen
+rollup; las sumas se recombinan y los porcentajes/tickets se recalculan.
+"""
+
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+import pyarrow as pa
+
+from src.local_store import connection_key, read_arrow, store_dir, write_arrow
+from src.query_store import Filters, build_where, fetch_dataframe, q_wac_cogs_summary
+from src.snapshots import (
+    build_operation_snapshot,
+    get_snapshot_coverage,
+    load_snapshot_range,
+    snapshot_kpis,
+)
+
+
+PNL_VIEW = "vw_margen_comanda"
+
+KPI_SUM_COLUMNS = [
+    "total_vendido",
+    "total_comandas",
+    "items_vendidos",
+    "total_vendido_impreso_log",
+    "total_comandas_impreso_log",
+    "items_vendidos_impreso_log",
+    "total_cortesia",
+    "items_cortesia",
+    "comandas_cortesia",
+]
+PNL_SUM_COLUMNS = ["total_ventas", "total_cogs", "total_margen"]
+
+# Rangos (conexión, op_ini, op_fin) ya verificados como cerrados y con rollup.
+_COVERED_RANGES: dict[tuple[str, int, int], tuple[int, ...]] = {}
+
+
+def _rollup_path(conn: Any, operacion_id: int) -> Path:
+    return store_dir(conn, "rollups") / f"op_{int(operacion_id)}.arrow"
+
+
+def has_rollup(conn: Any, operacion_id: int) -> bool:
+    return _rollup_path(conn, operacion_id).exists()
+
+
+def _pnl_for_operation(conn: Any, operacion_id: int) -> dict[str, float]:
+    where_sql, params = build_where(
+        Filters(op_ini=int(operacion_id), op_fin=int(operacion_id)), "ops", table_alias="v"
+    )
+    df = fetch_dataframe(conn, q_wac_cogs_summary(PNL_VIEW, where_sql), params)
+    row = df.iloc[0].to_dict() if df is not None and not df.empty else {}
+    return {col: float(pd.to_numeric(row.get(col), errors="coerce") or 0.0) for col in PNL_SUM_COLUMNS}
+
+
+def build_operation_rollup(conn: Any, operacion_id: int) -> dict[str, Any]:
+    """Genera (o regenera) el rollup de una operativa cerrada. Devuelve la fila escrita.
+
+    Si falla el P&L la fila se devuelve con `pnl_disponible=False` pero no se guarda:
+    el fallo puede ser pasajero (o un `KILL QUERY`) y un rollup guardado no se recalcula.
+    La próxima serie (`operation_series`) lo vuelve a intentar.
+    """
+
+    snap = load_snapshot_range(conn, operacion_id, operacion_id)
+    if snap is None:
+        build_operation_snapshot(conn, operacion_id)
+        snap = load_snapshot_range(conn, operacion_id, operacion_id)
+    if snap is None:
+        raise ValueError(f"La operativa #{operacion_id} no está cerrada o no tiene snapshot")
+
+    row: dict[str, Any] = {"id_operacion": int(operacion_id)}
+    kpis = snapshot_kpis(snap)
+    row.update({col: float(kpis.get(col) or 0) for col in KPI_SUM_COLUMNS})
+
+    # El P&L depende de otra vista: si falla, la fila queda solo con KPIs y sin guardar.
+    try:
+        row.update(_pnl_for_operation(conn, operacion_id))
+        row["pnl_disponible"] = True
+    except Exception:
+        row.update({col: 0.0 for col in PNL_SUM_COLUMNS})
+        row["pnl_disponible"] = False
+        return row
+
+    return write_rollup(conn, row)
+
+
+def write_rollup(conn: Any, row: dict[str, Any]) -> dict[str, Any]:
+    """Guarda una fila de rollup (`id_operacion` + KPI_SUM_COLUMNS + PNL_SUM_COLUMNS)."""
+
+    row = {
+        "id_operacion": int(row["id_operacion"]),
+        **{col: float(row.get(col) or 0) for col in KPI_SUM_COLUMNS + PNL_SUM_COLUMNS},
+        "pnl_disponible": bool(row.get("pnl_disponible")),
+        "generado_en": time.time(),
+    }
+    write_arrow(_rollup_path(conn, row["id_operacion"]), pa.Table.from_pylist([row]))
+    return row
+
+
+def load_rollup_range(conn: Any, op_ini: int | None, op_fin: int | None) -> pd.DataFrame | None:
+    """Filas de rollup del rango, o `None` si alguna operativa no está cerrada o no tiene rollup."""
+
+    if op_ini is None or op_fin is None:
+        return None
+
+    key = (connection_key(conn), int(op_ini), int(op_fin))
+    op_ids = _COVERED_RANGES.get(key)
+    if op_ids is None:
+        coverage = get_snapshot_coverage(conn, int(op_ini), int(op_fin))
+        if not coverage.operaciones or len(coverage.cerradas) != len(coverage.operaciones):
+            return None
+        if not all(has_rollup(conn, op) for op in coverage.operaciones):
+            return None
+        op_ids = coverage.operaciones
+        _COVERED_RANGES[key] = op_ids
+
+    tables: list[pa.Table] = []
+    for op_id in op_ids:
+        table = read_arrow(_rollup_path(conn, op_id))
+        if table is None:
+            _COVERED_RANGES.pop(key, None)
+            return None
+        tables.append(table)
+    return pa.concat_tables(tables, promote_options="default").to_pandas()
+
+
+def load_rollups(conn: Any, op_ids: list[int]) -> pd.DataFrame:
+    """Filas de rollup de las operativas que lo tengan (las demás se omiten).
+
+    Los rollups guardados sin P&L (`pnl_disponible=False`, de versiones anteriores) se
+    tratan como faltantes, para que `operation_series` vuelva a consultar su P&L.
+    """
+
+    tables = [
+        table
+        for table in (read_arrow(_rollup_path(conn, op)) for op in op_ids if has_rollup(conn, op))
+        if table is not None
+    ]
+    columns = ["id_operacion", *KPI_SUM_COLUMNS, *PNL_SUM_COLUMNS, "pnl_disponible"]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    df = df[df["pnl_disponible"].astype(bool)] if "pnl_disponible" in df else df.iloc[0:0]
+    return df.reset_index(drop=True) if not df.empty else pd.DataFrame(columns=columns)
+
+
+def operation_series(
+    conn: Any,
+    op_ids: list[int],
+    cerradas: set[int],
+    *,
+    fetch_kpis: Callable[[int, int], pd.DataFrame],
+    fetch_pnl: Callable[[int, int], pd.DataFrame],
+) -> pd.DataFrame:
+    """KPIs + P&L por operativa: rollups para las cerradas, una consulta agrupada para el resto.
+
+    `fetch_kpis` / `fetch_pnl` reciben `(op_ini, op_fin)` y devuelven una fila por
+    `id_operacion` (`q_kpis(..., by_operation=True)` / `q_wac_cogs_summary(..., by_operation=True)`).
+    Las cerradas que no tenían rollup quedan guardadas: la próxima vez no se consultan.
+    Si falla el P&L no se guarda nada (se reintenta en la próxima serie).
+    """
+
+    op_ids = sorted(int(op) for op in op_ids)
+    rolled = load_rollups(conn, [op for op in op_ids if op in cerradas])
+    have = set(pd.to_numeric(rolled["id_operacion"]).astype(int)) if not rolled.empty else set()
+    missing = [op for op in op_ids if op not in have]
+    rolled = rolled.drop(columns=["generado_en"], errors="ignore")
+    if not missing:
+        return rolled.sort_values("id_operacion").reset_index(drop=True)
+
+    # Un solo tramo para todas las faltantes: filas de operativas ya cubiertas se descartan.
+    op_ini, op_fin = missing[0], missing[-1]
+    kpis = fetch_kpis(op_ini, op_fin)
+    fresh = pd.DataFrame({"id_operacion": missing})
+    if kpis is not None and not kpis.empty:
+        kpis = kpis.assign(id_operacion=pd.to_numeric(kpis["id_operacion"]).astype(int))
+        fresh = fresh.merge(kpis[["id_operacion", *KPI_SUM_COLUMNS]], on="id_operacion", how="left")
+
+    try:
+        pnl = fetch_pnl(op_ini, op_fin)
+        pnl_ok = True
+    except Exception:
+        pnl, pnl_ok = None, False
+    if pnl is not None and not pnl.empty:
+        pnl = pnl.assign(id_operacion=pd.to_numeric(pnl["id_operacion"]).astype(int))
+        fresh = fresh.merge(pnl[["id_operacion", *PNL_SUM_COLUMNS]], on="id_operacion", how="left")
+    for col in KPI_SUM_COLUMNS + PNL_SUM_COLUMNS:
+        fresh[col] = pd.to_numeric(fresh[col], errors="coerce").fillna(0.0) if col in fresh else 0.0
+    fresh["pnl_disponible"] = pnl_ok
+
+    if pnl_ok:
+        for row in fresh.to_dict(orient="records"):
+            if int(row["id_operacion"]) in cerradas:
+                write_rollup(conn, row)
+
+    frames = [df for df in (rolled, fresh) if not df.empty]
+    out = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return out.sort_values("id_operacion").reset_index(drop=True)
+
+
+def rollup_pnl(rollups: pd.DataFrame) -> dict[str, float] | None:
+    """P&L del rango (mismas claves que `get_wac_cogs_summary`), o `None` si falta el P&L."""
+
+    if rollups is None or rollups.empty or not bool(rollups["pnl_disponible"].all()):
+        return None
+    totals = {col: float(rollups[col].sum()) for col in PNL_SUM_COLUMNS}
+    ventas = totals["total_ventas"]
+    totals["margen_pct"] = round(totals["total_margen"] / ventas * 100, 2) if ventas else 0.0
+    return totals
+
+
+def forget_covered_ranges() -> None:
+    """Olvida los rangos verificados (p.ej. tras borrar el cache local)."""
+
+    _COVERED_RANGES.clear()
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+"""Registro de consultas lentas con su plan (`EXPLAIN`).
+
+Toda consulta de `fetch_dataframe` que supere el umbral (`DASHBACK_SLOW_QUERY_MS`,
+1.500 ms por defecto; ajustable en la UI) se agrega a un JSONL local:
+
+    .cache/<conexión>/slow_queries/slow_queries.jsonl (+ .1, .2, .3 al rotar)
+
+Cada línea trae builder (`q_*` / `Q_*`), sección, duración (total / base / DataFrame),
+filas, SQL, params y el `EXPLAIN` tabular de MySQL 5.6 (id, select_type, table, type,
+possible_keys, key, rows, Extra).
+
+- El `EXPLAIN` corre en segundo plano (con `SQLConnection`): no suma latencia a un render
+  que ya fue lento. Con `mysql.connector` (conexión no compartible entre hilos) corre en línea.
+- Un mismo SQL se explica a lo sumo una vez cada `EXPLAIN_TTL_SECONDS`; mientras tanto se
+  reutiliza el plan ya capturado.
+- Costo: en MySQL 5.6 `EXPLAIN` materializa las subconsultas de las vistas, es decir,
+  repite el recorrido de la consulta lenta. Por eso el `EXPLAIN` automático
+  (`DASHBACK_SLOW_QUERY_EXPLAIN`) viene desactivado en Producción (`mysql_prod`): la
+  consulta se registra igual, sin plan. "1" lo activa en todas las conexiones y "0" lo
+  desactiva en todas. El asesor de índices sigue disponible a pedido.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+
+from src.local_store import connection_key, is_production, store_dir
+from src.perf import QueryRecord
+
+
+THRESHOLD_ENV = "DASHBACK_SLOW_QUERY_MS"
+DEFAULT_THRESHOLD_MS = 1500.0
+# "1" = EXPLAIN automático siempre; "0" = nunca; vacío = todas menos Producción.
+EXPLAIN_ENV = "DASHBACK_SLOW_QUERY_EXPLAIN"
+
+LOG_NAME = "slow_queries.jsonl"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+EXPLAIN_TTL_SECONDS = 600.0
+EXPLAIN_COLUMNS = ["id", "select_type", "table", "type", "possible_keys", "key", "key_len", "ref", "rows", "Extra"]
+
+_threshold_override: float | None = None
+# (conexión, hash del SQL) -> (monotonic, plan)
+_EXPLAINED: dict[tuple[str, str], tuple[float, list[dict[str, Any]]]] = {}
+_LOCK = threading.Lock()
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dashback-explain")
+
+
+def get_threshold_ms() -> float:
+    """Umbral vigente: el ajustado en la UI o, si no, `DASHBACK_SLOW_QUERY_MS`."""
+
+    if _threshold_override is not None:
+        return _threshold_override
+    try:
+        return float(os.environ.get(THRESHOLD_ENV) or DEFAULT_THRESHOLD_MS)
+    except ValueError:
+        return DEFAULT_THRESHOLD_MS
+
+
+def set_threshold_ms(value: float | None) -> None:
+    """Ajusta el umbral para todo el proceso (`None` vuelve al valor de entorno)."""
+
+    global _threshold_override
+    _threshold_override = float(value) if value is not None else None
+
+
+def auto_explain_enabled(conn: Any) -> bool:
+    """¿Se corre `EXPLAIN` automático sobre las consultas lentas de `conn`?"""
+
+    value = os.environ.get(EXPLAIN_ENV, "").strip()
+    if value in ("0", "1"):
+        return value == "1"
+    return not is_production(conn)
+
+
+def _log_path(conn: Any) -> Path:
+    return store_dir(conn, "slow_queries") / LOG_NAME
+
+
+def _rotate(path: Path) -> None:
+    if not path.exists() or path.stat().st_size < LOG_MAX_BYTES:
+        return
+    for i in range(LOG_BACKUPS, 0, -1):
+        src = path if i == 1 else path.with_name(f"{path.name}.{i - 1}")
+        if src.exists():
+            os.replace(src, path.with_name(f"{path.name}.{i}"))
+
+
+def _append_entry(conn: Any, entry: dict[str, Any]) -> None:
+    path = _log_path(conn)
+    line = json.dumps(entry, ensure_ascii=False, default=str)
+    with _LOCK:
+        _rotate(path)
+        with path.open("a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+
+def _plan_rows(df: pd.DataFrame | None) -> list[dict[str, Any]]:
+    if df is None or df.empty:
+        return []
+    cols = [c for c in EXPLAIN_COLUMNS if c in df.columns] or list(df.columns)
+    df = df[cols].astype(object).where(df[cols].notna(), None)
+    return df.to_dict(orient="records")
+
+
+def plan_warnings(plan: list[dict[str, Any]]) -> list[str]:
+    """Alertas legibles de un plan: full scans y tablas temporales / filesort."""
+
+    warnings: list[str] = []
+    for row in plan:
+        table = row.get("table") or "?"
+        extra = str(row.get("Extra") or "")
+        if str(row.get("type") or "").upper() == "ALL":
+            warnings.append(f"full scan {table} (~{row.get('rows')} filas)")
+        if "Using temporary" in extra:
+            warnings.append(f"temporary {table}")
+        if "Using filesort" in extra:
+            warnings.append(f"filesort {table}")
+    return warnings
+
+
+def _explain(
+    conn: Any,
+    sql: str,
+    params: dict[str, Any] | None,
+    execute: Callable[[Any, str, dict[str, Any] | None], pd.DataFrame],
+) -> tuple[list[dict[str, Any]], str | None, bool]:
+    """Plan del SQL (reutiliza uno reciente). Devuelve (plan, error, reutilizado)."""
+
+    key = (connection_key(conn), hashlib.sha1(sql.encode("utf-8")).hexdigest())
+    now = time.monotonic()
+    with _LOCK:
+        cached = _EXPLAINED.get(key)
+    if cached is not None and now - cached[0] < EXPLAIN_TTL_SECONDS:
+        return cached[1], None, True
+
+    try:
+        plan = _plan_rows(execute(conn, f"EXPLAIN {sql.strip()}", params))
+    except Exception as exc:
+        return [], str(exc), False
+    with _LOCK:
+        _EXPLAINED[key] = (now, plan)
+    return plan, None, False
+
+
+def _capture(
+    conn: Any,
+    sql: str,
+    params: dict[str, Any] | None,
+    record: QueryRecord,
+    execute: Callable[[Any, str, dict[str, Any] | None], pd.DataFrame],
+) -> None:
+    if auto_explain_enabled(conn):
+        plan, error, reused = _explain(conn, sql, params, execute)
+    else:
+        plan, error, reused = [], f"EXPLAIN automático desactivado en esta conexión ({EXPLAIN_ENV})", False
+    _append_entry(
+        conn,
+        {
+            "registrado_en": record.registrado_en.isoformat(timespec="seconds"),
+            "consulta": record.consulta,
+            "seccion": record.seccion,
+            "total_ms": record.total_ms,
+            "db_ms": record.db_ms,
+            "frame_ms": record.frame_ms,
+            "filas": record.filas,
+            "error": record.error,
+            "umbral_ms": get_threshold_ms(),
+            "sql": sql.strip(),
+            "params": params or {},
+            "explain": plan,
+            "explain_error": error,
+            "explain_reutilizado": reused,
+            "alertas": plan_warnings(plan),
+        },
+    )
+
+
+def record_if_slow(
+    conn: Any,
+    sql: str,
+    params: dict[str, Any] | None,
+    record: QueryRecord | None,
+    *,
+    execute: Callable[[Any, str, dict[str, Any] | None], pd.DataFrame],
+) -> bool:
+    """Registra la consulta si superó el umbral. `execute` corre SQL sin instrumentar.
+
+    Nunca propaga errores: el registro no debe romper el dashboard.
+    """
+
+    if record is None or record.total_ms < get_threshold_ms():
+        return False
+    if not sql.lstrip().upper().startswith(("SELECT", "/*", "(")):
+        return False
+    try:
+        if hasattr(conn, "query"):
+            _EXECUTOR.submit(_capture, conn, sql, params, record, execute)
+        else:
+            _capture(conn, sql, params, record, execute)
+    except Exception:
+        return False
+    return True
+
+
+def read_slow_log(conn: Any, *, limit: int = 500) -> pd.DataFrame:
+    """Últimas entradas del log (archivo actual + rotados), más reciente primero."""
+
+    path = _log_path(conn)
+    files = [path.with_name(f"{path.name}.{i}") for i in range(LOG_BACKUPS, 0, -1)] + [path]
+    entries: list[dict[str, Any]] = []
+    with _LOCK:
+        for file in files:
+            if not file.exists():
+                continue
+            with file.open(encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+    df = pd.DataFrame(entries[::-1][: int(limit)])
+    if not df.empty:
+        df["registrado_en"] = pd.to_datetime(df["registrado_en"], errors="coerce")
+    return df
+
+
+def worst_offenders(log: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por builder: veces, p50/máx, tiempo acumulado y alertas del último plan."""
+
+    columns = ["consulta", "veces", "p50_ms", "max_ms", "total_s", "ultima", "secciones", "alertas"]
+    if log is None or log.empty:
+        return pd.DataFrame(columns=columns)
+
+    rows: list[dict[str, Any]] = []
+    for name, group in log.groupby("consulta", sort=False):
+        latest = group.sort_values("registrado_en").iloc[-1]
+        rows.append(
+            {
+                "consulta": name,
+                "veces": int(len(group)),
+                "p50_ms": round(float(group["total_ms"].median()), 1),
+                "max_ms": round(float(group["total_ms"].max()), 1),
+                "total_s": round(float(group["total_ms"].sum()) / 1000, 2),
+                "ultima": latest["registrado_en"],
+                "secciones": ", ".join(sorted({str(s) for s in group["seccion"].dropna()})),
+                "alertas": "; ".join(latest.get("alertas") or []),
+            }
+        )
+    return pd.DataFrame(rows, columns=columns).sort_values("total_s", ascending=False).reset_index(drop=True)
+
+
+def clear_slow_log(conn: Any) -> None:
+    path = _log_path(conn)
+    with _LOCK:
+        for i in range(LOG_BACKUPS, -1, -1):
+            file = path if i == 0 else path.with_name(f"{path.name}.{i}")
+            file.unlink(missing_ok=True)
+        _EXPLAINED.clear()
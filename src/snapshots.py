@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+"""Snapshots locales (Arrow IPC) de operativas cerradas.
+
+Las filas de ítems de `comandas_v6_todas` para una operativa CERRADA (23) ya no
+cambian. Se guardan una vez por operativa como archivo Arrow y se abren con
+memory mapping: el histórico por operativas se agrega con `pyarrow.compute`
+sin traer filas por red ni materializarlas en RAM.
+
+Flujo:
+- `ensure_snapshots(conn, op_ini, op_fin)`: genera los snapshots faltantes del rango.
+- `load_snapshot_range(conn, op_ini, op_fin)`: devuelve la tabla (zero-copy) solo si
+  TODO el rango está cerrado y cubierto; si no, `None` (la capa de servicio cae a SQL).
+- `snapshot_*`: agregaciones equivalentes a los `q_*` de `src/query_store.py`.
+"""
+
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.local_store import connection_key, read_arrow, store_dir, write_arrow
+from src.perf import record_cache_hit
+from src.query_store import Q_OPERATIONS_IN_RANGE, fetch_dataframe, q_snapshot_items
+
+
+SNAPSHOT_VIEW = "comandas_v6_todas"
+ESTADO_OPERACION_CERRADA = 23
+
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        ("id_operacion", pa.int64()),
+        ("id_comanda", pa.int64()),
+        ("fecha_emision", pa.timestamp("us")),
+        ("usuario_reg", pa.string()),
+        ("nombre", pa.string()),
+        ("categoria", pa.string()),
+        ("cantidad", pa.float64()),
+        ("sub_total", pa.float64()),
+        ("cor_subtotal_anterior", pa.float64()),
+        ("tipo_salida", pa.string()),
+        ("estado_comanda", pa.string()),
+        ("estado_impresion", pa.string()),
+        ("estado_impresion_log", pa.string()),
+    ]
+)
+
+# Rangos (conexión, op_ini, op_fin) ya verificados como cerrados y cubiertos.
+# Una operativa cerrada no vuelve a cambiar, así que el resultado es estable.
+_COVERED_RANGES: dict[tuple[str, int, int], tuple[int, ...]] = {}
+
+# Estado (existentes, cerradas) de cada rango consultado, también de los NO cubiertos: sin
+# esto, un rango sin snapshots (lo normal hasta generarlos) repetía `Q_OPERATIONS_IN_RANGE`
+# en cada `get_*` del rerun. Vence a los `RANGE_STATE_TTL_SECONDS` (una operativa puede
+# cerrarse); la existencia de los archivos se revisa en cada llamada.
+RANGE_STATE_TTL_SECONDS = 60.0
+_RANGE_STATES: dict[tuple[str, int, int], tuple[float, tuple[int, ...], tuple[int, ...]]] = {}
+
+
+@dataclass(frozen=True)
+class SnapshotCoverage:
+    """Estado de cobertura de un rango de operativas."""
+
+    operaciones: tuple[int, ...]
+    cerradas: tuple[int, ...]
+    con_snapshot: tuple[int, ...]
+
+    @property
+    def covered(self) -> bool:
+        return bool(self.operaciones) and len(self.con_snapshot) == len(self.operaciones)
+
+    @property
+    def faltantes(self) -> tuple[int, ...]:
+        done = set(self.con_snapshot)
+        return tuple(op for op in self.cerradas if op not in done)
+
+
+def _snapshot_dir(conn: Any) -> Path:
+    return store_dir(conn, "snapshots", SNAPSHOT_VIEW)
+
+
+def _snapshot_path(conn: Any, operacion_id: int) -> Path:
+    return _snapshot_dir(conn) / f"op_{int(operacion_id)}.arrow"
+
+
+def _to_snapshot_table(df: pd.DataFrame | None) -> pa.Table:
+    if df is None or df.empty:
+        return SNAPSHOT_SCHEMA.empty_table()
+
+    columns: dict[str, pa.Array] = {}
+    for field in SNAPSHOT_SCHEMA:
+        if field.name not in df.columns:
+            columns[field.name] = pa.nulls(len(df), type=field.type)
+            continue
+        col = df[field.name]
+        if pa.types.is_floating(field.type):
+            col = pd.to_numeric(col, errors="coerce")
+        elif pa.types.is_timestamp(field.type):
+            col = pd.to_datetime(col, errors="coerce")
+        elif pa.types.is_string(field.type):
+            col = col.astype(object).where(col.notna(), None)
+        columns[field.name] = pa.array(col, type=field.type, from_pandas=True)
+    return pa.Table.from_pydict(columns, schema=SNAPSHOT_SCHEMA)
+
+
+def build_operation_snapshot(conn: Any, operacion_id: int) -> int:
+    """Genera (o regenera) el snapshot de una operativa. Devuelve filas escritas."""
+
+    df = fetch_dataframe(conn, q_snapshot_items(SNAPSHOT_VIEW), {"id_operacion": int(operacion_id)})
+    table = _to_snapshot_table(df)
+    write_arrow(_snapshot_path(conn, operacion_id), table)
+    return table.num_rows
+
+
+def get_snapshot_coverage(conn: Any, op_ini: int, op_fin: int) -> SnapshotCoverage:
+    """Qué operativas del rango existen/están cerradas (por PK, memorizado) y cuáles tienen snapshot."""
+
+    key = (connection_key(conn), int(op_ini), int(op_fin))
+    state = _RANGE_STATES.get(key)
+    if state is not None and time.monotonic() - state[0] < RANGE_STATE_TTL_SECONDS:
+        operaciones, cerradas = state[1], state[2]
+    else:
+        df = fetch_dataframe(conn, Q_OPERATIONS_IN_RANGE, {"op_ini": int(op_ini), "op_fin": int(op_fin)})
+        ops: list[int] = []
+        closed: list[int] = []
+        if df is not None and not df.empty:
+            for row in df.to_dict(orient="records"):
+                op_id = int(row["id_operacion"])
+                ops.append(op_id)
+                estado = row.get("estado_operacion_id")
+                if estado is not None and int(estado) == ESTADO_OPERACION_CERRADA:
+                    closed.append(op_id)
+        operaciones, cerradas = tuple(ops), tuple(closed)
+        _RANGE_STATES[key] = (time.monotonic(), operaciones, cerradas)
+
+    con_snapshot = [op for op in cerradas if _snapshot_path(conn, op).exists()]
+    return SnapshotCoverage(operaciones, cerradas, tuple(con_snapshot))
+
+
+def cached_snapshot_coverage(conn: Any, op_ini: int, op_fin: int) -> SnapshotCoverage | None:
+    """Cobertura del rango si su estado ya está memorizado (sin consultar); si no, `None`."""
+
+    key = (connection_key(conn), int(op_ini), int(op_fin))
+    covered = _COVERED_RANGES.get(key)
+    if covered is not None:
+        # Verificado como cerrado y cubierto: no vence (una operativa cerrada no cambia).
+        return SnapshotCoverage(covered, covered, covered)
+    state = _RANGE_STATES.get(key)
+    if state is None or time.monotonic() - state[0] >= RANGE_STATE_TTL_SECONDS:
+        return None
+    con_snapshot = [op for op in state[2] if _snapshot_path(conn, op).exists()]
+    return SnapshotCoverage(state[1], state[2], tuple(con_snapshot))
+
+
+def ensure_snapshots(conn: Any, op_ini: int, op_fin: int) -> SnapshotCoverage:
+    """Genera los snapshots faltantes de las operativas cerradas del rango."""
+
+    coverage = get_snapshot_coverage(conn, op_ini, op_fin)
+    for op_id in coverage.faltantes:
+        build_operation_snapshot(conn, op_id)
+    return get_snapshot_coverage(conn, op_ini, op_fin)
+
+
+@lru_cache(maxsize=1024)
+def _open_snapshot(path: str, mtime_ns: int) -> pa.Table | None:
+    # `mtime_ns` forma parte de la key: si el archivo se regenera, se vuelve a mapear.
+    return read_arrow(Path(path), record=False)
+
+
+def load_snapshot_range(conn: Any, op_ini: int | None, op_fin: int | None) -> pa.Table | None:
+    """Tabla Arrow (memory-mapped) con las filas del rango, o `None` si no está cubierto."""
+
+    if op_ini is None or op_fin is None:
+        return None
+
+    key = (connection_key(conn), int(op_ini), int(op_fin))
+    op_ids = _COVERED_RANGES.get(key)
+    if op_ids is None:
+        coverage = get_snapshot_coverage(conn, int(op_ini), int(op_fin))
+        if not coverage.covered:
+            return None
+        op_ids = coverage.operaciones
+        _COVERED_RANGES[key] = op_ids
+
+    tables: list[pa.Table] = []
+    for op_id in op_ids:
+        path = _snapshot_path(conn, op_id)
+        if not path.exists():
+            _COVERED_RANGES.pop(key, None)
+            return None
+        table = _open_snapshot(str(path), path.stat().st_mtime_ns)
+        if table is None:
+            return None
+        tables.append(table)
+
+    # concat_tables no copia buffers: solo encadena los chunks mapeados.
+    table = pa.concat_tables(tables) if tables else SNAPSHOT_SCHEMA.empty_table()
+    record_cache_hit("snapshots", filas=table.num_rows, nbytes=table.nbytes)
+    return table
+
+
+def forget_covered_ranges() -> None:
+    """Olvida los rangos verificados y el estado memorizado (p.ej. tras cerrar o reabrir una operativa)."""
+
+    _COVERED_RANGES.clear()
+    _RANGE_STATES.clear()
+
+
+# --- Agregaciones (equivalentes a src/query_store.py) ---
+
+
+def _final_mask(table: pa.Table, tipo_salida: str, *, use_impresion_log: bool = False) -> pa.ChunkedArray:
+    """Misma regla que `_cond_venta_final` / `_cond_cortesia_final` (NULL => no cuenta)."""
+
+    tipo_ok = pc.equal(pc.utf8_upper(pc.coalesce(table["tipo_salida"], pa.scalar(""))), tipo_salida)
+    procesado = pc.equal(table["estado_comanda"], "PROCESADO")
+    impreso = pc.equal(table["estado_impresion"], "IMPRESO")
+    if use_impresion_log:
+        impreso = pc.or_kleene(impreso, pc.equal(table["estado_impresion_log"], "IMPRESO"))
+    return pc.fill_null(pc.and_kleene(pc.and_kleene(tipo_ok, procesado), impreso), False)
+
+
+def _sum(values: Any) -> float:
+    result = pc.sum(values).as_py()
+    return float(result) if result is not None else 0.0
+
+
+def _count_distinct(values: Any) -> int:
+    return int(pc.count_distinct(values).as_py() or 0)
+
+
+def _ticket(total: float, comandas: int) -> float:
+    return round(total / comandas, 2) if comandas else 0.0
+
+
+def snapshot_kpis(table: pa.Table) -> dict[str, Any]:
+    """Misma salida que `q_kpis` (una fila)."""
+
+    venta = _final_mask(table, "VENTA")
+    venta_log = _final_mask(table, "VENTA", use_impresion_log=True)
+    cortesia = _final_mask(table, "CORTESIA")
+
+    v = table.filter(venta)
+    vl = table.filter(venta_log)
+    c = table.filter(cortesia)
+
+    total_vendido = _sum(v["sub_total"])
+    total_comandas = _count_distinct(v["id_comanda"])
+    total_log = _sum(vl["sub_total"])
+    comandas_log = _count_distinct(vl["id_comanda"])
+    cortesia_monto = pc.coalesce(c["cor_subtotal_anterior"], c["sub_total"], pa.scalar(0.0))
+
+    return {
+        "total_vendido": total_vendido,
+        "total_comandas": total_comandas,
+        "items_vendidos": _sum(v["cantidad"]),
+        "ticket_promedio": _ticket(total_vendido, total_comandas),
+        "total_vendido_impreso_log": total_log,
+        "total_comandas_impreso_log": comandas_log,
+        "items_vendidos_impreso_log": _sum(vl["cantidad"]),
+        "ticket_promedio_impreso_log": _ticket(total_log, comandas_log),
+        "total_cortesia": _sum(cortesia_monto),
+        "comandas_cortesia": _count_distinct(c["id_comanda"]),
+        "items_cortesia": _sum(c["cantidad"]),
+    }
+
+
+def snapshot_estado_operativo(table: pa.Table) -> dict[str, Any]:
+    """Misma salida que `q_estado_operativo`."""
+
+    def _distinct(mask: Any) -> int:
+        return _count_distinct(table.filter(pc.fill_null(mask, False))["id_comanda"])
+
+    no_anulada = pc.not_equal(table["estado_comanda"], "ANULADO")
+    return {
+        "comandas_pendientes": _distinct(pc.equal(table["estado_comanda"], "PENDIENTE")),
+        "comandas_anuladas": _distinct(pc.equal(table["estado_comanda"], "ANULADO")),
+        "comandas_impresion_pendiente": _distinct(
+            pc.and_kleene(no_anulada, pc.equal(table["estado_impresion"], "PENDIENTE"))
+        ),
+        "comandas_sin_estado_impresion": _distinct(
+            pc.and_kleene(no_anulada, pc.is_null(table["estado_impresion"]))
+        ),
+    }
+
+
+def _ventas(table: pa.Table, use_impresion_log: bool) -> pa.Table:
+    return table.filter(_final_mask(table, "VENTA", use_impresion_log=use_impresion_log))
+
+
+def _group_ventas(table: pa.Table, key: str | list[str]) -> pd.DataFrame:
+    grouped = table.group_by(key).aggregate(
+        [("sub_total", "sum"), ("cantidad", "sum"), ("id_comanda", "count_distinct")]
+    )
+    df = grouped.to_pandas()
+    return df.rename(
+        columns={
+            "sub_total_sum": "total_vendido",
+            "cantidad_sum": "items",
+            "id_comanda_count_distinct": "comandas",
+        }
+    )
+
+
+def snapshot_ventas_por_hora(table: pa.Table, *, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Misma salida que `q_ventas_por_hora` (hora, total_vendido, comandas, items)."""
+
+    v = _ventas(table, use_impresion_log)
+    v = v.append_column("hora", pc.hour(v["fecha_emision"]))
+    df = _group_ventas(v, "hora")
+    df[["total_vendido", "items"]] = df[["total_vendido", "items"]].fillna(0.0)
+    return df[["hora", "total_vendido", "comandas", "items"]].sort_values("hora").reset_index(drop=True)
+
+
+def snapshot_ventas_timeline(
+    table: pa.Table,
+    *,
+    bucket_minutes: int = 5,
+    use_impresion_log: bool = False,
+) -> pd.DataFrame:
+    """Misma salida que `q_ventas_timeline` (dia, hora, minuto, total_vendido, comandas, items)."""
+
+    bucket = int(bucket_minutes)
+    v = _ventas(table, use_impresion_log)
+    fecha = v["fecha_emision"]
+    minuto = pc.multiply(pc.divide(pc.minute(fecha), bucket), bucket)  # división entera
+    v = v.append_column("dia", pc.cast(fecha, pa.date32()))
+    v = v.append_column("hora", pc.hour(fecha)).append_column("minuto", minuto)
+    df = _group_ventas(v, ["dia", "hora", "minuto"])
+    df[["total_vendido", "items"]] = df[["total_vendido", "items"]].fillna(0.0)
+    cols = ["dia", "hora", "minuto", "total_vendido", "comandas", "items"]
+    return df[cols].sort_values(["dia", "hora", "minuto"]).reset_index(drop=True)
+
+
+def snapshot_por_categoria(table: pa.Table, *, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Misma salida que `q_por_categoria` (categoria, total_vendido, unidades, comandas)."""
+
+    v = _ventas(table, use_impresion_log)
+    v = v.set_column(
+        v.schema.get_field_index("categoria"),
+        "categoria",
+        pc.coalesce(v["categoria"], pa.scalar("SIN CATEGORIA")),
+    )
+    df = _group_ventas(v, "categoria").rename(columns={"items": "unidades"})
+    df[["total_vendido", "unidades"]] = df[["total_vendido", "unidades"]].fillna(0.0)
+    df = df.sort_values("total_vendido", ascending=False, kind="stable").reset_index(drop=True)
+    return df[["categoria", "total_vendido", "unidades", "comandas"]]
+
+
+def snapshot_top_productos(table: pa.Table, *, limit: int = 20, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Misma salida que `q_top_productos` (nombre, categoria, unidades, total_vendido)."""
+
+    v = _ventas(table, use_impresion_log)
+    v = v.set_column(
+        v.schema.get_field_index("categoria"),
+        "categoria",
+        pc.coalesce(v["categoria"], pa.scalar("SIN CATEGORIA")),
+    )
+    grouped = v.group_by(["nombre", "categoria"]).aggregate([("cantidad", "sum"), ("sub_total", "sum")])
+    df = grouped.to_pandas().rename(columns={"cantidad_sum": "unidades", "sub_total_sum": "total_vendido"})
+    df[["unidades", "total_vendido"]] = df[["unidades", "total_vendido"]].fillna(0.0)
+    df = df.sort_values("total_vendido", ascending=False, kind="stable").head(int(limit)).reset_index(drop=True)
+    return df[["nombre", "categoria", "unidades", "total_vendido"]]
+
+
+def snapshot_comanda_productos(table: pa.Table, *, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Misma salida que `q_comanda_productos` (id_operacion, id_comanda, nombre distintos)."""
+
+    v = _ventas(table, use_impresion_log)
+    v = v.filter(pc.is_valid(v["nombre"]))
+    df = v.group_by(["id_operacion", "id_comanda", "nombre"]).aggregate([]).to_pandas()
+    return df[["id_operacion", "id_comanda", "nombre"]]
+
+
+def snapshot_por_usuario(table: pa.Table, *, limit: int = 20, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Misma salida que `q_por_usuario` (usuario_reg, total_vendido, comandas, items, ticket_promedio)."""
+
+    v = _ventas(table, use_impresion_log)
+    v = v.set_column(
+        v.schema.get_field_index("usuario_reg"),
+        "usuario_reg",
+        pc.coalesce(v["usuario_reg"], pa.scalar("SIN USUARIO")),
+    )
+    df = _group_ventas(v, "usuario_reg")
+    df[["total_vendido", "items"]] = df[["total_vendido", "items"]].fillna(0.0)
+    df["ticket_promedio"] = (df["total_vendido"] / df["comandas"].where(df["comandas"] > 0)).round(2).fillna(0.0)
+    df = df.sort_values("total_vendido", ascending=False, kind="stable").head(int(limit)).reset_index(drop=True)
+    return df[["usuario_reg", "total_vendido", "comandas", "items", "ticket_promedio"]]
+
+
+def snapshot_emision_times(
+    table: pa.Table,
+    *,
+    limit: int | None = None,
+    with_operation: bool = False,
+) -> pd.DataFrame:
+    """Misma salida que `q_comandas_emision_times` (id_comanda, MIN(fecha_emision) asc).
+
+    Con `with_operation=True` agrega `id_operacion` (como `q_comandas_emision_delta`).
+    """
+
+    keys = ["id_operacion", "id_comanda"] if with_operation else ["id_comanda"]
+    grouped = table.group_by(keys).aggregate([("fecha_emision", "min")])
+    df = grouped.to_pandas().rename(columns={"fecha_emision_min": "fecha_emision"})
+    df = df.sort_values("fecha_emision", kind="stable")
+    if limit is not None:
+        df = df.tail(int(limit))
+    return df[keys + ["fecha_emision"]].reset_index(drop=True)
@@ -1,22 +1,29 @@
 from __future__ import annotations
 
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any, Literal
+from typing import Any, Callable, Literal
 
 import pandas as pd
 
 from src.db import get_connection
-from src.query_store import (
-    Q_STARTUP_ACTIVE_OPERATION,
-    Q_STARTUP_HAS_REALTIME_ROWS,
-    Q_STARTUP_LAST_CLOSED_OPERATION,
-    fetch_dataframe,
-)
+from src.local_store import connection_key
+from src.op_index import forget_operation_index
+from src.query_store import Q_STARTUP_COMBINED, fetch_dataframe
 
 
 VIEW_REALTIME = "comandas_v6"
 VIEW_HISTORICAL = "comandas_v6_todas"
 
+# Reruns dentro de esta ventana reutilizan el contexto sin consultar la base.
+STARTUP_CACHE_TTL_SECONDS = 5.0
+
+# Firma del estado operativo: (id activa, estado activa, id última cerrada).
+# Cambia exactamente en las transiciones 22→24→23 y al abrir una operativa nueva.
+StateSignature = tuple[int | None, int | None, int | None]
+TransitionListener = Callable[[Any, StateSignature, StateSignature], None]
+
 
 @dataclass(frozen=True)
 class StartupContext:
@@ -33,28 +40,153 @@ class StartupContext:
     estado_operacion: str | None
     has_rows: bool
     message: str
+    # Listado del selector histórico (mismas columnas que `Q_LIST_OPERATIONS`).
+    operations: tuple[dict[str, Any], ...] = ()
+    # Se incrementa en cada transición de estado detectada para la conexión.
+    generation: int = 0
 
 
-def _first_row(df: pd.DataFrame) -> dict[str, Any] | None:
-    if df is None or df.empty:
+# conexión -> (monotonic de la consulta, contexto)
+_STARTUP_CACHE: dict[str, tuple[float, StartupContext]] = {}
+_STATE_SIGNATURES: dict[str, StateSignature] = {}
+_GENERATIONS: dict[str, int] = {}
+_TRANSITION_LISTENERS: list[TransitionListener] = []
+_LOCK = threading.Lock()
+
+
+def add_transition_listener(listener: TransitionListener) -> None:
+    """Registra una función `(conn, anterior, actual)` a llamar en cada transición de estado."""
+
+    with _LOCK:
+        if listener not in _TRANSITION_LISTENERS:
+            _TRANSITION_LISTENERS.append(listener)
+
+
+def get_startup_generation(conn: Any) -> int:
+    """Generación actual del estado operativo de la conexión (0 si aún no se consultó)."""
+
+    return _GENERATIONS.get(connection_key(conn), 0)
+
+
+def invalidate_startup_cache(conn: Any | None = None) -> None:
+    """Descarta el contexto cacheado (de una conexión o de todas)."""
+
+    with _LOCK:
+        if conn is None:
+            _STARTUP_CACHE.clear()
+        else:
+            _STARTUP_CACHE.pop(connection_key(conn), None)
+
+
+def _int_or_none(value: Any) -> int | None:
+    if value is None or pd.isna(value):
         return None
-    return df.iloc[0].to_dict()
+    return int(value)
+
 
+def _split_combined(df: pd.DataFrame) -> tuple[dict | None, dict | None, bool, tuple[dict[str, Any], ...]]:
+    """Separa las filas de `Q_STARTUP_COMBINED` por `kind`."""
 
-def determine_startup_context(conn: Any | None = None) -> StartupContext:
+    active: dict[str, Any] | None = None
+    closed: dict[str, Any] | None = None
+    has_rows = False
+    operations: list[dict[str, Any]] = []
+    if df is None or df.empty:
+        return active, closed, has_rows, ()
+
+    for row in df.to_dict(orient="records"):
+        kind = row.get("kind")
+        if kind == "active":
+            active = row
+        elif kind == "closed":
+            closed = row
+        elif kind == "has_rows":
+            has_rows = True
+        elif kind == "operation":
+            operations.append(
+                {
+                    "id": _int_or_none(row.get("id_operacion")),
+                    "fecha": row.get("fecha"),
+                    "nombre_operacion": row.get("nombre_operacion"),
+                    "estado_operacion": _int_or_none(row.get("estado_operacion_id")),
+                    "estado_operacion_nombre": row.get("estado_operacion"),
+                }
+            )
+
+    # UNION ALL no garantiza orden: el selector espera id DESC.
+    operations.sort(key=lambda o: o["id"] or 0, reverse=True)
+    return active, closed, has_rows, tuple(operations)
+
+
+def _track_transition(conn: Any, signature: StateSignature) -> int:
+    """Actualiza la firma/generación y notifica a los listeners si hubo transición."""
+
+    key = connection_key(conn)
+    with _LOCK:
+        previous = _STATE_SIGNATURES.get(key)
+        _STATE_SIGNATURES[key] = signature
+        changed = previous is not None and previous != signature
+        if changed:
+            _GENERATIONS[key] = _GENERATIONS.get(key, 0) + 1
+        generation = _GENERATIONS.setdefault(key, 0)
+        listeners = list(_TRANSITION_LISTENERS) if changed else []
+
+    for listener in listeners:
+        # Los listeners son efectos secundarios (limpiar caches, precalcular): nunca
+        # deben impedir que el dashboard arranque.
+        try:
+            listener(conn, previous, signature)
+        except Exception:
+            pass
+    return generation
+
+
+def determine_startup_context(
+    conn: Any | None = None,
+    *,
+    max_age_seconds: float = STARTUP_CACHE_TTL_SECONDS,
+) -> StartupContext:
     """Determina el contexto operativo inicial (tiempo real vs histórico).
 
     Reglas (docs/01-flujo_inicio_dashboard.md):
     - Tiempo real: existe `ope_operacion` HAB con `estado_operacion IN (22,24)` (usar `comandas_v6`).
     - Histórico: no existe activa; por defecto usar la última cerrada (23) y la vista `comandas_v6_todas`.
+
+    Todo se resuelve con una sola consulta (`Q_STARTUP_COMBINED`) y el resultado se
+    reutiliza por conexión durante `max_age_seconds`.
     """
 
     if conn is None:
         conn = get_connection()
 
-    active = _first_row(fetch_dataframe(conn, Q_STARTUP_ACTIVE_OPERATION))
+    key = connection_key(conn)
+    cached = _STARTUP_CACHE.get(key)
+    if cached is not None and time.monotonic() - cached[0] < max_age_seconds:
+        return cached[1]
+
+    fetched_at = time.monotonic()
+    active, closed, has_rows, operations = _split_combined(fetch_dataframe(conn, Q_STARTUP_COMBINED))
+    signature: StateSignature = (
+        _int_or_none(active.get("id_operacion")) if active else None,
+        _int_or_none(active.get("estado_operacion_id")) if active else None,
+        _int_or_none(closed.get("id_operacion")) if closed else None,
+    )
+    generation = _track_transition(conn, signature)
+
+    context = _build_context(active, closed, has_rows, operations, generation)
+    with _LOCK:
+        _STARTUP_CACHE[key] = (fetched_at, context)
+    return context
+
+
+def _build_context(
+    active: dict[str, Any] | None,
+    closed: dict[str, Any] | None,
+    has_rows: bool,
+    operations: tuple[dict[str, Any], ...],
+    generation: int,
+) -> StartupContext:
     if active is not None:
-        has_rows = not fetch_dataframe(conn, Q_STARTUP_HAS_REALTIME_ROWS).empty
 
         estado_operacion = active.get("estado_operacion")
         estado_operacion_id = active.get("estado_operacion_id")
@@ -76,9 +208,10 @@ def determine_startup_context(conn: Any | None = None) -> StartupContext:
             estado_operacion=str(estado_operacion) if estado_operacion is not None else None,
             has_rows=has_rows,
             message=message,
+            operations=operations,
+            generation=generation,
         )
 
-    closed = _first_row(fetch_dataframe(conn, Q_STARTUP_LAST_CLOSED_OPERATION))
     operacion_id = closed.get("id_operacion") if closed else None
     estado_operacion_id = closed.get("estado_operacion_id") if closed else None
     estado_operacion = closed.get("estado_operacion") if closed else None
@@ -97,4 +230,10 @@ def determine_startup_context(conn: Any | None = None) -> StartupContext:
         estado_operacion=str(estado_operacion) if estado_operacion is not None else None,
         has_rows=False,
         message=message,
+        operations=operations,
+        generation=generation,
     )
+
+
+# Una operativa que cambia de estado (p.ej. se cierra) invalida el índice operativa → fechas.
+add_transition_listener(lambda conn, previous, current: forget_operation_index(conn))
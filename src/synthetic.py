@@ -0,0 +1,521 @@
+from __future__ import annotations
+
+"""Base local sintética (SQLite) con el esquema que lee el dashboard.
+
+Reemplaza a MySQL para benchmarks y pruebas sin la base del POS:
+
+- Tablas: `ope_operacion`, `parameter_table`, `alm_categoria`, `alm_producto`,
+  `bar_combo_coctel`, `bar_comanda`, `bar_detalle_comanda_salida` y el log de impresión
+  `bar_comanda_impresion`, con los índices que se esperan en producción.
+- Vistas: `comandas_v6_base` / `comandas_v6_todas` / `comandas_v6` (misma definición que
+  docs/02), `vw_comanda_ultima_impresion` y versiones simplificadas de las vistas de
+  P&L / COGS (`vw_margen_comanda`, `vw_cogs_comanda`, `vw_consumo_*_operativa`).
+- Escala configurable (`SyntheticScale`: operativas × comandas × ítems). Los datos son
+  deterministas para una misma semilla: noches de 20:00 a 04:00 con pico a medianoche,
+  productos con popularidad Zipf, cortesías, anuladas, pendientes de impresión y la
+  última operativa abierta (EN PROCESO, a medio cargar).
+
+`SQLiteConnection` expone `.query(sql, params=..., ttl=...)` como `SQLConnection` y
+registra las funciones MySQL que usan los builders (`HOUR`, `MINUTE`, `FLOOR`,
+`DATABASE`). `get_connection` la usa con `DASHBACK_SYNTHETIC_DB=<archivo.sqlite>`.
+"""
+
+import math
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+SYNTHETIC_DB_ENV = "DASHBACK_SYNTHETIC_DB"
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATETIME_COLUMNS = ("fecha", "fecha_emision", "fecha_min", "fecha_max", "fecha_mod")
+DATE_COLUMNS = ("dia",)  # DATE(...) llega como texto en SQLite; MySQL devuelve `date`
+
+# parameter_table (ver docs/02: id_master 6/7/10/15)
+ESTADO_EN_PROCESO, ESTADO_CERRADO = 22, 23
+COMANDA_PENDIENTE, COMANDA_PROCESADO, COMANDA_ANULADO = 25, 26, 27
+IMPRESO, IMPRESION_PENDIENTE = 31, 32
+SALIDA_VENTA, SALIDA_CORTESIA = 50, 51
+
+PARAMETERS = [
+    (22, 6, "EN PROCESO"),
+    (23, 6, "CERRADO"),
+    (24, 6, "INICIO CIERRE"),
+    (25, 7, "PENDIENTE"),
+    (26, 7, "PROCESADO"),
+    (27, 7, "ANULADO"),
+    (31, 10, "IMPRESO"),
+    (32, 10, "PENDIENTE"),
+    (50, 15, "VENTA"),
+    (51, 15, "CORTESIA"),
+]
+
+CATEGORIES = ["CERVEZAS", "COCTELES", "DESTILADOS", "VINOS", "SIN ALCOHOL", "COMIDA", "PROMOCIONES"]
+USERS = ["barra1", "barra2", "barra3", "caja1", "caja2", "mesero1", "mesero2", "mesero3"]
+
+
+@dataclass(frozen=True)
+class SyntheticScale:
+    """Tamaño de la base: operativas × comandas por operativa × ítems por comanda (promedio)."""
+
+    operaciones: int = 30
+    comandas: int = 400
+    items: float = 3.0
+    productos: int = 180
+    combos: int = 20
+
+    @property
+    def label(self) -> str:
+        return f"{self.operaciones}x{self.comandas}x{self.items:g}"
+
+
+SCALES: dict[str, SyntheticScale] = {
+    "s": SyntheticScale(operaciones=10, comandas=200, items=3.0),
+    "m": SyntheticScale(operaciones=60, comandas=600, items=3.0),
+    "l": SyntheticScale(operaciones=365, comandas=1200, items=3.0),
+}
+
+
+_SCHEMA = """
+CREATE TABLE ope_operacion (
+    id INTEGER PRIMARY KEY,
+    fecha TEXT,
+    nombre_operacion TEXT,
+    estado TEXT,
+    estado_operacion INTEGER
+);
+CREATE TABLE parameter_table (
+    id INTEGER PRIMARY KEY,
+    id_master INTEGER,
+    nombre TEXT,
+    estado TEXT
+);
+CREATE TABLE alm_categoria (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT,
+    estado TEXT
+);
+CREATE TABLE alm_producto (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT,
+    nombre TEXT,
+    descripcion TEXT,
+    id_categoria INTEGER,
+    precio REAL,
+    costo REAL,
+    estado TEXT
+);
+CREATE TABLE bar_combo_coctel (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT,
+    nombre TEXT,
+    descripcion TEXT,
+    id_categoria INTEGER,
+    precio REAL,
+    costo REAL
+);
+CREATE TABLE bar_comanda (
+    id INTEGER PRIMARY KEY,
+    id_operacion INTEGER,
+    id_barra INTEGER,
+    usuario_reg TEXT,
+    fecha TEXT,
+    estado TEXT,
+    id_mesa INTEGER,
+    razon_social TEXT,
+    nit TEXT,
+    id_factura INTEGER,
+    nro_factura INTEGER,
+    tipo_salida INTEGER,
+    estado_comanda INTEGER,
+    estado_impresion INTEGER
+);
+CREATE TABLE bar_detalle_comanda_salida (
+    id INTEGER PRIMARY KEY,
+    id_comanda INTEGER,
+    id_producto INTEGER,
+    id_bar_combo_coctel INTEGER,
+    id_salida_combo_coctel INTEGER,
+    cantidad REAL,
+    precio_venta REAL,
+    sub_total REAL,
+    producto_coctel TEXT,
+    cor_subtotal_anterior REAL,
+    fecha_mod TEXT
+);
+CREATE TABLE bar_comanda_impresion (
+    id INTEGER PRIMARY KEY,
+    id_comanda INTEGER,
+    ind_estado_impresion INTEGER,
+    fecha TEXT
+);
+
+CREATE INDEX idx_bar_comanda_id_operacion_fecha ON bar_comanda (id_operacion, fecha);
+CREATE INDEX idx_bar_detalle_comanda_salida_id_comanda ON bar_detalle_comanda_salida (id_comanda);
+CREATE INDEX idx_bar_comanda_impresion_id_comanda ON bar_comanda_impresion (id_comanda);
+CREATE INDEX idx_ope_operacion_estado ON ope_operacion (estado, estado_operacion);
+
+CREATE VIEW comandas_v6_base AS
+SELECT
+    dcs.id AS id,
+    dcs.cantidad AS cantidad,
+    dcs.id_comanda AS id_comanda,
+    p.codigo AS id_producto,
+    dcs.id_salida_combo_coctel AS id_salida_combo_coctel,
+    cc.codigo AS id_bar_combo_coctel,
+    dcs.precio_venta AS precio_venta,
+    dcs.sub_total AS sub_total,
+    dcs.producto_coctel AS producto_coctel,
+    dcs.cor_subtotal_anterior AS cor_subtotal_anterior,
+    c.id_barra AS id_barra,
+    c.usuario_reg AS usuario_reg,
+    c.fecha AS fecha_emision,
+    dcs.fecha_mod AS fecha_mod,
+    c.estado AS estado,
+    c.id_operacion AS id_operacion,
+    c.id_mesa AS id_mesa,
+    c.razon_social AS razon_social,
+    c.nit AS nit,
+    c.id_factura AS id_factura,
+    c.nro_factura AS nro_factura,
+    COALESCE(p.nombre, cc.nombre) AS nombre,
+    COALESCE(p.descripcion, cc.descripcion) AS descripcion,
+    COALESCE(p.codigo, cc.codigo) AS id_producto_combo,
+    ts.nombre AS tipo_salida,
+    ec.nombre AS estado_comanda,
+    ei.nombre AS estado_impresion,
+    COALESCE(catp.nombre, catc.nombre) AS categoria,
+    op.estado_operacion AS estado_operacion_id,
+    eop.nombre AS estado_operacion
+FROM bar_detalle_comanda_salida dcs
+JOIN bar_comanda c ON dcs.id_comanda = c.id
+JOIN ope_operacion op ON op.id = c.id_operacion
+LEFT JOIN alm_producto p ON dcs.id_producto = p.id
+LEFT JOIN bar_combo_coctel cc ON dcs.id_bar_combo_coctel = cc.id
+LEFT JOIN alm_categoria catp ON p.id_categoria = catp.id
+LEFT JOIN alm_categoria catc ON cc.id_categoria = catc.id
+LEFT JOIN parameter_table ts ON c.tipo_salida = ts.id AND ts.id_master = 15 AND ts.estado = 'HAB'
+LEFT JOIN parameter_table ec ON c.estado_comanda = ec.id AND ec.id_master = 7 AND ec.estado = 'HAB'
+LEFT JOIN parameter_table ei ON c.estado_impresion = ei.id AND ei.id_master = 10 AND ei.estado = 'HAB'
+LEFT JOIN parameter_table eop ON op.estado_operacion = eop.id AND eop.id_master = 6 AND eop.estado = 'HAB'
+WHERE c.estado = 'HAB'
+  AND op.estado = 'HAB';
+
+CREATE VIEW comandas_v6_todas AS
+SELECT * FROM comandas_v6_base;
+
+CREATE VIEW comandas_v6 AS
+SELECT *
+FROM comandas_v6_base
+WHERE id_operacion = (
+    SELECT op2.id
+    FROM ope_operacion op2
+    WHERE op2.estado = 'HAB'
+      AND op2.estado_operacion IN (22, 24)
+    ORDER BY op2.id DESC
+    LIMIT 1
+);
+
+CREATE VIEW vw_comanda_ultima_impresion AS
+SELECT i.id_comanda, i.ind_estado_impresion, i.fecha
+FROM bar_comanda_impresion i
+JOIN (
+    SELECT id_comanda, MAX(id) AS id_ultimo
+    FROM bar_comanda_impresion
+    GROUP BY id_comanda
+) u ON u.id_ultimo = i.id;
+
+-- P&L / COGS simplificados: costo = cantidad × costo unitario del producto/combo.
+CREATE VIEW vw_consumo_comanda AS
+SELECT
+    c.id_operacion,
+    c.id AS id_comanda,
+    c.id_barra,
+    c.fecha AS fecha_emision,
+    c.tipo_salida,
+    c.estado_comanda,
+    COALESCE(dcs.id_producto, dcs.id_bar_combo_coctel + 100000) AS id_producto,
+    dcs.cantidad,
+    dcs.sub_total,
+    dcs.cantidad * COALESCE(p.costo, cc.costo, 0) AS costo
+FROM bar_detalle_comanda_salida dcs
+JOIN bar_comanda c ON c.id = dcs.id_comanda
+LEFT JOIN alm_producto p ON p.id = dcs.id_producto
+LEFT JOIN bar_combo_coctel cc ON cc.id = dcs.id_bar_combo_coctel
+WHERE c.estado = 'HAB'
+  AND c.estado_comanda = 26;
+
+CREATE VIEW vw_margen_comanda AS
+SELECT
+    id_operacion,
+    id_comanda,
+    id_barra,
+    MIN(fecha_emision) AS fecha_emision,
+    SUM(sub_total) AS total_venta,
+    SUM(costo) AS cogs_comanda,
+    SUM(sub_total) - SUM(costo) AS margen_comanda
+FROM vw_consumo_comanda
+WHERE tipo_salida = 50
+GROUP BY id_operacion, id_comanda, id_barra;
+
+CREATE VIEW vw_cogs_comanda AS
+SELECT
+    id_operacion,
+    id_comanda,
+    id_barra,
+    MIN(fecha_emision) AS fecha_emision,
+    SUM(costo) AS cogs_comanda
+FROM vw_consumo_comanda
+GROUP BY id_operacion, id_comanda, id_barra;
+
+CREATE VIEW vw_consumo_insumos_operativa AS
+SELECT
+    id_operacion,
+    id_producto,
+    SUM(cantidad) AS cantidad_consumida_base
+FROM vw_consumo_comanda
+GROUP BY id_operacion, id_producto;
+
+CREATE VIEW vw_consumo_valorizado_operativa AS
+SELECT
+    id_operacion,
+    id_producto,
+    SUM(cantidad) AS cantidad_consumida_base,
+    ROUND(SUM(costo) / NULLIF(SUM(cantidad), 0), 4) AS wac_operativa,
+    SUM(costo) AS costo_consumo
+FROM vw_consumo_comanda
+GROUP BY id_operacion, id_producto;
+"""
+
+
+def _mysql_functions(db: sqlite3.Connection) -> None:
+    """Funciones MySQL que usan los builders, sobre fechas 'YYYY-MM-DD HH:MM:SS'."""
+
+    db.create_function("HOUR", 1, lambda s: None if s is None else int(str(s)[11:13]), deterministic=True)
+    db.create_function("MINUTE", 1, lambda s: None if s is None else int(str(s)[14:16]), deterministic=True)
+    db.create_function("FLOOR", 1, lambda v: None if v is None else math.floor(v), deterministic=True)
+    db.create_function("DATABASE", 0, lambda: "synthetic")
+
+
+def _night_offsets(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Segundos desde las 20:00: pico a medianoche, cola hasta las 04:00."""
+
+    hours = np.clip(rng.normal(loc=4.0, scale=1.8, size=n), 0.0, 7.99)
+    return np.sort((hours * 3600).astype(np.int64))
+
+
+def build_database(
+    path: str | Path,
+    scale: SyntheticScale,
+    *,
+    seed: int = 42,
+    last_day: date | None = None,
+    open_last: bool = True,
+) -> Path:
+    """Crea (o reemplaza) la base sintética en `path` y devuelve la ruta.
+
+    Con `open_last=False` todas las operativas quedan cerradas (el dashboard arranca en histórico).
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.unlink(missing_ok=True)
+
+    rng = np.random.default_rng(seed)
+    last_day = last_day or date.today()
+    db = sqlite3.connect(str(tmp))
+    try:
+        db.executescript(_SCHEMA)
+        db.executemany(
+            "INSERT INTO parameter_table VALUES (?, ?, ?, 'HAB')",
+            PARAMETERS,
+        )
+        db.executemany(
+            "INSERT INTO alm_categoria VALUES (?, ?, 'HAB')",
+            [(i + 1, name) for i, name in enumerate(CATEGORIES)],
+        )
+
+        n_products = int(scale.productos)
+        prices = np.round(rng.choice([12, 15, 18, 20, 25, 30, 35, 45, 60, 80], size=n_products) * 1.0, 2)
+        costs = np.round(prices * rng.uniform(0.25, 0.45, size=n_products), 4)
+        db.executemany(
+            "INSERT INTO alm_producto VALUES (?, ?, ?, ?, ?, ?, ?, 'HAB')",
+            [
+                (i + 1, f"P{i + 1:05d}", f"PRODUCTO {i + 1:03d}", f"Descripción {i + 1}", int(cat), float(pr), float(co))
+                for i, (cat, pr, co) in enumerate(
+                    zip(rng.integers(1, len(CATEGORIES), size=n_products), prices.tolist(), costs.tolist())
+                )
+            ],
+        )
+        n_combos = int(scale.combos)
+        combo_prices = np.round(rng.choice([80, 120, 150, 200, 250], size=n_combos) * 1.0, 2)
+        db.executemany(
+            "INSERT INTO bar_combo_coctel VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (i + 1, f"C{i + 1:04d}", f"COMBO {i + 1:02d}", f"Combo {i + 1}", len(CATEGORIES), float(pr), round(pr * 0.35, 4))
+                for i, pr in enumerate(combo_prices.tolist())
+            ],
+        )
+
+        n_ops = int(scale.operaciones)
+        first_day = last_day - timedelta(days=n_ops - 1)
+        op_days = [first_day + timedelta(days=i) for i in range(n_ops)]
+        db.executemany(
+            "INSERT INTO ope_operacion VALUES (?, ?, ?, 'HAB', ?)",
+            [
+                (i + 1, f"{d:%Y-%m-%d} 19:00:00", f"OPERATIVA {d:%d/%m/%Y}", ESTADO_EN_PROCESO if open_last and i == n_ops - 1 else ESTADO_CERRADO)
+                for i, d in enumerate(op_days)
+            ],
+        )
+
+        # Popularidad Zipf de productos (los combos se piden como un 5% de los ítems).
+        weights = 1.0 / np.arange(1, n_products + 1) ** 1.1
+        weights /= weights.sum()
+
+        comanda_id = 0
+        item_id = 0
+        print_id = 0
+        for op_index, op_day in enumerate(op_days):
+            op_id = op_index + 1
+            is_open = open_last and op_index == n_ops - 1
+            # La operativa abierta va a medio cargar (como a la medianoche de hoy).
+            n_comandas = int(rng.poisson(scale.comandas * (0.5 if is_open else 1.0)))
+            if n_comandas == 0:
+                continue
+            base = datetime.combine(op_day, datetime.min.time()) + timedelta(hours=20)
+            offsets = _night_offsets(rng, n_comandas)
+            if is_open:
+                offsets = np.sort(offsets % (4 * 3600))
+            ids = np.arange(comanda_id + 1, comanda_id + n_comandas + 1)
+            comanda_id += n_comandas
+
+            tipo = np.where(rng.random(n_comandas) < 0.08, SALIDA_CORTESIA, SALIDA_VENTA)
+            estado_r = rng.random(n_comandas)
+            pending_share = 0.06 if is_open else 0.0
+            estado = np.where(
+                estado_r < 0.04, COMANDA_ANULADO, np.where(estado_r < 0.04 + pending_share, COMANDA_PENDIENTE, COMANDA_PROCESADO)
+            )
+            impresion_r = rng.random(n_comandas)
+            impresion = np.where(impresion_r < 0.04, IMPRESION_PENDIENTE, IMPRESO).astype(object)
+            impresion[(impresion_r > 0.96) | (estado == COMANDA_ANULADO)] = None
+            fechas = [(base + timedelta(seconds=int(s))).strftime(DATETIME_FORMAT) for s in offsets.tolist()]
+            users = rng.choice(USERS, size=n_comandas)
+            barras = rng.integers(1, 4, size=n_comandas)
+            mesas = rng.integers(1, 40, size=n_comandas)
+            db.executemany(
+                "INSERT INTO bar_comanda VALUES (?, ?, ?, ?, ?, 'HAB', ?, NULL, NULL, NULL, NULL, ?, ?, ?)",
+                list(
+                    zip(
+                        ids.tolist(),
+                        [op_id] * n_comandas,
+                        barras.tolist(),
+                        users.tolist(),
+                        fechas,
+                        mesas.tolist(),
+                        tipo.tolist(),
+                        estado.tolist(),
+                        impresion.tolist(),
+                    )
+                ),
+            )
+
+            # Ítems: 1 + Poisson(items - 1) por comanda.
+            per_comanda = 1 + rng.poisson(max(scale.items - 1.0, 0.0), size=n_comandas)
+            n_items = int(per_comanda.sum())
+            item_comanda = np.repeat(ids, per_comanda)
+            item_tipo = np.repeat(tipo, per_comanda)
+            item_fecha = np.repeat(np.asarray(fechas, dtype=object), per_comanda)
+            is_combo = rng.random(n_items) < 0.05
+            product = rng.choice(n_products, size=n_items, p=weights) + 1
+            combo = rng.integers(1, n_combos + 1, size=n_items)
+            cantidad = rng.choice([1, 1, 1, 1, 2, 2, 3, 4], size=n_items).astype(np.float64)
+            unit = np.where(is_combo, combo_prices[combo - 1], prices[product - 1])
+            importe = np.round(cantidad * unit, 2)
+            cortesia = item_tipo == SALIDA_CORTESIA
+            db.executemany(
+                "INSERT INTO bar_detalle_comanda_salida VALUES (?, ?, ?, ?, NULL, ?, ?, ?, NULL, ?, ?)",
+                list(
+                    zip(
+                        range(item_id + 1, item_id + n_items + 1),
+                        item_comanda.tolist(),
+                        np.where(is_combo, None, product).tolist(),
+                        np.where(is_combo, combo, None).tolist(),
+                        cantidad.tolist(),
+                        unit.tolist(),
+                        np.where(cortesia, 0.0, importe).tolist(),
+                        np.where(cortesia, importe, None).tolist(),
+                        item_fecha.tolist(),
+                    )
+                ),
+            )
+            item_id += n_items
+
+            # Log de impresión: un intento (a veces dos) por comanda no anulada.
+            logged = ids[estado != COMANDA_ANULADO]
+            logged_fechas = np.asarray(fechas, dtype=object)[estado != COMANDA_ANULADO]
+            attempts = 1 + (rng.random(len(logged)) < 0.1)
+            rows: list[tuple[Any, ...]] = []
+            last_state = np.where(rng.random(len(logged)) < 0.97, IMPRESO, IMPRESION_PENDIENTE)
+            for cid, fecha, n_attempts, final in zip(logged.tolist(), logged_fechas.tolist(), attempts.tolist(), last_state.tolist()):
+                for attempt in range(int(n_attempts)):
+                    print_id += 1
+                    state = final if attempt == n_attempts - 1 else IMPRESION_PENDIENTE
+                    rows.append((print_id, cid, int(state), fecha))
+            db.executemany("INSERT INTO bar_comanda_impresion VALUES (?, ?, ?, ?)", rows)
+
+        db.commit()
+        db.execute("ANALYZE")
+        db.commit()
+    finally:
+        db.close()
+    tmp.replace(path)
+    return path
+
+
+def database_stats(path: str | Path) -> dict[str, int]:
+    """Filas por tabla (para el reporte del benchmark)."""
+
+    db = sqlite3.connect(str(path))
+    try:
+        return {
+            table: int(db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+            for table in ("ope_operacion", "bar_comanda", "bar_detalle_comanda_salida", "bar_comanda_impresion")
+        }
+    finally:
+        db.close()
+
+
+class SQLiteConnection:
+    """Conexión de solo lectura a la base sintética, con la interfaz de `SQLConnection`."""
+
+    def __init__(self, path: str | Path, *, name: str | None = None):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"No existe la base sintética {self.path}")
+        self._connection_name = name or f"synthetic_{self.path.stem}"
+        self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        _mysql_functions(self._db)
+        # sqlite3 no admite uso concurrente de una misma conexión desde varios hilos.
+        self._lock = threading.Lock()
+
+    def query(self, sql: str, params: dict[str, Any] | None = None, ttl: Any = None, **kwargs: Any) -> pd.DataFrame:
+        with self._lock:
+            df = pd.read_sql_query(sql, self._db, params=params or {})
+        for col in DATETIME_COLUMNS:
+            if col in df.columns and df[col].dtype == object:
+                df[col] = pd.to_datetime(df[col], errors="coerce")
+        for col in DATE_COLUMNS:
+            if col in df.columns and df[col].dtype == object:
+                df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
+        return df
+
+    def close(self) -> None:
+        self._db.close()
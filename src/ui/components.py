@@ -7,7 +7,15 @@ Biblioteca de gráficos Plotly con formato Bolivia integrado:
 - line_chart(): Líneas con marcadores y línea de promedio opcional
 - pie_chart(): Gráfico de torta con porcentajes
 - area_chart(): Gráfico de área para distribuciones/acumulados
-- render_chart_section(): Helper unificado para renderizar gráficos con manejo de errores y exportación CSV
+- render_chart_section(): Helper unificado para renderizar gráficos con manejo de errores, plazo por sección y exportación CSV/Parquet diferida
+- load_section() / render_section_timeout(): plazo por sección para bloques que no son gráficos (KPIs, P&L, estado, detalle)
+- waterfall_chart(): cascada de tramos del perfil por rerun (sidebar)
+- trend_table() / render_trend_table(): Tabla de métricas por operativa con sparkline por fila
+- metric_trend(): sparkline + delta vs operativa anterior para `st.metric`
+
+Las figuras se memorizan por hash del DataFrame + parámetros del gráfico: si los datos
+no cambiaron entre reruns se reutiliza la figura ya construida (sin Plotly Express ni
+`apply_plotly_bs`).
 
 Todos los componentes soportan:
 - Formato Bolivia (Bs 1.100,33) vía parámetro `money=True`
@@ -15,15 +23,55 @@ Todos los componentes soportan:
 - Márgenes optimizados para dashboard
 """
 
+import threading
+from collections import OrderedDict
 from typing import Any, Callable
 
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from src.ui.formatting import apply_plotly_bs
+from src.deadlines import RETRY_FACTOR, SectionTimeout, call_key, run_with_deadline, section_deadline_ms
+from src.perf import current_section, enter_section, python_time, timed
+from src.ui.exports import frame_fingerprint, render_export_buttons
+from src.ui.formatting import apply_plotly_bs, format_bs, format_number
+
+
+FIGURE_CACHE_MAX_ENTRIES = 64
+
+# (tipo, hash del DataFrame, parámetros) -> figura Plotly; LRU compartido entre sesiones.
+_FIGURE_CACHE: OrderedDict[tuple[str, str, str], Any] = OrderedDict()
+_FIGURE_LOCK = threading.Lock()
+
+
+def _cached_figure(kind: str, df: pd.DataFrame, params: dict[str, Any], build: Callable[[], Any]):
+    """Devuelve la figura memorizada para (datos, parámetros) o la construye con `build`.
+
+    La figura se comparte entre reruns/sesiones: quien la use no debe modificarla.
+    """
 
+    key = (kind, frame_fingerprint(df), repr(sorted(params.items(), key=lambda item: item[0])))
+    with _FIGURE_LOCK:
+        fig = _FIGURE_CACHE.get(key)
+        if fig is not None:
+            _FIGURE_CACHE.move_to_end(key)
+            return fig
 
+    fig = build()
+    with _FIGURE_LOCK:
+        _FIGURE_CACHE[key] = fig
+        _FIGURE_CACHE.move_to_end(key)
+        while len(_FIGURE_CACHE) > FIGURE_CACHE_MAX_ENTRIES:
+            _FIGURE_CACHE.popitem(last=False)
+    return fig
+
+
+def clear_figure_cache() -> None:
+    with _FIGURE_LOCK:
+        _FIGURE_CACHE.clear()
+
+
+@timed("plotly")
 def bar_chart(
     df: pd.DataFrame,
     x: str,
@@ -48,17 +96,34 @@ def bar_chart(
         hover_data: Dict con columnas adicionales para tooltip.
                     Keys = nombre columna, Values = formato (True para incluir, False para ocultar, string para custom)
     """
-    fig = px.bar(df, x=x, y=y, title=title, orientation=orientation, hover_data=hover_data)
-    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    def build():
+        fig = px.bar(df, x=x, y=y, title=title, orientation=orientation, hover_data=hover_data)
+        fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
 
-    if money:
-        # En barras horizontales el eje de valores es X; en vertical es Y.
-        value_axis = "x" if (orientation or "").lower().startswith("h") else "y"
-        apply_plotly_bs(fig, axis=value_axis, decimals=int(money_decimals))
+        if money:
+            # En barras horizontales el eje de valores es X; en vertical es Y.
+            value_axis = "x" if (orientation or "").lower().startswith("h") else "y"
+            apply_plotly_bs(fig, axis=value_axis, decimals=int(money_decimals))
 
-    return fig
+        return fig
+
+    return _cached_figure(
+        "bar",
+        df,
+        dict(
+            x=x,
+            y=y,
+            title=title,
+            orientation=orientation,
+            money=money,
+            money_decimals=money_decimals,
+            hover_data=hover_data,
+        ),
+        build,
+    )
 
 
+@timed("plotly")
 def line_chart(
     df: pd.DataFrame,
     x: str,
@@ -84,26 +149,44 @@ def line_chart(
         markers: Si True, muestra marcadores en los puntos
         show_average: Si True, agrega línea horizontal con promedio
     """
-    fig = px.line(df, x=x, y=y, title=title, hover_data=hover_data, markers=markers)
-    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    def build():
+        fig = px.line(df, x=x, y=y, title=title, hover_data=hover_data, markers=markers)
+        fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
 
-    if money:
-        apply_plotly_bs(fig, axis="y", decimals=int(money_decimals))
+        if money:
+            apply_plotly_bs(fig, axis="y", decimals=int(money_decimals))
     
-    # Agregar línea de promedio si se solicita
-    if show_average and not df.empty:
-        avg_value = df[y].mean()
-        fig.add_hline(
-            y=avg_value,
-            line_dash="dash",
-            line_color="rgba(255, 0, 0, 0.5)",
-            annotation_text=f"Promedio: {avg_value:,.2f}",
-            annotation_position="right",
-        )
+        # Agregar línea de promedio si se solicita
+        if show_average and not df.empty:
+            avg_value = df[y].mean()
+            fig.add_hline(
+                y=avg_value,
+                line_dash="dash",
+                line_color="rgba(255, 0, 0, 0.5)",
+                annotation_text=f"Promedio: {avg_value:,.2f}",
+                annotation_position="right",
+            )
 
-    return fig
+        return fig
 
+    return _cached_figure(
+        "line",
+        df,
+        dict(
+            x=x,
+            y=y,
+            title=title,
+            money=money,
+            money_decimals=money_decimals,
+            hover_data=hover_data,
+            markers=markers,
+            show_average=show_average,
+        ),
+        build,
+    )
 
+
+@timed("plotly")
 def pie_chart(
     df: pd.DataFrame,
     names: str,
@@ -125,20 +208,36 @@ def pie_chart(
         money_decimals: Decimales para formato dinero
         hover_data: Lista de columnas adicionales para tooltip
     """
-    fig = px.pie(df, names=names, values=values, title=title, hover_data=hover_data)
-    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    def build():
+        fig = px.pie(df, names=names, values=values, title=title, hover_data=hover_data)
+        fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     
-    # Para pie charts, aplicar formato en hovertemplate
-    if money:
-        from src.ui.formatting import format_bs
-        fig.update_traces(
-            texttemplate='%{label}<br>%{percent}',
-            hovertemplate='<b>%{label}</b><br>%{value:,.2f}<extra></extra>',
-        )
+        # Para pie charts, aplicar formato en hovertemplate
+        if money:
+            from src.ui.formatting import format_bs
+            fig.update_traces(
+                texttemplate='%{label}<br>%{percent}',
+                hovertemplate='<b>%{label}</b><br>%{value:,.2f}<extra></extra>',
+            )
 
-    return fig
+        return fig
+
+    return _cached_figure(
+        "pie",
+        df,
+        dict(
+            names=names,
+            values=values,
+            title=title,
+            money=money,
+            money_decimals=money_decimals,
+            hover_data=hover_data,
+        ),
+        build,
+    )
 
 
+@timed("plotly")
 def area_chart(
     df: pd.DataFrame,
     x: str,
@@ -162,15 +261,91 @@ def area_chart(
         money_decimals: Decimales para formato dinero
         hover_data: Dict con columnas adicionales para tooltip
     """
-    fig = px.area(df, x=x, y=y, title=title, hover_data=hover_data)
-    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    def build():
+        fig = px.area(df, x=x, y=y, title=title, hover_data=hover_data)
+        fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+
+        if money:
+            apply_plotly_bs(fig, axis="y", decimals=int(money_decimals))
+
+        return fig
 
-    if money:
-        apply_plotly_bs(fig, axis="y", decimals=int(money_decimals))
+    return _cached_figure(
+        "area",
+        df,
+        dict(
+            x=x,
+            y=y,
+            title=title,
+            money=money,
+            money_decimals=money_decimals,
+            hover_data=hover_data,
+        ),
+        build,
+    )
 
+
+def waterfall_chart(spans: pd.DataFrame):
+    """Cascada de un rerun: una barra por tramo (`profile_frame`), desde su inicio.
+
+    Sin cache de figura: cada rerun tiene tiempos distintos.
+    """
+
+    df = spans.assign(fin_ms=spans["inicio_ms"] + spans["dur_ms"])
+    fig = px.bar(
+        df,
+        x="dur_ms",
+        y="seccion",
+        base="inicio_ms",
+        orientation="h",
+        hover_data={"inicio_ms": True, "fin_ms": True, "consultas": True, "db_ms": True, "plotly_ms": True, "formatters_ms": True},
+        labels={"dur_ms": "ms", "seccion": ""},
+    )
+    fig.update_yaxes(autorange="reversed", categoryorder="array", categoryarray=list(dict.fromkeys(df["seccion"])))
+    fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=max(180, 26 * df["seccion"].nunique() + 60), showlegend=False)
     return fig
 
 
+def section_retry_key(title: str) -> str:
+    return f"reintentar_{title.lower().replace(' ', '_')}"
+
+
+def load_section(
+    title: str,
+    data_fn: Callable[[], Any],
+    *,
+    deadline_ms: float | None,
+    realtime: bool = False,
+) -> Any:
+    """`run_with_deadline` con el plazo de la sección (el doble si se pulsó "Reintentar").
+
+    En tiempo real no se guardan resultados tardíos: "Reintentar" vuelve a consultar en vez
+    de mostrar datos de hasta `LATE_TTL_SECONDS` atrás.
+    """
+
+    deadline = section_deadline_ms(title, deadline_ms)
+    if deadline and st.session_state.get(section_retry_key(title)):
+        deadline *= RETRY_FACTOR
+    key = None if realtime else call_key(title, data_fn)
+    return run_with_deadline(title, data_fn, deadline_ms=deadline, key=key)
+
+
+def render_section_timeout(title: str, exc: SectionTimeout) -> None:
+    """Aviso "tardó demasiado — reintentar" con su botón (la página sigue con el resto)."""
+
+    st.warning(f"⏱️ {title}: tardó demasiado (más de {exc.deadline_ms / 1000:g} s) — reintentar.")
+    if exc.background:
+        st.caption(
+            "La consulta sigue en segundo plano un rato más: si termina, “Reintentar” la muestra "
+            "sin volver a consultar. Las demás secciones se cargaron igual."
+        )
+    st.button(
+        "Reintentar",
+        key=section_retry_key(title),
+        help=f"Vuelve a cargar {title.lower()} con el doble de plazo (reutiliza lo ya cacheado).",
+    )
+
+
 def render_chart_section(
     title: str,
     caption: str,
@@ -183,6 +358,7 @@ def render_chart_section(
     empty_msg: str = "Sin datos para el rango seleccionado.",
     check_realtime_empty: bool = False,
     allow_csv_export: bool = True,
+    deadline_ms: float | None = None,
 ) -> None:
     """Helper para renderizar secciones de gráficos con patrón unificado.
     
@@ -196,38 +372,128 @@ def render_chart_section(
         debug_fn: Función opcional para renderizar debug SQL
         empty_msg: Mensaje cuando no hay datos
         check_realtime_empty: Si True, distingue entre realtime sin datos vs filtro vacío
-        allow_csv_export: Si True, muestra botón de descarga CSV
+        allow_csv_export: Si True, muestra botones de descarga CSV y Parquet (generados al hacer click)
+        deadline_ms: Plazo para `data_fn` (None/0 = sin plazo; override por sección en
+            `DASHBACK_SECTION_DEADLINES`). Si vence, la sección muestra "tardó demasiado —
+            reintentar" y la página sigue (ver `src/deadlines.py`).
+
+    Cada sección es un tramo propio en el perfil del rerun (`enter_section(title)`); al
+    terminar se vuelve a la sección anterior.
     """
-    st.subheader(title)
-    st.caption(caption)
+    previous_section = current_section()
+    enter_section(title)
+    try:
+        st.subheader(title)
+        st.caption(caption)
     
-    if conn is None or startup is None:
-        st.info(f"Conecta a la base de datos para ver {title.lower()}.")
-        return
+        if conn is None or startup is None:
+            st.info(f"Conecta a la base de datos para ver {title.lower()}.")
+            return
     
-    try:
-        df = data_fn()
+        try:
+            df = load_section(title, data_fn, deadline_ms=deadline_ms, realtime=startup.mode == "realtime")
         
-        if df is None or df.empty:
-            if check_realtime_empty and startup.mode == "realtime" and not startup.has_rows:
-                st.info("Aún no se registraron ventas en esta operativa.")
+            if df is None or df.empty:
+                if check_realtime_empty and startup.mode == "realtime" and not startup.has_rows:
+                    st.info("Aún no se registraron ventas en esta operativa.")
+                else:
+                    st.info(empty_msg)
             else:
-                st.info(empty_msg)
-        else:
-            fig = chart_fn(df)
-            st.plotly_chart(fig, width="stretch")
+                with python_time("plotly"):
+                    fig = chart_fn(df)
+                    st.plotly_chart(fig, width="stretch")
             
-            # Botón de exportación CSV
-            if allow_csv_export:
-                csv_data = df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="⬇️ Descargar CSV",
-                    data=csv_data,
-                    file_name=f"{title.lower().replace(' ', '_')}.csv",
-                    mime="text/csv",
-                    key=f"csv_{title.lower().replace(' ', '_')}",
-                )
-    except Exception as exc:
-        st.error(f"Error cargando {title.lower()}: {exc}")
-        if debug_fn:
-            debug_fn(exc)
+                # Exportación CSV / Parquet: se serializa recién al hacer click
+                if allow_csv_export:
+                    render_export_buttons(df, title.lower().replace(' ', '_'))
+        except SectionTimeout as exc:
+            render_section_timeout(title, exc)
+        except Exception as exc:
+            st.error(f"Error cargando {title.lower()}: {exc}")
+            if debug_fn:
+                debug_fn(exc)
+    finally:
+        enter_section(previous_section)
+
+# (columna, etiqueta, es_monto, columna con log de impresión)
+TREND_METRICS: list[tuple[str, str, bool, str | None]] = [
+    ("total_vendido", "Total vendido", True, "total_vendido_impreso_log"),
+    ("total_comandas", "Comandas", False, "total_comandas_impreso_log"),
+    ("items_vendidos", "Ítems vendidos", False, "items_vendidos_impreso_log"),
+    ("ticket_promedio", "Ticket promedio", True, "ticket_promedio_impreso_log"),
+    ("total_cortesia", "Total cortesías", True, None),
+    ("comandas_cortesia", "Comandas cortesía", False, None),
+    ("total_ventas", "Ventas (P&L)", True, None),
+    ("total_cogs", "COGS", True, None),
+    ("total_margen", "Margen bruto", True, None),
+    ("margen_pct", "Margen %", False, None),
+]
+
+
+def trend_table(series: pd.DataFrame, *, use_impresion_log: bool = False) -> pd.DataFrame:
+    """Una fila por métrica: valores por operativa (sparkline) + última/anterior/promedio/mín/máx.
+
+    `series`: una fila por `id_operacion` (ver `get_kpis_por_operacion`), ordenada.
+    """
+
+    rows: list[dict[str, Any]] = []
+    pnl_ok = "pnl_disponible" not in series or bool(series["pnl_disponible"].all())
+    for col, label, money, log_col in TREND_METRICS:
+        source = log_col if use_impresion_log and log_col else col
+        if source not in series or (col in ("total_ventas", "total_cogs", "total_margen", "margen_pct") and not pnl_ok):
+            continue
+        values = pd.to_numeric(series[source], errors="coerce").fillna(0.0)
+        decimals = 2 if money or col.endswith("_pct") else 0
+
+        def fmt(value: float) -> str:
+            return format_bs(value) if money else format_number(value, decimals=decimals)
+
+        rows.append(
+            {
+                "Métrica": label,
+                "Tendencia": values.round(2).tolist(),
+                "Última": fmt(values.iloc[-1]),
+                "Anterior": fmt(values.iloc[-2]) if len(values) > 1 else "",
+                "Promedio": fmt(values.mean()),
+                "Mín": fmt(values.min()),
+                "Máx": fmt(values.max()),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def metric_trend(series: pd.DataFrame | None, column: str, *, money: bool = False) -> dict[str, Any]:
+    """Argumentos extra para `st.metric`: sparkline (`chart_data`) y delta vs la operativa anterior.
+
+    `series`: una fila por `id_operacion` (ver `get_kpis_recientes`), la última es la del
+    contexto. Sin serie (o sin la columna) devuelve `{}` y la métrica se muestra como antes.
+    """
+
+    if series is None or series.empty or column not in series:
+        return {}
+    values = pd.to_numeric(series[column], errors="coerce").fillna(0.0)
+    out: dict[str, Any] = {"chart_data": values.round(2).tolist(), "chart_type": "line"}
+    if len(values) > 1:
+        diff = float(values.iloc[-1] - values.iloc[-2])
+        prev_id = int(series["id_operacion"].iloc[-2])
+        text = format_bs(diff) if money else format_number(diff, decimals=0)
+        out["delta"] = f"{text} vs #{prev_id}"
+    return out
+
+
+def render_trend_table(series: pd.DataFrame, *, use_impresion_log: bool = False) -> None:
+    """Muestra `trend_table` con la columna `Tendencia` como sparkline."""
+
+    first, last = int(series["id_operacion"].iloc[0]), int(series["id_operacion"].iloc[-1])
+    st.dataframe(
+        trend_table(series, use_impresion_log=use_impresion_log),
+        width="stretch",
+        hide_index=True,
+        column_config={
+            "Tendencia": st.column_config.LineChartColumn(
+                f"Tendencia (#{first} → #{last})",
+                help="Valor por operativa, de la más antigua a la más reciente.",
+                width="medium",
+            ),
+        },
+    )
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+"""Exportación diferida (CSV / Parquet) de los DataFrames de cada gráfico.
+
+`st.download_button` acepta un callable en `data`: Streamlit lo ejecuta recién cuando
+el usuario hace click (en otro hilo), así los reruns no serializan nada. El resultado
+se memoriza por hash de contenido del DataFrame: dos clicks sobre los mismos datos (o
+el mismo gráfico en otra sesión) reutilizan los bytes ya generados.
+"""
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import pandas as pd
+import streamlit as st
+
+
+EXPORT_CACHE_MAX_ENTRIES = 32
+
+EXPORT_FORMATS = {
+    "csv": ("⬇️ Descargar CSV", "text/csv"),
+    "parquet": ("⬇️ Descargar Parquet", "application/vnd.apache.parquet"),
+}
+
+# (hash de contenido, formato) -> bytes; LRU compartido entre sesiones.
+_EXPORT_CACHE: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash del contenido (valores + nombres y tipos de columnas), sin el índice."""
+
+    digest = hashlib.sha1()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, engine="pyarrow")
+    return buffer.getvalue()
+
+
+_SERIALIZERS: dict[str, Callable[[pd.DataFrame], bytes]] = {
+    "csv": csv_bytes,
+    "parquet": parquet_bytes,
+}
+
+
+def export_bytes(df: pd.DataFrame, fmt: str) -> bytes:
+    """Serializa `df` en `fmt` reutilizando el resultado si el contenido no cambió."""
+
+    serializer = _SERIALIZERS[fmt]
+    key = (frame_fingerprint(df), fmt)
+    with _LOCK:
+        cached = _EXPORT_CACHE.get(key)
+        if cached is not None:
+            _EXPORT_CACHE.move_to_end(key)
+            return cached
+
+    data = serializer(df)
+    with _LOCK:
+        _EXPORT_CACHE[key] = data
+        _EXPORT_CACHE.move_to_end(key)
+        while len(_EXPORT_CACHE) > EXPORT_CACHE_MAX_ENTRIES:
+            _EXPORT_CACHE.popitem(last=False)
+    return data
+
+
+def lazy_export(df: pd.DataFrame, fmt: str) -> Callable[[], bytes]:
+    """Callable sin argumentos para `st.download_button(data=...)`."""
+
+    if fmt not in _SERIALIZERS:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+    return lambda: export_bytes(df, fmt)
+
+
+def render_export_buttons(
+    df: pd.DataFrame,
+    base_name: str,
+    *,
+    formats: tuple[str, ...] = ("csv", "parquet"),
+) -> None:
+    """Botones de descarga lado a lado; los bytes se generan solo al hacer click.
+
+    `on_click="ignore"`: descargar no dispara un rerun del dashboard completo.
+    """
+
+    cols = st.columns(len(formats))
+    for col, fmt in zip(cols, formats):
+        label, mime = EXPORT_FORMATS[fmt]
+        with col:
+            st.download_button(
+                label=label,
+                data=lazy_export(df, fmt),
+                file_name=f"{base_name}.{fmt}",
+                mime=mime,
+                key=f"{fmt}_{base_name}",
+                on_click="ignore",
+            )
+
+
+def clear_export_cache() -> None:
+    with _LOCK:
+        _EXPORT_CACHE.clear()
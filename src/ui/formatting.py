@@ -1,10 +1,14 @@
 from __future__ import annotations
 
 import math
+from functools import lru_cache
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
+from src.perf import timed
+
 
 def _to_finite_float(value: Any) -> float:
     if value is None:
@@ -57,6 +61,108 @@ def format_int(value: Any) -> str:
     return f"{sign}{n:,}".replace(",", ".")
 
 
+# --- Formato vectorizado (tablas) ---
+
+# Por encima de este valor escalado (monto * 10**decimales) el producto en float64 ya
+# no garantiza el redondeo exacto: esos valores se formatean con la versión escalar.
+_VECTOR_SCALED_MAX = 1e12
+# Valores escalados a menos de esta distancia de un empate (x,xx5) se delegan a la
+# versión escalar, que redondea sobre el valor binario exacto como `format()`.
+_VECTOR_TIE_MARGIN = 1e-3
+
+
+def _coerce_float_array(values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Convierte a float64 + máscara de posiciones que requieren la versión escalar.
+
+    Coincide con `_to_finite_float`: None/NaN/inf/no numérico -> 0.0.
+    """
+
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iufb":
+        x = arr.astype(np.float64)
+        scalar_only = np.zeros(x.shape, dtype=bool)
+    else:
+        x = pd.to_numeric(pd.Series(arr.ravel(), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        # Textos que `float()` acepta pero `to_numeric` no (p.ej. '1_000'): vía escalar.
+        scalar_only = np.isnan(x) & ~pd.isna(pd.Series(arr.ravel(), dtype=object)).to_numpy()
+    x = np.where(np.isfinite(x), x, 0.0)
+    return x, scalar_only
+
+
+@lru_cache(maxsize=8)
+def _digit_table(width: int, padded: bool) -> np.ndarray:
+    """Tabla 0..10**width-1 -> texto (con o sin ceros a la izquierda).
+
+    Indexar una tabla precalculada es mucho más rápido que convertir enteros a texto.
+    """
+
+    return np.array([f"{i:0{width}d}" if padded else str(i) for i in range(10**width)])
+
+
+def _group_thousands(int_part: np.ndarray) -> np.ndarray:
+    """Parte entera (>= 0) con punto como separador de miles: 1234567 -> '1.234.567'."""
+
+    raw, padded = _digit_table(3, False), _digit_table(3, True)
+    rest = int_part
+    group = rest % 1000
+    text = np.where(rest >= 1000, padded[group], raw[group])
+    rest = rest // 1000
+    while (rest > 0).any():
+        group = rest % 1000
+        piece = np.where(rest >= 1000, padded[group], raw[group])
+        text = np.where(rest > 0, np.strings.add(np.strings.add(piece, "."), text), text)
+        rest = rest // 1000
+    return text
+
+
+def _format_es_array(values: Any, *, decimals: int, prefix: str, scalar_fn) -> np.ndarray:
+    """Versión vectorizada de `{signo}{prefix}{1.100,33}` (salida idéntica a `scalar_fn`)."""
+
+    raw = np.asarray(values).ravel()
+    if raw.size == 0:
+        return np.asarray([], dtype=object)
+
+    decimals = int(decimals)
+    x, scalar_only = _coerce_float_array(raw)
+    ax = np.abs(x)
+
+    scale = 10**decimals
+    scaled = ax * scale
+    frac_part = scaled - np.floor(scaled)
+    scalar_only |= (scaled >= _VECTOR_SCALED_MAX) | (np.abs(frac_part - 0.5) < _VECTOR_TIE_MARGIN)
+
+    units = np.rint(np.where(scalar_only, 0.0, scaled)).astype(np.int64)
+    text = _group_thousands(units // scale)
+    if decimals > 0:
+        if decimals <= 4:
+            frac = _digit_table(decimals, True)[units % scale]
+        else:
+            frac = np.strings.zfill((units % scale).astype(str), decimals)
+        text = np.strings.add(np.strings.add(text, ","), frac)
+
+    head = np.where(x < 0, f"-{prefix}", prefix)
+    out = np.strings.add(head, text).astype(object)
+
+    if scalar_only.any():
+        for i in np.flatnonzero(scalar_only):
+            out[i] = scalar_fn(raw[i], decimals=decimals)
+    return out
+
+
+@timed("formatters")
+def format_bs_array(values: Any, *, decimals: int = 2) -> np.ndarray:
+    """`format_bs` sobre un array/Series completo (mismo texto, sin loop por fila)."""
+
+    return _format_es_array(values, decimals=decimals, prefix="Bs ", scalar_fn=format_bs)
+
+
+@timed("formatters")
+def format_number_array(values: Any, *, decimals: int = 2) -> np.ndarray:
+    """`format_number` sobre un array/Series completo (mismo texto, sin loop por fila)."""
+
+    return _format_es_array(values, decimals=decimals, prefix="", scalar_fn=format_number)
+
+
 # --- Plotly helpers (formato Bolivia) ---
 
 # Plotly/D3 usan `layout.separators` con (decimal, miles). Para Bolivia:
@@ -77,6 +183,7 @@ def apply_plotly_bs(fig: Any, *, axis: str = "y", decimals: int = 2) -> None:
         pass
 
 
+@timed("formatters")
 def format_df_money_columns(df: pd.DataFrame, money_columns: list[str], *, decimals: int = 2) -> pd.DataFrame:
     """Devuelve una copia del DataFrame con columnas monetarias formateadas como string.
 
@@ -84,7 +191,8 @@ def format_df_money_columns(df: pd.DataFrame, money_columns: list[str], *, decim
     Convirtiendo a string aseguramos consistencia: `Bs 1.100,33`.
 
     Nota: al convertir a string, el ordenamiento por columna pasa a ser lexicográfico.
-    Para la tabla de "Detalle" (inspección) es un trade-off aceptable.
+    Para mostrar tablas en la UI usar `style_numeric_columns` / `style_*_df` (formato en
+    render, datos numéricos).
     """
 
     if df is None or df.empty:
@@ -93,7 +201,7 @@ def format_df_money_columns(df: pd.DataFrame, money_columns: list[str], *, decim
     out = df.copy()
     for col in money_columns:
         if col in out.columns:
-            out[col] = out[col].apply(lambda v: format_bs(v, decimals=decimals))
+            out[col] = format_bs_array(out[col].to_numpy(), decimals=decimals)
     return out
 
 
@@ -130,15 +238,15 @@ def format_consumo_valorizado_df(df: pd.DataFrame) -> pd.DataFrame:
     
     # Cantidades con 4 decimales
     if "cantidad_consumida_base" in out.columns:
-        out["cantidad_consumida_base"] = out["cantidad_consumida_base"].apply(
-            lambda v: format_number(v, decimals=4)
+        out["cantidad_consumida_base"] = format_number_array(
+            out["cantidad_consumida_base"].to_numpy(), decimals=4
         )
     
     # Monetarios con 2 decimales
     money_cols = ["wac_operativa", "costo_consumo"]
     for col in money_cols:
         if col in out.columns:
-            out[col] = out[col].apply(lambda v: format_bs(v, decimals=2))
+            out[col] = format_bs_array(out[col].to_numpy(), decimals=2)
     
     # Reordenar columnas para visibilidad (nombre primero, luego métricas)
     cols_order = [
@@ -166,8 +274,8 @@ def format_consumo_sin_valorar_df(df: pd.DataFrame) -> pd.DataFrame:
     
     # Solo cantidades con 4 decimales (sin montos)
     if "cantidad_consumida_base" in out.columns:
-        out["cantidad_consumida_base"] = out["cantidad_consumida_base"].apply(
-            lambda v: format_number(v, decimals=4)
+        out["cantidad_consumida_base"] = format_number_array(
+            out["cantidad_consumida_base"].to_numpy(), decimals=4
         )
     
     # Reordenar columnas para visibilidad (nombre primero, luego métricas)
@@ -211,3 +319,142 @@ def format_cogs_comanda_df(df: pd.DataFrame) -> pd.DataFrame:
         fig.update_traces(hovertemplate=f"Bs %{{{var}:{tickformat}}}<extra></extra>")
     except Exception:
         pass
+
+
+# --- Formato en render (Styler): el DataFrame sigue numérico ---
+
+# Pandas Styler genera un valor de display por celda: por encima de este tamaño se
+# muestra la tabla numérica sin formato (sigue ordenando bien, sin copias).
+STYLER_MAX_CELLS = 100_000
+
+CONSUMO_VALORIZADO_COLUMN_ORDER = [
+    "id_operacion",
+    "nombre_producto",
+    "id_producto",
+    "cantidad_consumida_base",
+    "wac_operativa",
+    "costo_consumo",
+]
+CONSUMO_SIN_VALORAR_COLUMN_ORDER = [
+    "id_operacion",
+    "nombre_producto",
+    "id_producto",
+    "cantidad_consumida_base",
+]
+
+
+def _cell_formatter(values: Any, *, decimals: int, money: bool):
+    """Formatter por celda para Styler con etiquetas precalculadas (vectorizado).
+
+    Se formatea una sola vez cada valor distinto de la columna; el Styler solo busca
+    la etiqueta. Valores no encontrados (NaN, tipos raros) usan la versión escalar.
+    """
+
+    scalar_fn = format_bs if money else format_number
+    array_fn = format_bs_array if money else format_number_array
+    uniques = pd.unique(pd.Series(values))
+    labels: dict[Any, str] = {}
+    for value, label in zip(uniques, array_fn(uniques, decimals=decimals)):
+        try:
+            labels[value] = label
+        except TypeError:
+            continue
+
+    def _fmt(value: Any) -> str:
+        try:
+            return labels[value]
+        except (KeyError, TypeError):
+            return scalar_fn(value, decimals=decimals)
+
+    return _fmt
+
+
+def _plain_cell(value: Any) -> str:
+    # Evita el default de Styler (6 decimales) en columnas numéricas sin formato propio.
+    return "" if value is None or (isinstance(value, float) and math.isnan(value)) else str(value)
+
+
+def style_numeric_columns(
+    df: pd.DataFrame,
+    *,
+    money_columns: dict[str, int] | None = None,
+    number_columns: dict[str, int] | None = None,
+) -> Any:
+    """Devuelve un `Styler` que muestra `Bs 1.100,33` / `1.100,3300` sin tocar los datos.
+
+    - El DataFrame no se copia ni se convierte a texto: `st.dataframe` ordena por el valor
+      numérico y el formato es solo de visualización.
+    - `money_columns` / `number_columns`: columna -> decimales.
+    - Tablas vacías o más grandes que `STYLER_MAX_CELLS`: se devuelven tal cual.
+    - Sin `@timed`: acá solo se arma el `Styler`; el formato por celda corre después, dentro
+      de `st.dataframe`, y queda en el tiempo de la sección.
+    """
+
+    if df is None or df.empty or df.size > STYLER_MAX_CELLS:
+        return df
+
+    formatters: dict[str, Any] = {}
+    for columns, money in ((money_columns or {}, True), (number_columns or {}, False)):
+        for col, decimals in columns.items():
+            if col in df.columns:
+                formatters[col] = _cell_formatter(df[col].to_numpy(), decimals=decimals, money=money)
+
+    for col in df.columns:
+        if col not in formatters and pd.api.types.is_float_dtype(df[col].dtype):
+            formatters[col] = _plain_cell
+
+    return df.style.format(formatter=formatters)
+
+
+def column_order_for(df: pd.DataFrame, preferred: list[str]) -> list[str] | None:
+    """Orden de columnas para `st.dataframe(column_order=...)` (preferidas primero, sin copiar)."""
+
+    if df is None:
+        return None
+    present = [c for c in preferred if c in df.columns]
+    return present + [c for c in df.columns if c not in present]
+
+
+def style_detalle_df(df: pd.DataFrame) -> Any:
+    """Detalle de comandas: montos en Bs, datos numéricos."""
+
+    return style_numeric_columns(df, money_columns={"precio_venta": 2, "sub_total": 2})
+
+
+def style_margen_comanda_df(df: pd.DataFrame) -> Any:
+    """Margen por comanda: montos en Bs, datos numéricos."""
+
+    return style_numeric_columns(
+        df, money_columns={"total_venta": 2, "cogs_comanda": 2, "margen_comanda": 2}
+    )
+
+
+def style_consumo_valorizado_df(df: pd.DataFrame) -> Any:
+    """Consumo valorizado: cantidades con 4 decimales y montos en Bs."""
+
+    return style_numeric_columns(
+        df,
+        money_columns={"wac_operativa": 2, "costo_consumo": 2},
+        number_columns={"cantidad_consumida_base": 4},
+    )
+
+
+def style_consumo_sin_valorar_df(df: pd.DataFrame) -> Any:
+    """Consumo sin valorar: cantidades con 4 decimales."""
+
+    return style_numeric_columns(df, number_columns={"cantidad_consumida_base": 4})
+
+
+def style_cogs_comanda_df(df: pd.DataFrame) -> Any:
+    """COGS por comanda: monto en Bs, datos numéricos."""
+
+    return style_numeric_columns(df, money_columns={"cogs_comanda": 2})
+
+
+def style_basket_df(df: pd.DataFrame) -> Any:
+    """Pares de canasta: porcentajes y lift con 2 decimales, datos numéricos."""
+
+    return style_numeric_columns(
+        df,
+        number_columns={"soporte_pct": 2, "confianza_a_b_pct": 2, "confianza_b_a_pct": 2, "lift": 2},
+    )